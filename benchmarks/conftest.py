@@ -0,0 +1,147 @@
+"""
+Benchmarks of the publish pipeline, run with pytest-benchmark on synthetic data (see
+synthetic.py). Every benchmark runs at each of the sizes given with --sizes, the total
+number of rows of a node.
+"""
+import json
+from typing import Dict, List
+
+import pytest
+
+from molgenis.bbmri_eric.bbmri_client import EricSession
+from molgenis.bbmri_eric.model import (
+    Node,
+    NodeData,
+    QualityInfo,
+    Source,
+    Table,
+    TableMeta,
+)
+from molgenis.bbmri_eric.synthetic import Generator, Spec
+
+SIZES = "1000,10000,100000,1000000"
+
+NL = Node("NL", "Netherlands")
+EU = Node("EU", "Europe")
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--sizes",
+        default=SIZES,
+        help=f"comma-separated numbers of rows to run the benchmarks at ({SIZES})",
+    )
+
+
+def pytest_generate_tests(metafunc):
+    if "size" in metafunc.fixturenames:
+        sizes = [int(size) for size in metafunc.config.getoption("sizes").split(",")]
+        metafunc.parametrize("size", sizes, scope="session")
+
+
+@pytest.fixture(scope="session")
+def generator(size: int) -> Generator:
+    return Generator(Spec.of_rows(size))
+
+
+@pytest.fixture(scope="session")
+def eu_node_data(generator: Generator) -> NodeData:
+    """The data of node EU is shared and never changed, so it's generated once."""
+    return generator.node_data(EU)
+
+
+@pytest.fixture
+def rounds(size: int) -> int:
+    """Large sizes are run once, because generating their input takes long."""
+    return max(1, min(5, 100_000 // size))
+
+
+def to_client_format(table: Table) -> List[dict]:
+    """Returns the rows of a table as the REST client returns them."""
+    references = table.meta.schema.ref_entity_types
+    single_references = table.meta.schema.single_references
+    rows = list()
+    for row in table.rows:
+        client_row = {"_href": f"/api/v2/{table.full_name}/{row['id']}", "_meta": {}}
+        for name, value in row.items():
+            if name in single_references:
+                value = {"id": value, "_href": f"/api/v2/{references[name]}/{value}"}
+            elif name in references:
+                value = [
+                    {"id": id_, "_href": f"/api/v2/{references[name]}/{id_}"}
+                    for id_ in value
+                ]
+            client_row[name] = value
+        rows.append(client_row)
+    return rows
+
+
+class BenchmarkSession(EricSession):
+    """
+    A session that serves generated data and doesn't send requests. The rows that
+    would be sent are still encoded, like they would be in a request.
+    """
+
+    def __init__(
+        self,
+        staging: Dict[str, NodeData],
+        published: Dict[str, NodeData],
+        quality_info: QualityInfo,
+    ):
+        super(BenchmarkSession, self).__init__(url="https://benchmark.example.org")
+        self.staging = staging
+        self.published = published
+        self.quality_info = quality_info
+        self.meta: Dict[str, TableMeta] = {
+            table.full_name: table.meta
+            for node_data in published.values()
+            for table in node_data.import_order
+        }
+
+    def get_node(self, code: str) -> Node:
+        return self.staging[code].node
+
+    def get_staging_node_data(self, node: Node) -> NodeData:
+        return self.staging[node.code]
+
+    def get_published_node_data(self, node: Node) -> NodeData:
+        return self.published[node.code]
+
+    def get_quality_info(self, biobank_ids=None, collection_ids=None) -> QualityInfo:
+        return self.quality_info
+
+    def get_meta(self, entity_type_id: str) -> TableMeta:
+        return self.meta[entity_type_id]
+
+    def get(self, entity, *args, **kwargs) -> List[dict]:
+        """Returns the ids of the published rows of all nodes."""
+        return [
+            {"id": id_}
+            for node_data in self.published.values()
+            for table in node_data.import_order
+            if table.full_name == entity
+            for id_ in table.rows_by_id
+        ]
+
+    def add_all(self, entity, entities):
+        json.dumps({"entities": entities}, default=dict)
+
+    def update(self, entity_type_id: str, entities: List[dict]):
+        json.dumps({"entities": entities}, default=dict)
+
+    def delete_list(self, entity, entities):
+        json.dumps({"entityIds": entities})
+
+
+def benchmark_session(
+    generator: Generator, eu_node_data: NodeData, *nodes: Node
+) -> BenchmarkSession:
+    """Creates a session with freshly generated data of node EU and other nodes."""
+    staging = {EU.code: eu_node_data}
+    published = {EU.code: generator.node_data(EU, Source.PUBLISHED)}
+    for node in nodes:
+        staging[node.code] = generator.node_data(node)
+        published[node.code] = generator.node_data(node, Source.PUBLISHED)
+    return BenchmarkSession(
+        staging, published, generator.quality_info(*staging.values())
+    )
@@ -0,0 +1,409 @@
+"""
+A load test of a full directory run: the external nodes are staged and then all nodes
+are published, against local stand-ins of the directory, the external servers of the
+nodes and the handle server (see stand_in.py). The data of the nodes is synthetic (see
+synthetic.py): a few large nodes and many small ones. The published data of a
+previous run has more biobanks and collections, so rows are updated and deleted.
+
+The directory and the external servers run in a separate process, so that the time,
+CPU time and memory that are measured are those of staging and publishing only.
+
+    python -m benchmarks.load_test --nodes 25 --external 6 --rows 2000 --workers 4
+
+Reports the wall-clock and CPU time, the peak memory, the requests and bytes of every
+server and the phase durations and requests of every node. Use --output to write the
+report to a JSON file, to compare runs.
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import random
+import resource
+import sys
+import time
+from collections import defaultdict
+from contextlib import redirect_stdout
+from dataclasses import asdict, dataclass, replace
+from typing import Dict, List, Tuple
+
+from molgenis.bbmri_eric.bbmri_client import EricSession
+from molgenis.bbmri_eric.eric import Eric
+from molgenis.bbmri_eric.errors import ErrorReport
+from molgenis.bbmri_eric.instrumentation import RequestStats
+from molgenis.bbmri_eric.memory import MemoryTracker
+from molgenis.bbmri_eric.metrics import Metrics
+from molgenis.bbmri_eric.model import ExternalServerNode, Node, Source, TableType
+from molgenis.bbmri_eric.stand_in import StandInPidService, StandInServer
+from molgenis.bbmri_eric.synthetic import Generator, Spec, directory_tables
+
+COUNTRIES = {
+    "AT": "Austria",
+    "BE": "Belgium",
+    "BG": "Bulgaria",
+    "CH": "Switzerland",
+    "CY": "Cyprus",
+    "CZ": "Czech Republic",
+    "DE": "Germany",
+    "EE": "Estonia",
+    "ES": "Spain",
+    "FI": "Finland",
+    "FR": "France",
+    "GR": "Greece",
+    "HU": "Hungary",
+    "IE": "Ireland",
+    "IT": "Italy",
+    "LT": "Lithuania",
+    "LV": "Latvia",
+    "MT": "Malta",
+    "NL": "Netherlands",
+    "NO": "Norway",
+    "PL": "Poland",
+    "PT": "Portugal",
+    "SE": "Sweden",
+    "SI": "Slovenia",
+    "SK": "Slovakia",
+    "TR": "Turkey",
+    "UK": "United Kingdom",
+}
+
+PID_BASE_URL = "https://directory.example.org/"
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """
+    Describes the directory of a load test.
+    """
+
+    nodes: int = 25
+    """The number of nodes, including node EU"""
+
+    external_nodes: int = 6
+    """The number of nodes with an external server"""
+
+    rows: int = 2000
+    """The median number of rows of a node"""
+
+    workers: int = 1
+    """The number of nodes that are published at the same time"""
+
+    stage_workers: int = 1
+    """The number of nodes that are staged at the same time"""
+
+    latency: float = 0.0
+    """The number of seconds every request to the directory takes"""
+
+    external_latency: float = 0.0
+    """The number of seconds every request to an external server takes"""
+
+    row_latency: float = 0.0
+    """The number of seconds that is added to a request per row, on all servers"""
+
+    pid_latency: float = 0.0
+    """The number of seconds every operation on the handle server takes"""
+
+    seed: int = 0
+
+    def topology(self) -> List[Tuple[str, str, int, bool]]:
+        """
+        Returns the code, description, number of rows and whether it has an external
+        server of every node. Node EU comes first and is as large as the largest
+        node, so it has the EU rows that the other nodes refer to.
+        """
+        if not 1 < self.nodes <= len(COUNTRIES) + 1:
+            raise ValueError(f"The number of nodes should be 2 to {len(COUNTRIES) + 1}")
+        if self.external_nodes >= self.nodes:
+            raise ValueError("Node EU can't have an external server")
+
+        rng = random.Random(self.seed)
+        codes = sorted(rng.sample(sorted(COUNTRIES), self.nodes - 1))
+        external = set(rng.sample(codes, self.external_nodes))
+        sizes = [
+            min(5 * self.rows, max(50, int(self.rows * rng.lognormvariate(0, 0.75))))
+            for _ in codes
+        ]
+
+        topology = [("EU", "Europe", max(sizes), False)]
+        for code, size in zip(codes, sizes):
+            topology.append((code, COUNTRIES[code], size, code in external))
+        return topology
+
+
+def run(scenario: Scenario, verbose: bool = False, memory: bool = False) -> dict:
+    """
+    Runs a load test and returns its report.
+
+    :param Scenario scenario: the directory to stage and publish
+    :param bool verbose: if True, the output of staging and publishing is printed
+    :param bool memory: if True, the memory of every phase is traced with
+                        tracemalloc, which makes the run slower
+    """
+    context = multiprocessing.get_context("spawn")
+    connection, server_connection = context.Pipe()
+    process = context.Process(target=_serve, args=(scenario, server_connection))
+    process.start()
+    # the connection is closed if the server process fails while it's setting up
+    server_connection.close()
+    url, handles = connection.recv()
+    try:
+        report = _run(scenario, url, handles, verbose, memory)
+    finally:
+        connection.send("stop")
+        servers = connection.recv()
+        process.join()
+
+    report["servers"] = servers
+    return report
+
+
+def _run(
+    scenario: Scenario,
+    url: str,
+    handles: List[Tuple[str, str, str]],
+    verbose: bool,
+    memory: bool,
+) -> dict:
+    session = EricSession(url=url)
+    requests = RequestStats()
+    session.instrument(requests.record)
+    pid_service = StandInPidService(latency=scenario.pid_latency, base_url=PID_BASE_URL)
+    for pid, pid_url, name in handles:
+        pid_service.add_handle(pid, pid_url, name)
+
+    eric = Eric(session, pid_service)
+    eric.metrics = Metrics(
+        requests=requests, memory=MemoryTracker() if memory else None
+    )
+    external_nodes = session.get_external_nodes()
+    # the external nodes are staged first, so they are published as regular nodes
+    nodes = [Node(node.code, node.description) for node in session.get_nodes()]
+    requests.clear()
+
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    with redirect_stdout(sys.stdout if verbose else io.StringIO()):
+        staging_report = eric.stage_external_nodes(
+            external_nodes, workers=scenario.stage_workers
+        )
+        staged = time.perf_counter()
+        publishing_report = eric.publish_nodes(nodes, workers=scenario.workers)
+    finished = time.perf_counter()
+    cpu_time = time.process_time() - cpu_started
+    if memory:
+        eric.metrics.memory.stop()
+
+    metrics = eric.metrics.to_dict()
+    request_nodes = metrics["requests"]["nodes"]
+    return {
+        "scenario": asdict(scenario),
+        "wall_clock": {
+            "stage": staged - started,
+            "publish": finished - staged,
+            "total": finished - started,
+        },
+        "cpu_time": cpu_time,
+        "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "requests": metrics["requests"]["run"],
+        "pid_operations": pid_service.operation_count,
+        "errors": {
+            node.code: str(error)
+            for report in (staging_report, publishing_report)
+            for node, error in report.errors.items()
+        },
+        "warnings": _count_warnings(staging_report, publishing_report),
+        "nodes": {
+            node: {
+                "duration": sum(values["phases"].values()),
+                "phases": values["phases"],
+                "counters": values["counters"],
+                "requests": request_nodes.get(node, {}).get("requests", 0),
+            }
+            for node, values in metrics["nodes"].items()
+            if values["phases"]
+        },
+        "memory": metrics.get("memory"),
+    }
+
+
+def _count_warnings(*reports: ErrorReport) -> Dict[str, int]:
+    counts = defaultdict(int)
+    for report in reports:
+        for node, warnings in report.warnings.items():
+            counts[node.code] += len(warnings)
+    return dict(counts)
+
+
+def _serve(scenario: Scenario, connection):
+    """
+    Generates the data of the scenario and serves it until the load test is done.
+    Runs in the server process.
+    """
+    directory = StandInServer(
+        latency=scenario.latency, row_latency=scenario.row_latency
+    )
+    external_servers: Dict[str, StandInServer] = dict()
+    nodes = list()
+    published = defaultdict(list)
+    published_meta = dict()
+    quality_info = None
+    handles = list()
+
+    for code, description, rows, external in scenario.topology():
+        # sort_self_references only orders the collections of two levels correctly,
+        # and the collections of an external server are staged sorted by their id
+        generator = Generator(
+            Spec.of_rows(rows, seed=scenario.seed, collection_depth=2)
+        )
+        node = Node(code, description)
+        staging_data = generator.node_data(node)
+        if external:
+            server = StandInServer(
+                latency=scenario.external_latency, row_latency=scenario.row_latency
+            )
+            server.add_node_data(generator.node_data(node, Source.EXTERNAL_SERVER))
+            external_servers[code] = server
+            node = ExternalServerNode(code, description, url=server.url)
+            for table in staging_data.import_order:
+                directory.add_table(table.meta)
+        else:
+            directory.add_node_data(staging_data)
+        nodes.append(node)
+
+        node_quality_info = generator.quality_info(staging_data)
+        if quality_info is None:
+            quality_info = node_quality_info
+        else:
+            quality_info.biobanks.update(node_quality_info.biobanks)
+            quality_info.collections.update(node_quality_info.collections)
+
+        # the data of the previous run: more biobanks and collections, other values
+        spec = generator.spec
+        previous = Generator(
+            replace(
+                spec,
+                biobanks=int(spec.biobanks * 1.1),
+                collections=int(spec.collections * 1.1),
+                seed=scenario.seed + 1,
+            )
+        )
+        published_data = previous.node_data(node, Source.PUBLISHED)
+        for table in published_data.import_order:
+            published_meta[table.type] = table.meta
+            eu_prefix = Node.get_eu_id_prefix(table.type)
+            published[table.type].extend(
+                row
+                for row in table.rows
+                if code == "EU" or not row["id"].startswith(eu_prefix)
+            )
+        for biobank in published_data.biobanks.rows:
+            url = f"{PID_BASE_URL}#/biobank/{biobank['id']}"
+            handles.append((biobank["pid"], url, biobank["name"]))
+
+    for table_type in TableType.get_import_order():
+        directory.add_table(published_meta[table_type], published[table_type])
+    for meta, rows in directory_tables(nodes, quality_info):
+        directory.add_table(meta, rows)
+
+    servers = {"directory": directory, **external_servers}
+    for server in servers.values():
+        server.start()
+    connection.send((directory.url, handles))
+
+    connection.recv()
+    for server in servers.values():
+        server.stop()
+    connection.send(
+        {
+            name: {
+                "requests": server.request_count,
+                "request_bytes": server.request_bytes,
+                "response_bytes": server.response_bytes,
+            }
+            for name, server in servers.items()
+        }
+    )
+
+
+def print_report(report: dict):
+    wall_clock = report["wall_clock"]
+    requests = report["requests"]
+    print(
+        f"Wall-clock time: {wall_clock['total']:.1f}s (staging "
+        f"{wall_clock['stage']:.1f}s, publishing {wall_clock['publish']:.1f}s)"
+    )
+    print(f"CPU time: {report['cpu_time']:.1f}s")
+    print(f"Peak memory (RSS): {report['peak_rss'] / 1024 / 1024:.1f} MB")
+    print(
+        f"Requests to the directory: {requests['requests']} "
+        f"({requests['request_bytes'] / 1024 / 1024:.1f} MB sent, "
+        f"{requests['response_bytes'] / 1024 / 1024:.1f} MB received, "
+        f"p50 {requests['latency_p50'] * 1000:.0f}ms, "
+        f"p99 {requests['latency_p99'] * 1000:.0f}ms)"
+    )
+    print(f"Operations on the handle server: {report['pid_operations']}")
+    print("Servers:")
+    for name, values in report["servers"].items():
+        print(
+            f"    {name}: {values['requests']} requests, "
+            f"{values['request_bytes'] / 1024 / 1024:.1f} MB received, "
+            f"{values['response_bytes'] / 1024 / 1024:.1f} MB sent"
+        )
+    print("Nodes:")
+    for node, values in sorted(
+        report["nodes"].items(), key=lambda item: item[1]["duration"], reverse=True
+    ):
+        phases = ", ".join(
+            f"{phase} {seconds:.1f}s" for phase, seconds in values["phases"].items()
+        )
+        print(
+            f"    {node}: {values['duration']:.1f}s, "
+            f"{values['counters'].get('rows_read', 0)} rows read, "
+            f"{values['requests']} requests ({phases})"
+        )
+    for node, error in report["errors"].items():
+        print(f"❌ Node {node} failed: {error}")
+
+
+def main(args: List[str]):
+    defaults = Scenario()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=defaults.nodes)
+    parser.add_argument("--external", type=int, default=defaults.external_nodes)
+    parser.add_argument("--rows", type=int, default=defaults.rows)
+    parser.add_argument("--workers", type=int, default=defaults.workers)
+    parser.add_argument("--stage-workers", type=int, default=defaults.stage_workers)
+    parser.add_argument("--latency", type=float, default=defaults.latency)
+    parser.add_argument(
+        "--external-latency", type=float, default=defaults.external_latency
+    )
+    parser.add_argument("--row-latency", type=float, default=defaults.row_latency)
+    parser.add_argument("--pid-latency", type=float, default=defaults.pid_latency)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--memory", action="store_true", help="trace memory per phase")
+    parser.add_argument("--verbose", action="store_true", help="print the output")
+    parser.add_argument("--output", help="the JSON file to write the report to")
+    options = parser.parse_args(args)
+
+    scenario = Scenario(
+        nodes=options.nodes,
+        external_nodes=options.external,
+        rows=options.rows,
+        workers=options.workers,
+        stage_workers=options.stage_workers,
+        latency=options.latency,
+        external_latency=options.external_latency,
+        row_latency=options.row_latency,
+        pid_latency=options.pid_latency,
+        seed=options.seed,
+    )
+    report = run(scenario, verbose=options.verbose, memory=options.memory)
+    print_report(report)
+    if options.output:
+        with open(options.output, "w") as file:
+            json.dump(report, file, indent=2)
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
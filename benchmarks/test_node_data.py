@@ -0,0 +1,37 @@
+from molgenis.bbmri_eric.model import NodeData, Source
+from molgenis.bbmri_eric.printer import Printer
+from molgenis.bbmri_eric.synthetic import Generator
+from molgenis.bbmri_eric.transformer import Transformer
+from molgenis.bbmri_eric.validation import Validator
+
+from .conftest import NL
+
+
+def test_validate(benchmark, generator: Generator, rounds: int):
+    node_data = generator.node_data(NL)
+    printer = Printer()
+
+    def validate():
+        with printer.buffer():
+            return Validator(node_data, printer).validate()
+
+    benchmark.pedantic(validate, rounds=rounds)
+
+
+def test_enrich(benchmark, generator: Generator, eu_node_data: NodeData, rounds: int):
+    existing_biobanks = generator.node_data(NL, Source.PUBLISHED).biobanks
+    printer = Printer()
+
+    def setup():
+        node_data = generator.node_data(NL)
+        quality_info = generator.quality_info(node_data)
+        transformer = Transformer(
+            node_data, quality_info, printer, existing_biobanks, eu_node_data
+        )
+        return (transformer,), {}
+
+    def enrich(transformer: Transformer):
+        with printer.buffer():
+            return transformer.enrich()
+
+    benchmark.pedantic(enrich, setup=setup, rounds=rounds)
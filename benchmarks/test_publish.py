@@ -0,0 +1,40 @@
+from molgenis.bbmri_eric.eric import Eric
+from molgenis.bbmri_eric.model import NodeData, QualityInfo, Source
+from molgenis.bbmri_eric.pid_service import NoOpPidService
+from molgenis.bbmri_eric.printer import Printer
+from molgenis.bbmri_eric.publisher import Publisher
+from molgenis.bbmri_eric.synthetic import Generator, Spec
+
+from .conftest import NL, BenchmarkSession, benchmark_session
+
+
+def test_delete_rows(benchmark, size: int, generator: Generator, rounds: int):
+    """Half of the published collections are no longer staged and are deleted."""
+    existing_table = generator.node_data(NL, Source.PUBLISHED).collections
+    table = Generator(Spec.of_rows(size // 2)).node_data(NL).collections
+    session = BenchmarkSession(dict(), dict(), QualityInfo(dict(), dict()))
+    printer = Printer()
+    publisher = Publisher(session, printer, NoOpPidService())
+    publisher.quality_info = session.quality_info
+
+    def delete_rows():
+        with printer.buffer():
+            publisher._delete_rows(table, existing_table)
+
+    benchmark.pedantic(delete_rows, rounds=rounds)
+
+
+def test_publish_nodes(
+    benchmark, generator: Generator, eu_node_data: NodeData, rounds: int
+):
+    def setup():
+        eric = Eric(benchmark_session(generator, eu_node_data, NL), NoOpPidService())
+        eric.printer = Printer()
+        return (eric,), {}
+
+    def publish_nodes(eric: Eric):
+        with eric.printer.buffer():
+            report = eric.publish_nodes([NL])
+        assert not report.has_errors()
+
+    benchmark.pedantic(publish_nodes, setup=setup, rounds=rounds)
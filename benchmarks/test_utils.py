@@ -0,0 +1,33 @@
+from molgenis.bbmri_eric import utils
+from molgenis.bbmri_eric.synthetic import Generator
+
+from .conftest import NL, to_client_format
+
+
+def test_to_upload_format(benchmark, generator: Generator, rounds: int):
+    collections = generator.node_data(NL).collections
+
+    def setup():
+        return (to_client_format(collections),), {}
+
+    benchmark.pedantic(utils.to_upload_format, setup=setup, rounds=rounds)
+
+
+def test_remove_one_to_manys(benchmark, generator: Generator, rounds: int):
+    collections = generator.node_data(NL).collections
+    rows = list(collections.rows)
+
+    benchmark.pedantic(
+        utils.remove_one_to_manys, args=(rows, collections.meta), rounds=rounds
+    )
+
+
+def test_sort_self_references(benchmark, generator: Generator, rounds: int):
+    collections = generator.node_data(NL).collections
+    rows = list(collections.rows)
+
+    benchmark.pedantic(
+        utils.sort_self_references,
+        args=(rows, collections.meta.self_references),
+        rounds=rounds,
+    )
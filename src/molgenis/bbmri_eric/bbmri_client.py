@@ -1,11 +1,15 @@
 import json
 from collections import defaultdict
-from typing import List, Optional
-from urllib.parse import quote_plus
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, quote_plus, urlparse
 
 import requests
+from requests.adapters import BaseAdapter
 
 from molgenis.bbmri_eric import utils
+from molgenis.bbmri_eric.cassette import Cassette, RecordingAdapter, ReplayAdapter
+from molgenis.bbmri_eric.instrumentation import RequestRecord, writing_rows
+from molgenis.bbmri_eric.journal import Checkpoint
 from molgenis.bbmri_eric.model import (
     ExternalServerNode,
     Node,
@@ -29,6 +33,54 @@ class ExtendedSession(Session):
     def __init__(self, url: str, token: Optional[str] = None):
         super(ExtendedSession, self).__init__(url, token)
         self.url = self._root_url
+        self._hooks: List[Callable[[RequestRecord], None]] = list()
+
+    def instrument(self, hook: Callable[[RequestRecord], None]):
+        """
+        Registers a hook that is called with a RequestRecord after every request that
+        this session sends, including the requests of the parent Session class. (See
+        instrumentation.RequestStats for a hook that aggregates the records.)
+
+        @param hook: a function that receives the RequestRecord of each request
+        """
+        if not self._hooks:
+            self._session.hooks["response"].append(self._on_response)
+        self._hooks.append(hook)
+
+    def record(self, cassette: Cassette):
+        """
+        Records every request that this session sends from now on, and its response,
+        in a cassette. Passwords and tokens are scrubbed. (See cassette.py.)
+
+        @param cassette: the cassette to add the interactions to
+        """
+        if cassette.url is None:
+            cassette.url = self.url
+        self._mount(RecordingAdapter(cassette))
+
+    def replay(self, cassette: Cassette, latencies: bool = True) -> ReplayAdapter:
+        """
+        Answers the requests of this session with the responses in a cassette,
+        instead of sending them. Hooks are still called, so a replay can be measured
+        like the recorded run. (See cassette.py.)
+
+        @param cassette: the recorded interactions
+        @param latencies: if True, responses take as long as they took when they were
+        recorded, otherwise they are immediate
+        @return: the adapter, which counts the replayed and remaining interactions
+        """
+        adapter = ReplayAdapter(cassette, latencies)
+        self._mount(adapter)
+        return adapter
+
+    def _mount(self, adapter: BaseAdapter):
+        for prefix in ("http://", "https://"):
+            self._session.mount(prefix, adapter)
+
+    def _on_response(self, response: requests.Response, *args, **kwargs):
+        record = RequestRecord.of(response)
+        for hook in self._hooks:
+            hook(record)
 
     def get_uploadable_data(self, entity_type_id: str, *args, **kwargs) -> List[dict]:
         """
@@ -37,19 +89,138 @@ class ExtendedSession(Session):
         rows = self.get(entity_type_id, *args, **kwargs)
         return utils.to_upload_format(rows)
 
-    def upsert_batched(self, entity_type_id: str, entities: List[dict]):
+    def iter_uploadable_data(
+        self, meta: TableMeta, q: Optional[str] = None, batch_size: int = 10000
+    ) -> Iterator[dict]:
+        """
+        Yields all the rows of an entity type in the uploadable format, page by page.
+        The responses are converted while they are decoded, using the table's
+        metadata to know which attributes are references.
+
+        @param meta: the metadata of the entity type
+        @param q: an optional RSQL query
+        @param batch_size: the number of rows to retrieve per request
+        """
+        object_hook = utils.upload_format_converter(meta.schema)
+        start = 0
+        while True:
+            url = self._build_api_url(
+                self._api_url + "v2/" + quote_plus(meta.id),
+                {
+                    "q": q,
+                    "attrs": [None, None],
+                    "num": batch_size,
+                    "start": start,
+                    "sort": [meta.id_attribute, None],
+                },
+            )
+            response = self._session.get(url, headers=self._get_token_header())
+            try:
+                response.raise_for_status()
+            except requests.RequestException as ex:
+                self._raise_exception(ex)
+
+            page = json.loads(response.content, object_hook=object_hook)
+            yield from page["items"]
+
+            if "nextHref" not in page:
+                break
+            start = parse_qs(urlparse(page["nextHref"]).query)["start"][0]
+
+    def count(self, entity_type_id: str, q: Optional[str] = None) -> int:
+        """
+        Returns the number of rows of an entity type. Only the total is retrieved, not
+        the rows themselves.
+
+        @param entity_type_id: the entity type to count the rows of
+        @param q: an optional RSQL query, only the matching rows are counted
+        """
+        url = self._build_api_url(
+            self._api_url + "v2/" + quote_plus(entity_type_id), {"q": q, "num": 1}
+        )
+        response = self._session.get(url, headers=self._get_token_header())
+        try:
+            response.raise_for_status()
+        except requests.RequestException as ex:
+            self._raise_exception(ex)
+
+        return response.json()["total"]
+
+    def upsert_batched(
+        self,
+        entity_type_id: str,
+        entities: List[dict],
+        checkpoint: Optional[Checkpoint] = None,
+    ):
         """
         Upserts entities in an entity type (in batches, if needed).
         @param entity_type_id: the id of the entity type to upsert to
         @param entities: the entities to upsert
+        @param checkpoint: if provided, completed batches are recorded and batches
+        that were completed before are skipped
+        """
+        if checkpoint:
+            self._upsert_checkpointed(entity_type_id, entities, checkpoint)
+            return
+
+        meta, add, update = self.split_upsert(entity_type_id, entities)
+
+        # Do the adds and updates in batches
+        self.add_batched(meta.id, meta.self_references, add)
+        self.update_batched(meta.id, meta.self_references, update)
+
+    def split_upsert(
+        self, entity_type_id: str, entities: Iterable[dict]
+    ) -> Tuple[TableMeta, List[dict], List[dict]]:
+        """
+        Decides which entities of an upsert should be added and which should be
+        updated, based on the identifiers that already exist in the entity type.
+        @param entity_type_id: the id of the entity type to upsert to
+        @param entities: the entities to upsert
+        @return: the metadata of the entity type, the rows to add (without their
+        one-to-manys) and the rows to update
+        """
+        meta = self.get_meta(entity_type_id)
+        add, update = self._split(meta, self._get_existing_ids(meta), entities)
+        return meta, add, update
+
+    def _upsert_checkpointed(
+        self, entity_type_id: str, entities: List[dict], checkpoint: Checkpoint
+    ):
+        """
+        Upserts entities in batches of 1000 that are each split in rows to add and
+        rows to update. The batches are made before the split, so they are the same
+        in every run and completed batches can be recognized by their content.
         """
-        # Get the existing identifiers
         meta = self.get_meta(entity_type_id)
+        existing_ids = self._get_existing_ids(meta)
+
+        entities = list(entities)
+        if meta.self_references and len(entities) > 1000:
+            entities = utils.sort_self_references(entities, meta.self_references)
+
+        for batch in batched(entities, 1000):
+            if checkpoint.is_done("upsert", batch):
+                continue
+
+            add, update = self._split(meta, existing_ids, batch)
+            if add:
+                self.add_all(meta.id, add)
+            if update:
+                self.update(meta.id, update)
+            checkpoint.record("upsert", batch)
+
+    def _get_existing_ids(self, meta: TableMeta) -> Set[str]:
         id_attr = meta.id_attribute
         existing_entities = self.get(meta.id, batch_size=10000, attributes=id_attr)
-        existing_ids = {entity[id_attr] for entity in existing_entities}
+        return {entity[id_attr] for entity in existing_entities}
 
+    @staticmethod
+    def _split(
+        meta: TableMeta, existing_ids: Set[str], entities: Iterable[dict]
+    ) -> Tuple[List[dict], List[dict]]:
         # Based on the existing identifiers, decide which rows should be added/updated
+        id_attr = meta.id_attribute
         add = list()
         update = list()
         for entity in entities:
@@ -60,18 +231,46 @@ class ExtendedSession(Session):
 
         # Sanitize data: rows that are added should not contain one_to_manys
         add = utils.remove_one_to_manys(add, meta)
+        return add, update
 
-        # Do the adds and updates in batches
-        self.add_batched(meta.id, meta.self_references, add)
-        self.update_batched(meta.id, meta.self_references, update)
+    def add_all(self, entity_type_id: str, entities: List[dict]):
+        """
+        Adds multiple entities. Raises a MolgenisRequestError if they aren't added, so
+        a failed batch is never recorded in a checkpoint.
+        """
+        with writing_rows(len(entities)):
+            response = self._session.post(
+                self._api_url + "v2/" + quote_plus(entity_type_id),
+                headers=self._get_token_header_with_content_type(),
+                data=json.dumps({"entities": entities}, default=dict),
+            )
+
+        try:
+            response.raise_for_status()
+        except requests.RequestException as ex:
+            self._raise_exception(ex)
+
+        return response
+
+    def delete_list(self, entity_type_id: str, entities: List[str]):
+        """Deletes multiple entities, given a list of identifiers."""
+        with writing_rows(len(entities)):
+            return super(ExtendedSession, self).delete_list(entity_type_id, entities)
+
+    def delete(self, entity_type_id: str, id_: Optional[str] = None):
+        """Deletes a single entity, or all entities if no identifier is given."""
+        # the number of rows is unknown when all entities are deleted
+        with writing_rows(1 if id_ else 0):
+            return super(ExtendedSession, self).delete(entity_type_id, id_)
 
     def update(self, entity_type_id: str, entities: List[dict]):
         """Updates multiple entities."""
-        response = self._session.put(
-            self._api_url + "v2/" + quote_plus(entity_type_id),
-            headers=self._get_token_header_with_content_type(),
-            data=json.dumps({"entities": entities}),
-        )
+        with writing_rows(len(entities)):
+            response = self._session.put(
+                self._api_url + "v2/" + quote_plus(entity_type_id),
+                headers=self._get_token_header_with_content_type(),
+                data=json.dumps({"entities": entities}, default=dict),
+            )
 
         try:
             response.raise_for_status()
@@ -134,30 +333,53 @@ class EricSession(ExtendedSession):
 
     NODES_TABLE = "eu_bbmri_eric_national_nodes"
 
-    def get_quality_info(self) -> QualityInfo:
+    def get_quality_info(
+        self,
+        biobank_ids: Optional[Iterable[str]] = None,
+        collection_ids: Optional[Iterable[str]] = None,
+    ) -> QualityInfo:
         """
         Retrieves the quality information identifiers for biobanks and collections.
+        By default, the quality information of the whole directory is retrieved. When
+        biobank and collection identifiers are provided, only the quality information
+        of those biobanks and collections is retrieved.
+        :param biobank_ids: the biobanks to get the quality information of
+        :param collection_ids: the collections to get the quality information of
         :return: a QualityInfo object
         """
-
-        biobank_qualities = self.get(
-            "eu_bbmri_eric_bio_qual_info", batch_size=10000, attributes="id,biobank"
+        scoped = biobank_ids is not None or collection_ids is not None
+        biobanks = self._get_qualities(
+            "eu_bbmri_eric_bio_qual_info", "biobank", biobank_ids, scoped
         )
-        collection_qualities = self.get(
-            "eu_bbmri_eric_col_qual_info", batch_size=10000, attributes="id,collection"
+        collections = self._get_qualities(
+            "eu_bbmri_eric_col_qual_info", "collection", collection_ids, scoped
         )
-
-        biobanks = utils.to_upload_format(biobank_qualities)
-        collections = utils.to_upload_format(collection_qualities)
-
-        bb_qual = defaultdict(list)
-        coll_qual = defaultdict(list)
-        for row in biobanks:
-            bb_qual[row["biobank"]].append(row["id"])
-        for row in collections:
-            coll_qual[row["collection"]].append(row["id"])
-
-        return QualityInfo(biobanks=bb_qual, collections=coll_qual)
+        return QualityInfo(biobanks=biobanks, collections=collections)
+
+    def _get_qualities(
+        self,
+        entity_type_id: str,
+        attribute: str,
+        ids: Optional[Iterable[str]],
+        scoped: bool,
+    ) -> Dict[str, List[str]]:
+        if not scoped:
+            queries = [None]
+        else:
+            # the ids are split over multiple requests to keep the URLs short enough
+            queries = utils.rsql_in_queries(attribute, sorted(ids or []))
+
+        qualities = defaultdict(list)
+        for query in queries:
+            rows = self.get(
+                entity_type_id,
+                q=query,
+                batch_size=10000,
+                attributes=f"id,{attribute}",
+            )
+            for row in utils.to_upload_format(rows):
+                qualities[row[attribute]].append(row["id"])
+        return qualities
 
     def get_node(self, code: str) -> Node:
         """
@@ -251,11 +473,24 @@ class EricSession(ExtendedSession):
             tables[table_type] = Table.of(
                 table_type=table_type,
                 meta=meta,
-                rows=self.get_uploadable_data(id_, batch_size=10000),
+                rows=self.iter_uploadable_data(meta),
             )
 
         return NodeData.from_dict(node=node, source=Source.STAGING, tables=tables)
 
+    def get_staging_row_count(self, node: Node) -> int:
+        """
+        Counts the rows of the four tables of a node's staging area, without
+        retrieving them.
+
+        :param Node node: the node to count the staging rows of
+        :return: the total number of rows
+        """
+        return sum(
+            self.count(node.get_staging_id(table_type))
+            for table_type in TableType.get_import_order()
+        )
+
     def get_published_node_data(self, node: Node) -> NodeData:
         """
         Gets the four tables that belong to a single node from the published tables.
@@ -273,9 +508,7 @@ class EricSession(ExtendedSession):
             tables[table_type] = Table.of(
                 table_type=table_type,
                 meta=meta,
-                rows=self.get_uploadable_data(
-                    id_, batch_size=10000, q=f"national_node=={node.code}"
-                ),
+                rows=self.iter_uploadable_data(meta, q=f"national_node=={node.code}"),
             )
 
         return NodeData.from_dict(node=node, source=Source.PUBLISHED, tables=tables)
@@ -305,7 +538,7 @@ class ExternalServerSession(ExtendedSession):
             tables[table_type] = Table.of(
                 table_type=table_type,
                 meta=meta,
-                rows=self.get_uploadable_data(id_, batch_size=10000),
+                rows=self.iter_uploadable_data(meta),
             )
 
         return NodeData.from_dict(
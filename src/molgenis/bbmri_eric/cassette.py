@@ -0,0 +1,257 @@
+"""
+Recording and replaying the HTTP traffic of a session, to rerun a recorded workload
+against another version of this library without a server (see ExtendedSession.record
+and ExtendedSession.replay).
+
+A cassette file is a gzip-compressed JSON lines file. The first line is a header, the
+other lines are the interactions in the order their responses were received:
+
+    {"version": 1, "url": "https://directory.bbmri-eric.eu/"}
+    {"method": "GET", "path": "/api/v2/eu_bbmri_eric_persons?num=10000",
+     "body": "<sha256 of the request body>", "status": 200, "latency": 0.153,
+     "content": "<the response>"}
+
+Request bodies are only stored as hashes, because they are only needed to match the
+requests of a replay. Passwords and tokens are scrubbed before anything is recorded.
+
+A request is answered with the first unused interaction with the same method, path
+and body. Requests that are sent more than once, like the identifiers of a table
+before and after an upsert, get their responses in the recorded order. If the body
+doesn't match any interaction, because the request contains something that changes
+every run (like a newly generated PID), the first unused interaction with the same
+method and path is used instead.
+"""
+
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from http.client import responses
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+
+from molgenis.bbmri_eric.errors import EricError
+
+VERSION = 1
+SCRUBBED = "<scrubbed>"
+
+
+@dataclass(frozen=True)
+class Interaction:
+    """
+    A request and its response. The latency is the time between sending the request
+    and reading the whole response.
+    """
+
+    method: str
+    path: str
+    body: str
+    status: int
+    latency: float
+    content: bytes
+
+    def to_dict(self) -> dict:
+        return {
+            "method": self.method,
+            "path": self.path,
+            "body": self.body,
+            "status": self.status,
+            "latency": round(self.latency, 6),
+            "content": self.content.decode("utf-8", "surrogateescape"),
+        }
+
+    @staticmethod
+    def from_dict(interaction: dict) -> "Interaction":
+        return Interaction(
+            method=interaction["method"],
+            path=interaction["path"],
+            body=interaction["body"],
+            status=interaction["status"],
+            latency=interaction["latency"],
+            content=interaction["content"].encode("utf-8", "surrogateescape"),
+        )
+
+
+class Cassette:
+    """
+    The recorded interactions of a session. Interactions can be added by multiple
+    threads.
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        interactions: Optional[List[Interaction]] = None,
+    ):
+        self.url = url
+        self.interactions: List[Interaction] = interactions or []
+        self._lock = threading.Lock()
+
+    def add(self, interaction: Interaction):
+        with self._lock:
+            self.interactions.append(interaction)
+
+    def save(self, path: str):
+        """
+        Writes the cassette to a gzip-compressed JSON lines file.
+
+        :param str path: the file to write to
+        """
+        with self._lock:
+            interactions = list(self.interactions)
+        with gzip.open(path, "wt", encoding="utf-8") as file:
+            file.write(json.dumps({"version": VERSION, "url": self.url}) + "\n")
+            for interaction in interactions:
+                file.write(json.dumps(interaction.to_dict()) + "\n")
+
+    @staticmethod
+    def load(path: str) -> "Cassette":
+        """
+        Reads a cassette that was written by Cassette.save.
+
+        :param str path: the file to read
+        """
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            header = json.loads(file.readline())
+            if header.get("version") != VERSION:
+                raise EricError(
+                    f"Unsupported cassette version {header.get('version')} in {path}"
+                )
+            interactions = [Interaction.from_dict(json.loads(line)) for line in file]
+        return Cassette(header["url"], interactions)
+
+
+class RecordingAdapter(HTTPAdapter):
+    """Sends requests like the default adapter and records them in a cassette."""
+
+    def __init__(self, cassette: Cassette):
+        super(RecordingAdapter, self).__init__()
+        self.cassette = cassette
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        started = time.perf_counter()
+        response = super(RecordingAdapter, self).send(request, **kwargs)
+        content = response.content or b""
+        latency = time.perf_counter() - started
+
+        path = _path(request.url)
+        self.cassette.add(
+            Interaction(
+                method=request.method,
+                path=path,
+                body=_hash_body(path, request.body),
+                status=response.status_code,
+                latency=latency,
+                content=_scrub_response(path, content),
+            )
+        )
+        return response
+
+
+class ReplayAdapter(BaseAdapter):
+    """
+    Answers requests with the responses in a cassette, without sending them. Raises
+    an EricError for requests that were not recorded.
+    """
+
+    def __init__(self, cassette: Cassette, latencies: bool = True):
+        """
+        :param Cassette cassette: the recorded interactions
+        :param bool latencies: if True, every response takes as long as it took when
+                               it was recorded, otherwise responses are immediate
+        """
+        super(ReplayAdapter, self).__init__()
+        self.latencies = latencies
+        self.replayed = 0
+        """The number of requests that were answered"""
+        self.mismatched = 0
+        """The number of requests that were answered despite a different body"""
+        self._unused: Dict[Tuple[str, str], List[Interaction]] = defaultdict(list)
+        self._remaining = len(cassette.interactions)
+        self._lock = threading.Lock()
+        for interaction in cassette.interactions:
+            self._unused[(interaction.method, interaction.path)].append(interaction)
+
+    @property
+    def remaining(self) -> int:
+        """The number of recorded interactions that weren't replayed."""
+        return self._remaining
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        path = _path(request.url)
+        interaction = self._take(request.method, path, _hash_body(path, request.body))
+        if self.latencies:
+            time.sleep(interaction.latency)
+
+        response = requests.Response()
+        response.status_code = interaction.status
+        response.reason = responses.get(interaction.status, "")
+        response._content = interaction.content
+        response.encoding = "utf-8"
+        response.headers["Content-Type"] = "application/json"
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        pass
+
+    def _take(self, method: str, path: str, body: str) -> Interaction:
+        with self._lock:
+            unused = self._unused.get((method, path))
+            if not unused:
+                raise EricError(f"No recorded response for {method} {path}")
+            index = next(
+                (i for i, interaction in enumerate(unused) if interaction.body == body),
+                None,
+            )
+            if index is None:
+                index = 0
+                self.mismatched += 1
+            self.replayed += 1
+            self._remaining -= 1
+            return unused.pop(index)
+
+
+def _path(url: str) -> str:
+    """Returns the path and query of a URL, so a cassette doesn't depend on a host."""
+    parsed = urlparse(url)
+    return f"{parsed.path}?{parsed.query}" if parsed.query else parsed.path
+
+
+def _hash_body(path: str, body) -> str:
+    if body is None:
+        body = b""
+    elif isinstance(body, str):
+        body = body.encode("utf-8")
+    if _is_login(path) and body:
+        try:
+            credentials = json.loads(body)
+            credentials["password"] = SCRUBBED
+            body = json.dumps(credentials, sort_keys=True).encode("utf-8")
+        except (ValueError, TypeError):
+            pass
+    return hashlib.sha256(body).hexdigest()
+
+
+def _scrub_response(path: str, content: bytes) -> bytes:
+    if not _is_login(path):
+        return content
+    try:
+        document = json.loads(content)
+    except ValueError:
+        return content
+    if isinstance(document, dict) and "token" in document:
+        document["token"] = SCRUBBED
+    return json.dumps(document).encode("utf-8")
+
+
+def _is_login(path: str) -> bool:
+    return path.rstrip("/").endswith("/v1/login")
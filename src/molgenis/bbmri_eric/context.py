@@ -0,0 +1,123 @@
+import threading
+from typing import Dict, Iterable, Optional, Set
+
+from molgenis.bbmri_eric.bbmri_client import EricSession
+from molgenis.bbmri_eric.model import NodeData, QualityInfo, TableType
+
+
+class PublishContext:
+    """
+    The data that publishing needs besides the data of the node itself: the quality
+    info and the staging data of node EU. Both are retrieved on first use and are
+    kept until they are invalidated, so a single context can be shared by all nodes
+    and by multiple publications. The data is retrieved only once, even when nodes
+    are published concurrently.
+
+    The quality info can also be retrieved per node with get_quality_info(). Only
+    the biobanks and collections that weren't asked for before are retrieved then.
+    """
+
+    def __init__(self, session: EricSession):
+        self.session = session
+        self._quality_lock = threading.Lock()
+        self._eu_lock = threading.Lock()
+        self._quality_info: Optional[QualityInfo] = None
+        self._partial_quality_info = QualityInfo(biobanks=dict(), collections=dict())
+        self._retrieved_ids: Dict[TableType, Set[str]] = {
+            TableType.BIOBANKS: set(),
+            TableType.COLLECTIONS: set(),
+        }
+        self._eu_node_data: Optional[NodeData] = None
+
+    @property
+    def quality_info(self) -> QualityInfo:
+        with self._quality_lock:
+            if self._quality_info is None:
+                self._quality_info = self.session.get_quality_info()
+            return self._quality_info
+
+    @quality_info.setter
+    def quality_info(self, quality_info: Optional[QualityInfo]):
+        with self._quality_lock:
+            self._quality_info = quality_info
+            self._partial_quality_info = QualityInfo(
+                biobanks=dict(), collections=dict()
+            )
+            for ids in self._retrieved_ids.values():
+                ids.clear()
+
+    def get_quality_info(
+        self, biobank_ids: Iterable[str], collection_ids: Iterable[str]
+    ) -> QualityInfo:
+        """
+        Returns quality info that contains at least the provided biobanks and
+        collections. If the quality info of the whole directory was retrieved
+        already, that is returned. Otherwise only the quality info of biobanks and
+        collections that weren't retrieved before is retrieved. Ids without quality
+        info are remembered too, so they aren't retrieved again.
+        """
+        with self._quality_lock:
+            if self._quality_info is not None:
+                return self._quality_info
+
+            biobank_ids = set(biobank_ids)
+            collection_ids = set(collection_ids)
+            missing_biobanks = biobank_ids - self._retrieved_ids[TableType.BIOBANKS]
+            missing_collections = (
+                collection_ids - self._retrieved_ids[TableType.COLLECTIONS]
+            )
+            if missing_biobanks or missing_collections:
+                retrieved = self.session.get_quality_info(
+                    biobank_ids=missing_biobanks, collection_ids=missing_collections
+                )
+                self._partial_quality_info.biobanks.update(retrieved.biobanks)
+                self._partial_quality_info.collections.update(retrieved.collections)
+                self._retrieved_ids[TableType.BIOBANKS].update(missing_biobanks)
+                self._retrieved_ids[TableType.COLLECTIONS].update(missing_collections)
+
+            # return a copy, the cache can change while the caller is using it
+            partial = self._partial_quality_info
+            return QualityInfo(
+                biobanks={
+                    id_: partial.biobanks[id_]
+                    for id_ in biobank_ids
+                    if id_ in partial.biobanks
+                },
+                collections={
+                    id_: partial.collections[id_]
+                    for id_ in collection_ids
+                    if id_ in partial.collections
+                },
+            )
+
+    @property
+    def eu_node_data(self) -> NodeData:
+        with self._eu_lock:
+            if self._eu_node_data is None:
+                self._eu_node_data = self.session.get_staging_node_data(
+                    self.session.get_node("EU")
+                )
+            return self._eu_node_data
+
+    @eu_node_data.setter
+    def eu_node_data(self, eu_node_data: Optional[NodeData]):
+        with self._eu_lock:
+            self._eu_node_data = eu_node_data
+
+    def invalidate(self, quality_info: bool = True, eu_node_data: bool = True):
+        """
+        Drops the retrieved data, it will be retrieved again on next use. Use this
+        when the quality info or the staging area of node EU have changed.
+        """
+        if quality_info:
+            self.quality_info = None
+        if eu_node_data:
+            self.eu_node_data = None
+
+    def refresh(self, quality_info: bool = True, eu_node_data: bool = True):
+        """Retrieves the data again right away."""
+        self.invalidate(quality_info, eu_node_data)
+        if quality_info:
+            _ = self.quality_info
+        if eu_node_data:
+            _ = self.eu_node_data
@@ -0,0 +1,183 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+import requests
+
+from molgenis.bbmri_eric.bbmri_client import EricSession
+from molgenis.bbmri_eric.errors import EricError
+from molgenis.bbmri_eric.instrumentation import bind
+from molgenis.bbmri_eric.journal import Checkpoint
+from molgenis.bbmri_eric.model import Table
+from molgenis.bbmri_eric.utils import batched
+from molgenis.client import MolgenisRequestError
+
+BATCH_SIZE = 1000
+"""The maximum number of ids per delete request"""
+
+WORKERS = 4
+"""The maximum number of delete requests that are sent at the same time"""
+
+
+class DeletionError(EricError):
+    """
+    Raised when deleting rows failed halfway. Keeps track of exactly which rows were
+    deleted and which weren't.
+    """
+
+    def __init__(self, message: str, deleted_ids: List[str], failed_ids: List[str]):
+        super().__init__(message)
+        self.deleted_ids = deleted_ids
+        self.failed_ids = failed_ids
+
+
+class RowDeleter:
+    """
+    Deletes rows from a table in batches. Rows can refer to other rows of the same
+    table (self references), so the rows are divided in levels: a row is only
+    deleted after the rows that refer to it are deleted. The batches of a single
+    level are deleted concurrently.
+    """
+
+    def __init__(
+        self,
+        session: EricSession,
+        batch_size: int = BATCH_SIZE,
+        workers: int = WORKERS,
+    ):
+        self.session = session
+        self.batch_size = batch_size
+        self.workers = workers
+
+    def delete(
+        self,
+        table_id: str,
+        levels: List[List[str]],
+        checkpoint: Optional[Checkpoint] = None,
+        on_deleted: Optional[Callable[[List[str]], None]] = None,
+    ) -> List[str]:
+        """
+        Deletes rows from a table, level by level, and returns the ids of the deleted
+        rows. Batches that were deleted in a previous run are skipped (see
+        Checkpoint). If a batch fails, the other batches of its level are finished
+        and a DeletionError is raised.
+
+        :param str table_id: the table to delete from
+        :param levels: the ids of the rows to delete (see get_deletion_levels)
+        :param Checkpoint checkpoint: the checkpoint of the table, if any
+        :param on_deleted: if provided, is called in the calling thread with the ids
+                           of every batch that was deleted, as soon as it is deleted
+        """
+        deleted = list()
+        for level in levels:
+            batches = [
+                batch
+                for batch in batched(level, self.batch_size)
+                if not (checkpoint and checkpoint.is_done("delete", batch))
+            ]
+            errors = self._delete_batches(
+                table_id, batches, checkpoint, deleted, on_deleted
+            )
+            if errors:
+                deleted_ids = set(deleted)
+                raise DeletionError(
+                    f"Error deleting rows from {table_id}: "
+                    f"{len(deleted)} row(s) were deleted, "
+                    f"{len(errors)} batch(es) failed",
+                    deleted_ids=deleted,
+                    failed_ids=[
+                        id_
+                        for level_ in levels
+                        for id_ in level_
+                        if id_ not in deleted_ids
+                    ],
+                ) from errors[0]
+        return deleted
+
+    def _delete_batches(
+        self,
+        table_id: str,
+        batches: List[List[str]],
+        checkpoint: Optional[Checkpoint],
+        deleted: List[str],
+        on_deleted: Optional[Callable[[List[str]], None]],
+    ) -> List[Exception]:
+        """
+        Deletes batches concurrently. The ids of deleted batches are added to
+        'deleted' and passed to 'on_deleted'. Returns the errors of the batches that
+        failed.
+        """
+
+        def delete_batch(batch: List[str]):
+            self.session.delete_list(table_id, batch)
+            if checkpoint:
+                checkpoint.record("delete", batch)
+
+        errors = list()
+        if len(batches) == 1 or self.workers <= 1:
+            for batch in batches:
+                try:
+                    delete_batch(batch)
+                except (MolgenisRequestError, requests.RequestException) as e:
+                    errors.append(e)
+                    break
+                deleted.extend(batch)
+                if on_deleted:
+                    on_deleted(batch)
+            return errors
+
+        with ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="delete"
+        ) as executor:
+            futures = [
+                (batch, executor.submit(bind(delete_batch), batch)) for batch in batches
+            ]
+            for batch, future in futures:
+                try:
+                    future.result()
+                except (MolgenisRequestError, requests.RequestException) as e:
+                    errors.append(e)
+                    continue
+                deleted.extend(batch)
+                if on_deleted:
+                    on_deleted(batch)
+        return errors
+
+
+def get_deletion_levels(table: Table, ids: Iterable[str]) -> List[List[str]]:
+    """
+    Divides the ids of the rows that are going to be deleted in levels. A row that
+    is referred to by another deleted row (with a self reference) is in a later
+    level than that row. Rows that refer to each other in a cycle end up in the same
+    level. The ids are sorted within a level, so the levels are always the same for
+    the same rows.
+
+    :param Table table: the table containing the rows
+    :param ids: the ids of the rows that are going to be deleted
+    """
+    ids = sorted(set(ids))
+    deleting = set(ids)
+
+    referrers: Dict[str, Set[str]] = {id_: set() for id_ in ids}
+    for id_ in ids:
+        row = table.rows_by_id.get(id_)
+        if not row:
+            continue
+        for attribute in table.meta.self_references:
+            value = row.get(attribute)
+            references = value if isinstance(value, list) else [value]
+            for reference in references:
+                if reference in deleting and reference != id_:
+                    referrers[reference].add(id_)
+
+    levels = list()
+    done = set()
+    remaining = ids
+    while remaining:
+        level = [id_ for id_ in remaining if referrers[id_] <= done]
+        if not level:
+            # a cycle, delete the rows together
+            level = remaining
+        levels.append(level)
+        done.update(level)
+        remaining = [id_ for id_ in remaining if id_ not in done]
+    return levels
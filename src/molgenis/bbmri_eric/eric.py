@@ -1,11 +1,27 @@
-from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
 
 from molgenis.bbmri_eric.bbmri_client import EricSession
+from molgenis.bbmri_eric.context import PublishContext
 from molgenis.bbmri_eric.errors import EricError, ErrorReport, requests_error_handler
+from molgenis.bbmri_eric.instrumentation import node_scope, node_scoped
+from molgenis.bbmri_eric.journal import CheckpointJournal
+from molgenis.bbmri_eric.memory import WORKING_SET_FACTOR, MemoryBudget, estimate_size
+from molgenis.bbmri_eric.metrics import Metrics, NoOpMetrics
 from molgenis.bbmri_eric.model import ExternalServerNode, Node, NodeData
-from molgenis.bbmri_eric.pid_service import BasePidService
+from molgenis.bbmri_eric.pid_service import (
+    BasePidService,
+    MeteredPidService,
+    NoOpPidService,
+    SynchronizedPidService,
+)
+from molgenis.bbmri_eric.plan import PublishPlan
+from molgenis.bbmri_eric.prefetch import NodeDataPrefetcher
 from molgenis.bbmri_eric.printer import Printer
+from molgenis.bbmri_eric.profiling import NoOpProfiler, Profiler
 from molgenis.bbmri_eric.publisher import Publisher
+from molgenis.bbmri_eric.scheduler import NodeScheduler
 from molgenis.bbmri_eric.stager import Stager
 from molgenis.bbmri_eric.validation import Validator
 from molgenis.client import MolgenisRequestError
@@ -24,94 +40,529 @@ class Eric:
         """
         self.session = session
         self.printer = Printer()
+        """Prints the progress of every node. Set printer.output to a JsonLinesOutput
+        or a QuietOutput for structured output or only counts of the lines."""
         self.pid_service: Optional[BasePidService] = pid_service
+        self.context = PublishContext(session)
+        """The quality info and data of node EU, shared by all publications. Use
+        context.invalidate() or context.refresh() when these have changed."""
+        self.scheduler = NodeScheduler(session)
+        """Decides which nodes are started first when nodes are staged or published
+        concurrently. Remembers the sizes of the nodes that were published."""
+        self.metrics: Metrics = NoOpMetrics()
+        """Set to a Metrics object to record the durations of the phases and the
+        numbers of rows of every node. Use a new Metrics object for every run."""
+        self.profiler: Profiler = NoOpProfiler()
+        """Set to a Profiler object to profile every phase of every node. The
+        profiles are saved and the hot functions are printed with the summary."""
 
-    def stage_external_nodes(self, nodes: List[ExternalServerNode]) -> ErrorReport:
+    def stage_external_nodes(
+        self, nodes: List[ExternalServerNode], workers: int = 1
+    ) -> ErrorReport:
         """
         Stages all data from the provided external nodes in the ERIC directory.
 
         Parameters:
             nodes (List[ExternalServerNode]): The list of external nodes to stage
+            workers (int): The number of nodes that are staged at the same time. With
+                           more than one worker, the largest nodes are started first
+                           (see Eric.scheduler).
         """
         report = ErrorReport(nodes)
-        for node in nodes:
+        if workers > 1:
+            self._stage_nodes_concurrently(nodes, report, workers)
+        else:
+            for node in nodes:
+                self.printer.print_node_title(node)
+                try:
+                    self._stage_node(node)
+                except EricError as e:
+                    self.printer.print_error(e)
+                    report.add_error(node, e)
+
+        self._print_summary(report)
+        return report
+
+    def _stage_nodes_concurrently(
+        self, nodes: List[ExternalServerNode], report: ErrorReport, workers: int
+    ):
+        """
+        Stages nodes in a pool of worker threads, largest nodes first. The output of
+        every node is buffered and written in the original order of the nodes.
+        """
+        with ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="stage"
+        ) as executor:
+            futures = {
+                node: executor.submit(self._stage_node_buffered, node)
+                for node in self.scheduler.order(nodes)
+            }
+            for node in nodes:
+                lines, error = futures[node].result()
+                self.printer.write_lines(lines)
+                if error:
+                    report.add_error(node, error)
+
+    def _stage_node_buffered(
+        self, node: ExternalServerNode
+    ) -> Tuple[List[str], Optional[EricError]]:
+        with self.printer.buffer() as lines:
             self.printer.print_node_title(node)
             try:
                 self._stage_node(node)
+                error = None
             except EricError as e:
                 self.printer.print_error(e)
-                report.add_error(node, e)
-
-        self.printer.print_summary(report)
-        return report
+                error = e
+        return lines, error
 
-    def publish_nodes(self, nodes: List[Node]) -> ErrorReport:
+    def publish_nodes(
+        self,
+        nodes: List[Node],
+        prefetch_depth: int = 0,
+        workers: int = 1,
+        journal: Optional[CheckpointJournal] = None,
+        combined: bool = False,
+        memory_budget: Optional[int] = None,
+    ) -> ErrorReport:
         """
         Publishes data from the provided nodes to the production tables in the ERIC
         directory.
 
         Parameters:
             nodes (List[Node]): The list of nodes to publish
+            prefetch_depth (int): The number of upcoming nodes of which the staging
+                                  and published data is retrieved in the background
+                                  while the current node is being published. 0 turns
+                                  prefetching off.
+            workers (int): The number of nodes that are published at the same time.
+                           With more than one worker, node EU is published before the
+                           other nodes, the largest nodes are started first (see
+                           Eric.scheduler) and prefetching is not used.
+            journal (CheckpointJournal): If provided, the batches that are written are
+                                         recorded in this journal. Publishing a node
+                                         that failed before with the same journal
+                                         skips the batches that were already
+                                         written. The entries of a node are removed
+                                         once it is published. In combined mode,
+                                         a node's upserted rows of a table are
+                                         recorded as one batch.
+            combined (bool): If True, all nodes are prepared first and then the rows
+                             of all nodes are upserted together per table. This
+                             saves requests when there are many small nodes.
+                             Prefetching and workers are not used in this mode.
+            memory_budget (int): The maximum number of bytes of node data to hold at
+                                 once. A node that doesn't fit in the budget is not
+                                 published. Prefetched data that doesn't fit is
+                                 written to temporary files until it's needed. The
+                                 rows of a table are released as soon as the table is
+                                 published. Can't be combined with workers or
+                                 combined mode.
         """
         if not self.pid_service:
             raise ValueError("A PID service is required to publish nodes")
+        if memory_budget is not None and (combined or workers > 1):
+            raise ValueError(
+                "A memory budget can only be used when publishing nodes one by one"
+            )
 
         report = ErrorReport(nodes)
-        publisher = Publisher(self.session, self.printer, self.pid_service)
+        publisher = Publisher(
+            self.session,
+            self.printer,
+            self._get_pid_service(synchronized=workers > 1),
+            journal=journal,
+            context=self.context,
+        )
+        publisher.metrics = self.metrics
+        publisher.profiler = self.profiler
+        if combined:
+            self._publish_nodes_combined(nodes, report, publisher)
+        elif workers > 1:
+            self._publish_nodes_concurrently(nodes, report, publisher, workers)
+        else:
+            budget = MemoryBudget(memory_budget) if memory_budget is not None else None
+            self._publish_nodes_sequentially(
+                nodes, report, publisher, prefetch_depth, budget
+            )
+
+        # Published nodes should start from scratch next time
+        if journal:
+            for node in nodes:
+                if node not in report.errors:
+                    journal.clear(node)
+
+        self._print_summary(report)
+        return report
+
+    def plan_nodes(self, nodes: List[Node]) -> Tuple[List[PublishPlan], ErrorReport]:
+        """
+        Computes what publishing the provided nodes would change, without changing
+        anything. Nodes with an external server are not staged: their current staging
+        areas are used. The plans can be reviewed, saved and executed later with
+        apply_plans().
+
+        Parameters:
+            nodes (List[Node]): The list of nodes to plan the publication of
+        """
+        if not self.pid_service:
+            raise ValueError("A PID service is required to plan the publication")
+
+        report = ErrorReport(nodes)
+        plans = []
+        publisher = Publisher(
+            self.session, self.printer, self.pid_service, context=self.context
+        )
         for node in nodes:
             self.printer.print_node_title(node)
             try:
-                self._publish_node(node, report, publisher)
+                plans.append(self._plan_node(node, report, publisher))
             except EricError as e:
                 self.printer.print_error(e)
                 report.add_error(node, e)
 
-        self.printer.print_summary(report)
+        self._print_summary(report)
+        return plans, report
+
+    def apply_plans(self, plans: List[PublishPlan]) -> ErrorReport:
+        """
+        Executes plans that were made with plan_nodes(). Only the planned changes are
+        made, so a plan should be applied before the directory changes again.
+
+        Parameters:
+            plans (List[PublishPlan]): The plans to execute
+        """
+        if not self.pid_service:
+            raise ValueError("A PID service is required to apply plans")
+
+        report = ErrorReport([plan.node for plan in plans])
+        publisher = Publisher(
+            self.session, self.printer, self._get_pid_service(), context=self.context
+        )
+        publisher.metrics = self.metrics
+        publisher.profiler = self.profiler
+        for plan in plans:
+            self.printer.print_node_title(plan.node)
+            self.printer.print_sub_header(f"📤 Publishing node {plan.node.code}")
+            try:
+                with node_scope(plan.node.code), self.printer.indentation():
+                    report.add_warnings(plan.node, publisher.apply(plan))
+            except EricError as e:
+                self.printer.print_error(e)
+                report.add_error(plan.node, e)
+
+        self._print_summary(report)
         return report
 
+    def _get_pid_service(self, synchronized: bool = False) -> BasePidService:
+        """
+        Returns the PID service, which counts its operations if metrics are on. A
+        synchronized service can be used by multiple threads.
+        """
+        pid_service = self.pid_service
+        if isinstance(pid_service, NoOpPidService):
+            return pid_service
+        if synchronized:
+            pid_service = SynchronizedPidService(pid_service)
+        if self.metrics.enabled:
+            pid_service = MeteredPidService(
+                pid_service, lambda: self.metrics.count("pid_operations")
+            )
+        return pid_service
+
+    def _print_summary(self, report: ErrorReport):
+        self.metrics.add_report(report)
+        self.printer.print_summary(report)
+        if self.metrics.enabled:
+            self.printer.print_metrics(self.metrics)
+        if self.profiler.enabled:
+            self.profiler.save()
+            self.printer.print_hot_functions(self.profiler)
+
+    @contextmanager
+    def _phase(self, name: str):
+        """Measures and profiles a phase of the current node, if turned on."""
+        with self.metrics.phase(name), self.profiler.phase(name):
+            yield
+
+    @node_scoped
     @requests_error_handler
-    def _publish_node(self, node: Node, report: ErrorReport, publisher: Publisher):
-        # Stage the data if this node has an external server
+    def _plan_node(
+        self, node: Node, report: ErrorReport, publisher: Publisher
+    ) -> PublishPlan:
+        node_data = self._get_node_data(node)
+        self._validate_node(node_data, report)
+
+        self.printer.print_sub_header(f"📝 Planning publication of node {node.code}")
+        with self.printer.indentation():
+            plan = publisher.plan(node_data)
+            report.add_warnings(node, plan.warnings)
+        return plan
+
+    def _publish_nodes_combined(
+        self, nodes: List[Node], report: ErrorReport, publisher: Publisher
+    ):
+        prepared = []
+        for node in nodes:
+            self.printer.print_node_title(node)
+            try:
+                prepared.append(self._prepare_node(node, report, publisher))
+            except EricError as e:
+                self.printer.print_error(e)
+                report.add_error(node, e)
+
+        if not prepared:
+            return
+
+        self.printer.reset_indent()
+        self.printer.print_sub_header(f"📤 Publishing {len(prepared)} node(s) together")
+        with self.printer.indentation():
+            try:
+                report.merge(self._publish_combined(prepared, publisher))
+            except EricError as e:
+                self.printer.print_error(e)
+                for node_data, _ in prepared:
+                    report.add_error(node_data.node, e)
+
+    @staticmethod
+    @requests_error_handler
+    def _publish_combined(
+        prepared: List[Tuple[NodeData, NodeData]], publisher: Publisher
+    ) -> ErrorReport:
+        return publisher.publish_combined(prepared)
+
+    @node_scoped
+    @requests_error_handler
+    def _prepare_node(
+        self, node: Node, report: ErrorReport, publisher: Publisher
+    ) -> Tuple[NodeData, NodeData]:
         if isinstance(node, ExternalServerNode):
             self._stage_node(node)
 
-        # Get the data from the staging area
         node_data = self._get_node_data(node)
-
-        # Validate all the rows in the staging area
         self._validate_node(node_data, report)
 
-        # Copy the data from staging to the combined tables
-        self._publish_node_data(node_data, publisher, report)
+        self.printer.print_sub_header(f"📤 Preparing node {node.code}")
+        with self.printer.indentation():
+            existing_node_data, warnings = publisher.prepare(node_data)
+            report.add_warnings(node, warnings)
+        return node_data, existing_node_data
+
+    def _publish_nodes_sequentially(
+        self,
+        nodes: List[Node],
+        report: ErrorReport,
+        publisher: Publisher,
+        prefetch_depth: int,
+        budget: Optional[MemoryBudget] = None,
+    ):
+        with NodeDataPrefetcher(
+            self.session, nodes, prefetch_depth, budget
+        ) as prefetcher:
+            for node in nodes:
+                self.printer.print_node_title(node)
+                prefetcher.advance(node)
+                try:
+                    self._publish_node(node, report, publisher, prefetcher, budget)
+                except EricError as e:
+                    self.printer.print_error(e)
+                    report.add_error(node, e)
+                finally:
+                    prefetcher.release(node)
+
+    def _publish_nodes_concurrently(
+        self,
+        nodes: List[Node],
+        report: ErrorReport,
+        publisher: Publisher,
+        workers: int,
+    ):
+        """
+        Publishes nodes in a pool of worker threads. Published rows are partitioned by
+        node, so nodes can be published independently. The exception is node EU: other
+        nodes publish rows of node EU, so it's published first. The other nodes are
+        started largest first. The output of every node is buffered and written in the
+        original order of the nodes.
+        """
+        eu_nodes = [node for node in nodes if node.code == "EU"]
+        other_nodes = [node for node in nodes if node.code != "EU"]
+
+        with ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="publish"
+        ) as executor:
+            futures = dict()
+            for node in eu_nodes:
+                futures[node] = executor.submit(
+                    self._publish_node_buffered, node, publisher
+                )
+            wait([futures[node] for node in eu_nodes])
+
+            for node in self.scheduler.order(other_nodes):
+                futures[node] = executor.submit(
+                    self._publish_node_buffered, node, publisher
+                )
+
+            for node in nodes:
+                lines, node_report = futures[node].result()
+                self.printer.write_lines(lines)
+                report.merge(node_report)
+
+    def _publish_node_buffered(
+        self, node: Node, publisher: Publisher
+    ) -> Tuple[List[str], ErrorReport]:
+        report = ErrorReport([node])
+        with self.printer.buffer() as lines:
+            self.printer.print_node_title(node)
+            try:
+                self._publish_node(
+                    node, report, publisher, NodeDataPrefetcher(self.session, [], 0)
+                )
+            except EricError as e:
+                self.printer.print_error(e)
+                report.add_error(node, e)
+        return lines, report
 
+    @node_scoped
+    @requests_error_handler
+    def _publish_node(
+        self,
+        node: Node,
+        report: ErrorReport,
+        publisher: Publisher,
+        prefetcher: NodeDataPrefetcher,
+        budget: Optional[MemoryBudget] = None,
+    ):
+        # Stage the data if this node has an external server
+        if isinstance(node, ExternalServerNode):
+            self._stage_node(node)
+
+        # Reserve memory before the data is retrieved, based on the number of rows
+        reserved = self._reserve_memory(node, prefetcher, budget)
+
+        try:
+            # Get the data from the staging area
+            node_data = self._get_node_data(node, prefetcher)
+            reserved = self._correct_reservation(
+                node_data, reserved, prefetcher, budget
+            )
+
+            # Validate all the rows in the staging area
+            self._validate_node(node_data, report)
+
+            # Copy the data from staging to the combined tables
+            self._publish_node_data(
+                node_data, publisher, report, prefetcher, release=budget is not None
+            )
+        finally:
+            if budget:
+                budget.release(reserved)
+
+    def _reserve_memory(
+        self,
+        node: Node,
+        prefetcher: NodeDataPrefetcher,
+        budget: Optional[MemoryBudget],
+    ) -> int:
+        """
+        Reserves the memory that is needed to publish a node, before its data is
+        retrieved. The size is estimated from the number of rows in the staging area
+        (see NodeScheduler.estimate). Other nodes refer to the data of node EU, which
+        is kept during the whole publication.
+        """
+        if not budget:
+            return 0
+
+        if node.code != "EU":
+            budget.reserve_shared(
+                "EU",
+                lambda: estimate_size(self.context.eu_node_data),
+                "the data of node EU",
+            )
+
+        size = budget.estimate_rows(self.scheduler.estimate(node))
+        self._reserve(size, node, prefetcher, budget)
+        return size
+
+    def _correct_reservation(
+        self,
+        node_data: NodeData,
+        reserved: int,
+        prefetcher: NodeDataPrefetcher,
+        budget: Optional[MemoryBudget],
+    ) -> int:
+        """
+        Changes the memory that was reserved for a node to the estimated size of its
+        retrieved data. Returns the reserved size.
+        """
+        if not budget:
+            return 0
+
+        size = estimate_size(node_data)
+        budget.record_row_size(node_data, size)
+        size *= WORKING_SET_FACTOR
+        if size > reserved:
+            self._reserve(size - reserved, node_data.node, prefetcher, budget)
+        else:
+            budget.release(reserved - size)
+        return size
+
+    @staticmethod
+    def _reserve(
+        size: int, node: Node, prefetcher: NodeDataPrefetcher, budget: MemoryBudget
+    ):
+        """Reserves memory, moving prefetched data to disk if it doesn't fit."""
+        if not budget.try_reserve(size):
+            prefetcher.spill()
+            budget.reserve(size, f"publishing node {node.code}")
+
+    @node_scoped
     @requests_error_handler
     def _stage_node(self, node: ExternalServerNode):
         self.printer.print_sub_header(f"📥 Staging data of node {node.code}")
-        with self.printer.indentation():
+        with self.printer.indentation(), self._phase("stage"):
             Stager(self.session, self.printer).stage(node)
 
     def _publish_node_data(
-        self, node_data: NodeData, publisher: Publisher, report: ErrorReport
+        self,
+        node_data: NodeData,
+        publisher: Publisher,
+        report: ErrorReport,
+        prefetcher: NodeDataPrefetcher,
+        release: bool = False,
     ):
         self.printer.print_sub_header(f"📤 Publishing node {node_data.node.code}")
         with self.printer.indentation():
-            warnings = publisher.publish(node_data)
+            try:
+                existing_node_data = prefetcher.published_data(node_data.node)
+            except MolgenisRequestError as e:
+                raise EricError(
+                    f"Error retrieving published data of node {node_data.node.code}"
+                ) from e
+            warnings = publisher.publish(node_data, existing_node_data, release=release)
             report.add_warnings(node_data.node, warnings)
 
     def _validate_node(self, node_data: NodeData, report: ErrorReport):
         self.printer.print_sub_header(
             f"🔎 Validating staging data of node {node_data.node.code}"
         )
-        with self.printer.indentation():
+        with self.printer.indentation(), self._phase("validate"):
             warnings = Validator(node_data, self.printer).validate()
             if warnings:
                 report.add_warnings(node_data.node, warnings)
 
-    def _get_node_data(self, node: Node) -> NodeData:
+    def _get_node_data(
+        self, node: Node, prefetcher: Optional[NodeDataPrefetcher] = None
+    ) -> NodeData:
         try:
             self.printer.print_sub_header(
                 f"📦 Retrieving staging data of node {node.code}"
             )
-            return self.session.get_staging_node_data(node)
+            with self._phase("fetch"):
+                node_data = prefetcher.staging_data(node) if prefetcher else None
+                if not node_data:
+                    node_data = self.session.get_staging_node_data(node)
+            self.scheduler.record(node_data)
+            self.metrics.add_node_data(node_data)
+            return node_data
         except MolgenisRequestError as e:
             raise EricError(f"Error retrieving data of node {node.code}") from e
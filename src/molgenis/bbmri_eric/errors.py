@@ -46,6 +46,13 @@ class ErrorReport:
         if warnings:
             self.warnings[node].extend(warnings)
 
+    def merge(self, other: "ErrorReport"):
+        """Adds the errors and warnings of another report to this report."""
+        for node, error in other.errors.items():
+            self.add_error(node, error)
+        for node, warnings in other.warnings.items():
+            self.add_warnings(node, warnings)
+
     def has_errors(self) -> bool:
         return len(self.errors) > 0
 
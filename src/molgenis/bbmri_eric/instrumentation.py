@@ -0,0 +1,263 @@
+"""
+Instrumentation of the requests that a session sends to a MOLGENIS server. A session
+calls its hooks with a RequestRecord after every request (see
+ExtendedSession.instrument). RequestStats is a hook that aggregates the records per
+run, node, table and table of a node.
+
+The node of a request is the node that is being processed by the thread that sends
+it (see node_scope). Work that is handed over to another thread should be wrapped
+with bind() to keep its node.
+"""
+
+import functools
+import json
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional, TypeVar
+from urllib.parse import parse_qs, unquote, urlparse
+
+import requests
+
+_local = threading.local()
+_TOTAL = re.compile(rb'"total"\s*:\s*(\d+)')
+
+T = TypeVar("T")
+
+
+@contextmanager
+def node_scope(node_code: Optional[str]):
+    """Attributes the requests that are sent by this thread to a node."""
+    previous = current_node()
+    _local.node = node_code
+    try:
+        yield
+    finally:
+        _local.node = previous
+
+
+@contextmanager
+def no_scope():
+    """A scope that does nothing, like contextlib.nullcontext (Python 3.7+)."""
+    yield
+
+
+@contextmanager
+def writing_rows(rows: int):
+    """
+    Tells the records of the requests that this thread sends in the block how many
+    rows they write or delete, so the request bodies don't have to be decoded again.
+    """
+    previous = getattr(_local, "rows", None)
+    _local.rows = rows
+    try:
+        yield
+    finally:
+        _local.rows = previous
+
+
+def node_scoped(method: Callable[..., T]) -> Callable[..., T]:
+    """
+    Decorator for methods that process a single node, passed as the first argument.
+    Runs the method in the scope of that node.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, node, *args, **kwargs) -> T:
+        with node_scope(node.code):
+            return method(self, node, *args, **kwargs)
+
+    return wrapper
+
+
+def current_node() -> Optional[str]:
+    return getattr(_local, "node", None)
+
+
+def bind(function: Callable[..., T]) -> Callable[..., T]:
+    """
+    Returns a function that runs in the node scope of the current thread, no matter
+    which thread calls it.
+    """
+    node_code = current_node()
+
+    def bound(*args, **kwargs) -> T:
+        with node_scope(node_code):
+            return function(*args, **kwargs)
+
+    return bound
+
+
+@dataclass(frozen=True)
+class RequestRecord:
+    """
+    A single request to a MOLGENIS server.
+    """
+
+    method: str
+    endpoint: str
+    entity_type: Optional[str]
+    rows: int
+    request_bytes: int
+    response_bytes: int
+    latency: float
+    status: int
+    node: Optional[str] = None
+
+    @staticmethod
+    def of(response: requests.Response) -> "RequestRecord":
+        """
+        Creates a record of a response. Reads the content of the response, which
+        would otherwise be read right after. The latency includes reading the
+        content.
+        """
+        started = time.perf_counter()
+        content = response.content or b""
+        latency = response.elapsed.total_seconds() + time.perf_counter() - started
+
+        request = response.request
+        body = request.body or b""
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        endpoint, entity_type = _parse_path(request.url)
+
+        return RequestRecord(
+            method=request.method,
+            endpoint=endpoint,
+            entity_type=entity_type,
+            rows=_count_rows(request.method, request.url, content),
+            request_bytes=len(body),
+            response_bytes=len(content),
+            latency=latency,
+            status=response.status_code,
+            node=current_node(),
+        )
+
+
+class RequestStats:
+    """
+    Collects RequestRecords and aggregates them per run, per node, per table and per
+    table of a node. Can be shared by sessions and threads.
+
+    >>> stats = RequestStats()
+    >>> session.instrument(stats.record)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records: List[RequestRecord] = list()
+
+    def record(self, record: RequestRecord):
+        with self._lock:
+            self._records.append(record)
+
+    @property
+    def records(self) -> List[RequestRecord]:
+        with self._lock:
+            return list(self._records)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+    def summary(self) -> dict:
+        """
+        Returns the aggregated statistics of the whole run, per node, per table and
+        per table of every node (under "tables" of the node): the number of requests
+        and rows, the bytes sent and received, the number of errors (status 400 and
+        up) and the latency percentiles in seconds.
+        """
+        records = self.records
+        by_node_table = defaultdict(list)
+        for record in records:
+            key = (record.node or "-", record.entity_type or "-")
+            by_node_table[key].append(record)
+
+        nodes = defaultdict(dict)
+        tables = defaultdict(list)
+        for (node, table), table_records in sorted(by_node_table.items()):
+            nodes[node][table] = table_records
+            tables[table] += table_records
+
+        return {
+            "run": _aggregate(records),
+            "nodes": {
+                node: dict(
+                    _aggregate([r for rs in node_tables.values() for r in rs]),
+                    tables={table: _aggregate(rs) for table, rs in node_tables.items()},
+                )
+                for node, node_tables in nodes.items()
+            },
+            "tables": {table: _aggregate(rs) for table, rs in sorted(tables.items())},
+        }
+
+    def save(self, path: str, include_records: bool = False):
+        """
+        Writes the summary to a JSON file.
+
+        :param str path: the file to write to
+        :param bool include_records: if True, every single request is written too
+        """
+        document = self.summary()
+        if include_records:
+            document["records"] = [asdict(record) for record in self.records]
+        with open(path, "w") as file:
+            json.dump(document, file, indent=2)
+
+
+def _aggregate(records: List[RequestRecord]) -> Dict[str, float]:
+    latencies = sorted(record.latency for record in records)
+    return {
+        "requests": len(records),
+        "rows": sum(record.rows for record in records),
+        "request_bytes": sum(record.request_bytes for record in records),
+        "response_bytes": sum(record.response_bytes for record in records),
+        "errors": sum(1 for record in records if record.status >= 400),
+        "latency_total": sum(latencies),
+        "latency_p50": _percentile(latencies, 50),
+        "latency_p90": _percentile(latencies, 90),
+        "latency_p99": _percentile(latencies, 99),
+        "latency_max": latencies[-1] if latencies else 0.0,
+    }
+
+
+def _percentile(sorted_values: List[float], percentile: float) -> float:
+    """Nearest-rank percentile of a sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * percentile // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def _parse_path(url: str):
+    """
+    Returns the endpoint (for example 'v2' or 'metadata') and the entity type of a
+    MOLGENIS API URL.
+    """
+    path = urlparse(url).path
+    _, _, api_path = path.partition("/api/")
+    parts = [unquote(part) for part in api_path.split("/") if part]
+    if not parts:
+        return path, None
+    return parts[0], parts[1] if len(parts) > 1 else None
+
+
+def _count_rows(method: str, url: str, content: bytes) -> int:
+    """
+    Counts the rows that were sent or received. Written or deleted rows are counted
+    by the sender (see writing_rows). Retrieved rows are derived from the total in
+    the response and the requested page, to avoid decoding the response twice.
+    """
+    if method != "GET":
+        return getattr(_local, "rows", None) or 0
+
+    match = _TOTAL.search(content)
+    if not match:
+        return 0
+    query = parse_qs(urlparse(url).query)
+    start = int(query.get("start", ["0"])[0])
+    num = int(query.get("num", ["100"])[0])
+    return max(0, min(num, int(match.group(1)) - start))
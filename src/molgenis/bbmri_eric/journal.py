@@ -0,0 +1,115 @@
+"""
+A checkpoint journal keeps track of the batches that the directory acknowledged while
+publishing. When publishing fails halfway, the next run with the same journal skips
+the batches that were already written and continues where the failed run stopped.
+
+The journal is a JSON lines file. Every line is a completed batch:
+
+    {"node": "NL", "table": "eu_bbmri_eric_persons", "operation": "upsert",
+     "hash": "<sha256 of the batch content>"}
+
+A batch is only skipped if its content is exactly the same as before, so changes to
+the staging data between two runs are never lost.
+"""
+import hashlib
+import json
+import os
+import threading
+from typing import Iterable, Set, Tuple
+
+from molgenis.bbmri_eric.model import Node
+
+_Key = Tuple[str, str, str, str]
+
+
+class CheckpointJournal:
+    """
+    Records completed batches in a JSON lines file. A journal can be shared by nodes
+    that are published concurrently.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param str path: the journal file, is created if it doesn't exist
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._done: Set[_Key] = set()
+
+        if os.path.exists(path):
+            with open(path) as file:
+                for line in file:
+                    if line.strip():
+                        self._done.add(self._to_key(json.loads(line)))
+
+    def checkpoint(self, node: Node, table_id: str) -> "Checkpoint":
+        """Returns a Checkpoint for the batches of one node's table."""
+        return Checkpoint(self, node.code, table_id)
+
+    def is_done(
+        self, node_code: str, table_id: str, operation: str, hash_: str
+    ) -> bool:
+        with self._lock:
+            return (node_code, table_id, operation, hash_) in self._done
+
+    def record(self, node_code: str, table_id: str, operation: str, hash_: str):
+        entry = {
+            "node": node_code,
+            "table": table_id,
+            "operation": operation,
+            "hash": hash_,
+        }
+        with self._lock:
+            self._done.add(self._to_key(entry))
+            with open(self.path, "a") as file:
+                file.write(json.dumps(entry) + "\n")
+
+    def clear(self, node: Node):
+        """Forgets the batches of a node, for example after it was published."""
+        with self._lock:
+            self._done = {key for key in self._done if key[0] != node.code}
+            with open(self.path, "w") as file:
+                for key in sorted(self._done):
+                    file.write(json.dumps(self._to_entry(key)) + "\n")
+
+    def __len__(self):
+        with self._lock:
+            return len(self._done)
+
+    @staticmethod
+    def _to_key(entry: dict) -> _Key:
+        return entry["node"], entry["table"], entry["operation"], entry["hash"]
+
+    @staticmethod
+    def _to_entry(key: _Key) -> dict:
+        return dict(zip(("node", "table", "operation", "hash"), key))
+
+
+class Checkpoint:
+    """
+    The part of a CheckpointJournal that belongs to one table of one node. Keeps count
+    of the batches that were skipped because they were already done.
+    """
+
+    def __init__(self, journal: CheckpointJournal, node_code: str, table_id: str):
+        self.journal = journal
+        self.node_code = node_code
+        self.table_id = table_id
+        self.skipped = 0
+
+    def is_done(self, operation: str, batch: Iterable) -> bool:
+        done = self.journal.is_done(
+            self.node_code, self.table_id, operation, hash_batch(batch)
+        )
+        if done:
+            self.skipped += 1
+        return done
+
+    def record(self, operation: str, batch: Iterable):
+        self.journal.record(self.node_code, self.table_id, operation, hash_batch(batch))
+
+
+def hash_batch(batch: Iterable) -> str:
+    """Returns the SHA-256 hash of the content of a batch of rows or identifiers."""
+    content = json.dumps(list(batch), sort_keys=True, default=dict)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
@@ -0,0 +1,411 @@
+import functools
+import mmap
+import os
+import sys
+import threading
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, DefaultDict, Dict, List, Optional, TypeVar
+
+from molgenis.bbmri_eric.errors import EricError
+from molgenis.bbmri_eric.instrumentation import current_node
+from molgenis.bbmri_eric.model import NodeData, Table
+
+T = TypeVar("T")
+
+WORKING_SET_FACTOR = 3
+"""
+Publishing a node holds its staging data, its published data and copies of the rows
+that are added. Together these are estimated at three times the staging data.
+"""
+
+ROW_SIZE = 2048
+"""
+The estimated number of bytes of a staging row, used to reserve memory for a node
+before its data is retrieved, until the size of retrieved rows is known.
+"""
+
+
+class MemoryBudgetExceeded(EricError):
+    """Raised when data doesn't fit in the memory budget."""
+
+    pass
+
+
+class MemoryBudget:
+    """
+    Keeps track of the memory used by the node data that is held while publishing.
+    Memory is reserved before data is held and released when the data is dropped. The
+    sizes are estimates (see estimate_size), not measurements.
+
+    Before a node's data is retrieved, its size is estimated from its number of rows
+    (see estimate_rows), so a node that doesn't fit is refused before it's loaded.
+    """
+
+    def __init__(self, limit: int):
+        """
+        :param int limit: the maximum number of bytes of node data held at once
+        """
+        self.limit = limit
+        self._reserved = 0
+        self._shared: Dict[str, int] = dict()
+        self._row_size: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def reserved(self) -> int:
+        with self._lock:
+            return self._reserved
+
+    @property
+    def available(self) -> int:
+        with self._lock:
+            return self.limit - self._reserved
+
+    def try_reserve(self, size: int) -> bool:
+        """Reserves memory if it's available. Returns whether it was reserved."""
+        with self._lock:
+            if self._reserved + size > self.limit:
+                return False
+            self._reserved += size
+            return True
+
+    def reserve(self, size: int, description: str):
+        """
+        Reserves memory. Raises a MemoryBudgetExceeded error if it's not available.
+
+        :param int size: the number of bytes to reserve
+        :param str description: a description of the data, used in the error message
+        """
+        if not self.try_reserve(size):
+            raise MemoryBudgetExceeded(
+                f"Not enough memory for {description}: needs {_mb(size)}, "
+                f"{_mb(self.available)} of the {_mb(self.limit)} budget is available"
+            )
+
+    def reserve_shared(self, key: str, size: Callable[[], int], description: str):
+        """
+        Reserves memory for data that is shared and kept, like the data of node EU.
+        Memory is only reserved the first time for each key and is never released.
+
+        :param str key: identifies the data
+        :param size: function that returns the number of bytes to reserve
+        :param str description: a description of the data, used in the error message
+        """
+        with self._lock:
+            if key in self._shared:
+                return
+        size = size()
+        self.reserve(size, description)
+        with self._lock:
+            self._shared[key] = size
+
+    def release(self, size: int):
+        with self._lock:
+            self._reserved = max(0, self._reserved - size)
+
+    def estimate_rows(self, rows: int) -> int:
+        """
+        Returns the memory that is needed to publish a node with a number of staging
+        rows. The rows are as large as the largest rows on average of the node data
+        that was recorded (see record_row_size), or ROW_SIZE before any was recorded.
+        """
+        with self._lock:
+            row_size = self._row_size or ROW_SIZE
+        return rows * row_size * WORKING_SET_FACTOR
+
+    def record_row_size(self, node_data: NodeData, size: int):
+        """
+        Records the estimated size of retrieved node data, to estimate the size of
+        the nodes that follow.
+        """
+        rows = sum(len(table.rows_by_id) for table in node_data.import_order)
+        if rows:
+            with self._lock:
+                self._row_size = max(self._row_size or 0, size // rows)
+
+
+def estimate_size(node_data: NodeData) -> int:
+    """
+    Returns an estimate of the number of bytes used by the rows and the metadata of
+    the tables of a NodeData object. Values that are shared between rows are counted
+    for every row, so the estimate is on the high side.
+    """
+    return sum(estimate_size_of_table(table) for table in node_data.import_order)
+
+
+def estimate_size_of_table(table: Table) -> int:
+    """Returns an estimate of the number of bytes used by a single table."""
+    size = _deep_size(table.meta.meta) + sys.getsizeof(table.rows_by_id)
+    for row in table.rows_by_id.values():
+        size += sys.getsizeof(row)
+        for value in row.values():
+            size += _deep_size(value)
+    return size
+
+
+def _deep_size(value) -> int:
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_deep_size(k) + _deep_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_deep_size(item) for item in value)
+    return size
+
+
+def _mb(size: int) -> str:
+    return f"{size / 1024 / 1024:.1f} MB"
+
+
+# The tracker below measures memory, while the budget above estimates it.
+
+
+@dataclass(eq=False)
+class _Scope:
+    """A phase or site of which the peak memory is being measured."""
+
+    start: int
+    peak: int
+
+
+_tracker: Optional["MemoryTracker"] = None
+
+
+class MemoryTracker:
+    """
+    Records the memory high-water marks of the phases of every node: the peak of the
+    memory allocated by Python (traced with tracemalloc) and the resident set size of
+    the process. For every phase, the allocation sites that grew the most are recorded,
+    as well as the peaks of the functions that are known to copy a lot of data (see
+    tracked()) and the sizes of the tables of the retrieved node data.
+
+    Tracing starts at the first phase and goes on until stop() is called. Tracing slows
+    down the run considerably. The memory of a process is shared by its threads, so in
+    concurrent runs a peak is attributed to every phase that was running at the time.
+    """
+
+    def __init__(self, top: int = 5):
+        """
+        :param int top: the number of allocation sites to record per phase, 0 to skip
+                        the snapshots that are needed to find them
+        """
+        self.top = top
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._scopes: List[_Scope] = list()
+        self._started = False
+        self._phases: DefaultDict[str, Dict[str, dict]] = defaultdict(dict)
+        self._tables: DefaultDict[str, Dict[str, Dict[str, int]]] = defaultdict(
+            lambda: defaultdict(dict)
+        )
+
+    @contextmanager
+    def phase(self, name: str):
+        """Measures the peak memory of a phase of the current node."""
+        self._activate()
+        phases = self._phases_of_thread()
+        before = self._take_snapshot() if self.top and not phases else None
+        rss = _rss()
+        scope = self._enter()
+        phases.append(name)
+        try:
+            yield
+        finally:
+            phases.pop()
+            self._exit(scope)
+            after = self._take_snapshot() if before else None
+            self._add_phase(
+                current_node() or "-",
+                name,
+                scope,
+                max(rss or 0, _rss() or 0),
+                _top_sites(after, before, self.top) if before else [],
+            )
+
+    @contextmanager
+    def site(self, name: str):
+        """Measures the peak memory of a function that is called in a phase."""
+        scope = self._enter()
+        try:
+            yield
+        finally:
+            self._exit(scope)
+            phases = self._phases_of_thread()
+            node, phase = current_node() or "-", phases[-1] if phases else "-"
+            with self._lock:
+                sites = self._phases[node].setdefault(phase, _phase())["sites"]
+                sites[name] = max(sites.get(name, 0), scope.peak - scope.start)
+
+    def add_tables(self, node_data: NodeData):
+        """Records the estimated sizes of the tables of retrieved node data."""
+        sizes = {
+            table.type.value: estimate_size_of_table(table)
+            for table in node_data.import_order
+        }
+        with self._lock:
+            self._tables[node_data.node.code][node_data.source.value].update(sizes)
+
+    def stop(self):
+        """Stops tracing, if it was started by this tracker."""
+        global _tracker
+        with self._lock:
+            if _tracker is self:
+                _tracker = None
+            if self._started:
+                tracemalloc.stop()
+                self._started = False
+
+    def to_dict(self) -> dict:
+        """
+        Returns the measurements per node: the peak, growth and RSS in bytes of every
+        phase, with its largest allocation sites and tracked functions, and the
+        estimated sizes of the tables in bytes per source.
+        """
+        with self._lock:
+            nodes = sorted(set(self._phases) | set(self._tables))
+            return {
+                node: {
+                    "phases": {
+                        phase: {
+                            "peak": values["peak"],
+                            "growth": values["growth"],
+                            "rss": values["rss"],
+                            "sites": dict(values["sites"]),
+                            "top": list(values["top"]),
+                        }
+                        for phase, values in self._phases.get(node, {}).items()
+                    },
+                    "tables": {
+                        source: dict(sizes)
+                        for source, sizes in self._tables.get(node, {}).items()
+                    },
+                }
+                for node in nodes
+            }
+
+    def _activate(self):
+        global _tracker
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started = True
+            _tracker = self
+
+    def _phases_of_thread(self) -> List[str]:
+        if not hasattr(self._local, "phases"):
+            self._local.phases = list()
+        return self._local.phases
+
+    def _enter(self) -> _Scope:
+        with self._lock:
+            self._update_peaks()
+            current, _ = tracemalloc.get_traced_memory()
+            scope = _Scope(start=current, peak=current)
+            self._scopes.append(scope)
+            return scope
+
+    def _exit(self, scope: _Scope):
+        with self._lock:
+            self._update_peaks()
+            self._scopes.remove(scope)
+
+    def _update_peaks(self):
+        """
+        Adds the peak since the last update to the running scopes and starts a new
+        peak. Without tracemalloc.reset_peak (Python < 3.9) the peak is the peak since
+        tracing started.
+        """
+        _, peak = tracemalloc.get_traced_memory()
+        for scope in self._scopes:
+            scope.peak = max(scope.peak, peak)
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+
+    def _add_phase(self, node: str, name: str, scope: _Scope, rss: int, top: list):
+        with self._lock:
+            values = self._phases[node].setdefault(name, _phase())
+            values["peak"] = max(values["peak"], scope.peak)
+            values["growth"] = max(values["growth"], scope.peak - scope.start)
+            values["rss"] = max(values["rss"], rss)
+            values["top"] = _merge_sites(values["top"], top, self.top)
+
+    @staticmethod
+    def _take_snapshot() -> Optional[tracemalloc.Snapshot]:
+        if not tracemalloc.is_tracing():
+            return None
+        return tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<unknown>"),
+            )
+        )
+
+
+def tracked(name: str) -> Callable[[Callable[..., T]], Callable[..., T]]:
+    """
+    Decorator for functions that copy a lot of data. When a MemoryTracker is tracing,
+    the peak memory of every call is recorded as a site of the current phase.
+    """
+
+    def decorator(function: Callable[..., T]) -> Callable[..., T]:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs) -> T:
+            tracker = _tracker
+            if tracker is None:
+                return function(*args, **kwargs)
+            with tracker.site(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _phase() -> dict:
+    return {"peak": 0, "growth": 0, "rss": 0, "sites": dict(), "top": list()}
+
+
+def _top_sites(
+    after: Optional[tracemalloc.Snapshot],
+    before: tracemalloc.Snapshot,
+    top: int,
+) -> List[dict]:
+    """Returns the allocation sites that grew the most between two snapshots."""
+    if after is None:
+        return []
+    sites = list()
+    for diff in after.compare_to(before, "lineno")[:top]:
+        if diff.size_diff <= 0:
+            break
+        frame = diff.traceback[0]
+        sites.append(
+            {
+                "location": f"{os.path.basename(frame.filename)}:{frame.lineno}",
+                "size": diff.size_diff,
+                "count": diff.count_diff,
+            }
+        )
+    return sites
+
+
+def _merge_sites(sites: List[dict], other: List[dict], top: int) -> List[dict]:
+    """Merges the sites of repeated phases, keeping the largest growth per site."""
+    by_location = {site["location"]: site for site in sites}
+    for site in other:
+        if site["size"] > by_location.get(site["location"], {}).get("size", 0):
+            by_location[site["location"]] = site
+    return sorted(by_location.values(), key=lambda site: site["size"], reverse=True)[
+        :top
+    ]
+
+
+def _rss() -> Optional[int]:
+    """Returns the resident set size of the process, if it's available (Linux)."""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * mmap.PAGESIZE
+    except (OSError, ValueError, IndexError):
+        return None
@@ -0,0 +1,332 @@
+"""
+Metrics of staging and publishing runs: the duration of every phase and the number of
+rows, warnings and PID operations per node. The node is the node that is being
+processed by the current thread (see instrumentation.node_scope). Work that isn't
+done for a single node, like combined upserts, is recorded under node "-".
+
+Memory high-water marks are recorded too if the metrics are given a MemoryTracker.
+
+Metrics can be written as a JSON document and as a Prometheus text format file, for
+example to be picked up by the node exporter's textfile collector.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import DefaultDict, Dict, List, Optional
+
+from molgenis.bbmri_eric.errors import ErrorReport
+from molgenis.bbmri_eric.instrumentation import RequestStats, current_node, no_scope
+from molgenis.bbmri_eric.memory import MemoryTracker
+from molgenis.bbmri_eric.model import NodeData
+
+PHASES = (
+    "stage",
+    "fetch",
+    "validate",
+    "fetch_published",
+    "enrich",
+    "pids",
+    "upsert",
+    "delete",
+)
+"""The phases that are timed, in the order in which they occur"""
+
+COUNTERS = ("rows_read", "rows_written", "rows_deleted", "pid_operations")
+"""The counters that are kept per node, besides the warnings"""
+
+
+class Metrics:
+    """
+    Records the durations of the phases and the counters per node. Can be shared by
+    threads.
+    """
+
+    def __init__(
+        self,
+        requests: Optional[RequestStats] = None,
+        memory: Optional[MemoryTracker] = None,
+    ):
+        """
+        :param RequestStats requests: if provided, the request statistics are
+                                      exported with the metrics
+        :param MemoryTracker memory: if provided, the memory of every phase is
+                                     measured and exported with the metrics
+        """
+        self.requests = requests
+        self.memory = memory
+        self.started = time.time()
+        self.finished: Optional[float] = None
+        self._lock = threading.Lock()
+        self._phases: DefaultDict[str, Dict[str, float]] = defaultdict(dict)
+        self._counters: DefaultDict[str, Dict[str, int]] = defaultdict(dict)
+        self._statuses: Dict[str, str] = dict()
+        self._warnings: Dict[str, int] = dict()
+
+    @contextmanager
+    def phase(self, name: str):
+        """Times a phase of the current node. Repeated phases are added up."""
+        started = time.perf_counter()
+        try:
+            with self.memory.phase(name) if self.memory else no_scope():
+                yield
+        finally:
+            self.add_duration(name, time.perf_counter() - started)
+
+    def add_duration(self, phase: str, seconds: float):
+        node = current_node() or "-"
+        with self._lock:
+            phases = self._phases[node]
+            phases[phase] = phases.get(phase, 0.0) + seconds
+
+    def count(self, counter: str, value: int = 1):
+        """Adds a value to a counter of the current node."""
+        node = current_node() or "-"
+        with self._lock:
+            counters = self._counters[node]
+            counters[counter] = counters.get(counter, 0) + value
+
+    def add_node_data(self, node_data: NodeData):
+        """Records the number of rows and, if memory is measured, the size of
+        retrieved node data."""
+        self.count(
+            "rows_read", sum(len(table.rows_by_id) for table in node_data.import_order)
+        )
+        if self.memory:
+            self.memory.add_tables(node_data)
+
+    def add_report(self, report: ErrorReport):
+        """Records the outcome and the number of warnings of the nodes of a run."""
+        with self._lock:
+            for node in report.nodes:
+                self._statuses[node.code] = "error" if node in report.errors else "ok"
+                self._warnings[node.code] = len(report.warnings.get(node, []))
+            self.finished = time.time()
+
+    @property
+    def enabled(self) -> bool:
+        return True
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            nodes = sorted(
+                set(self._phases) | set(self._counters) | set(self._statuses)
+            )
+            finished = self.finished or time.time()
+            document = {
+                "started": self.started,
+                "duration": finished - self.started,
+                "nodes": {
+                    node: {
+                        "status": self._statuses.get(node),
+                        "warnings": self._warnings.get(node, 0),
+                        "phases": dict(self._phases.get(node, {})),
+                        "counters": dict(self._counters.get(node, {})),
+                    }
+                    for node in nodes
+                },
+            }
+        if self.requests:
+            document["requests"] = self.requests.summary()
+        if self.memory:
+            document["memory"] = self.memory.to_dict()
+        return document
+
+    def to_prometheus(self) -> str:
+        """Returns the metrics in the Prometheus text format."""
+        document = self.to_dict()
+        nodes = document["nodes"]
+        lines = _gauge(
+            "eric_run_duration_seconds",
+            "Duration of the run",
+            [({}, document["duration"])],
+        )
+        lines += _gauge(
+            "eric_phase_duration_seconds",
+            "Duration of a phase of a node",
+            [
+                ({"node": node, "phase": phase}, seconds)
+                for node, values in nodes.items()
+                for phase, seconds in values["phases"].items()
+            ],
+        )
+        lines += _gauge(
+            "eric_rows",
+            "Number of rows read, written or deleted for a node",
+            [
+                ({"node": node, "operation": counter[len("rows_") :]}, value)
+                for node, values in nodes.items()
+                for counter, value in values["counters"].items()
+                if counter.startswith("rows_")
+            ],
+        )
+        lines += _gauge(
+            "eric_pid_operations",
+            "Number of operations on the handle server for a node",
+            [
+                ({"node": node}, values["counters"]["pid_operations"])
+                for node, values in nodes.items()
+                if "pid_operations" in values["counters"]
+            ],
+        )
+        lines += _gauge(
+            "eric_warnings",
+            "Number of warnings of a node",
+            [
+                ({"node": node}, values["warnings"])
+                for node, values in nodes.items()
+                if values["status"]
+            ],
+        )
+        lines += _gauge(
+            "eric_node_success",
+            "1 if the node was processed successfully, 0 if it failed",
+            [
+                ({"node": node}, 1 if values["status"] == "ok" else 0)
+                for node, values in nodes.items()
+                if values["status"]
+            ],
+        )
+        if "requests" in document:
+            lines += _request_gauges(document["requests"])
+        if "memory" in document:
+            lines += _memory_gauges(document["memory"])
+        return "\n".join(lines) + "\n"
+
+    def save(self, directory: str, name: str = "metrics"):
+        """
+        Writes the metrics to <name>.json and <name>.prom in a directory.
+
+        :param str directory: the directory to write to, is created if needed
+        :param str name: the name of the files, without extension
+        """
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"{name}.json"), "w") as file:
+            json.dump(self.to_dict(), file, indent=2)
+        with open(os.path.join(directory, f"{name}.prom"), "w") as file:
+            file.write(self.to_prometheus())
+
+
+class NoOpMetrics(Metrics):
+    """
+    Records nothing. Used when metrics are turned off.
+    """
+
+    def phase(self, name: str):
+        return no_scope()
+
+    def add_duration(self, phase: str, seconds: float):
+        pass
+
+    def count(self, counter: str, value: int = 1):
+        pass
+
+    def add_node_data(self, node_data: NodeData):
+        pass
+
+    def add_report(self, report: ErrorReport):
+        pass
+
+    @property
+    def enabled(self) -> bool:
+        return False
+
+
+def _gauge(name: str, help_: str, samples: List[tuple]) -> List[str]:
+    if not samples:
+        return []
+    lines = [f"# HELP {name} {help_}", f"# TYPE {name} gauge"]
+    for labels, value in samples:
+        label_text = ",".join(
+            f'{key}="{_escape(str(label))}"' for key, label in labels.items()
+        )
+        lines.append(f"{name}{{{label_text}}} {value}" if labels else f"{name} {value}")
+    return lines
+
+
+def _request_gauges(requests: dict) -> List[str]:
+    nodes = requests["nodes"]
+    lines = _gauge(
+        "eric_requests",
+        "Number of requests to the directory for a node",
+        [({"node": node}, values["requests"]) for node, values in nodes.items()],
+    )
+    lines += _gauge(
+        "eric_request_bytes",
+        "Number of bytes sent to and received from the directory for a node",
+        [
+            ({"node": node, "direction": direction}, values[f"{direction}_bytes"])
+            for node, values in nodes.items()
+            for direction in ("request", "response")
+        ],
+    )
+    lines += _gauge(
+        "eric_request_latency_seconds",
+        "Latency percentiles of the requests to the directory for a node",
+        [
+            ({"node": node, "quantile": quantile}, values[f"latency_p{percentile}"])
+            for node, values in nodes.items()
+            for quantile, percentile in (("0.5", 50), ("0.9", 90), ("0.99", 99))
+        ],
+    )
+    return lines
+
+
+def _memory_gauges(memory: dict) -> List[str]:
+    phases = [
+        (node, phase, values)
+        for node, node_values in memory.items()
+        for phase, values in node_values["phases"].items()
+    ]
+    lines = _gauge(
+        "eric_memory_peak_bytes",
+        "Peak of the memory allocated by Python during a phase of a node",
+        [
+            ({"node": node, "phase": phase}, values["peak"])
+            for node, phase, values in phases
+        ],
+    )
+    lines += _gauge(
+        "eric_memory_growth_bytes",
+        "Peak memory allocated by Python on top of the memory at the start of a phase",
+        [
+            ({"node": node, "phase": phase}, values["growth"])
+            for node, phase, values in phases
+        ],
+    )
+    lines += _gauge(
+        "eric_memory_rss_bytes",
+        "Resident set size of the process during a phase of a node",
+        [
+            ({"node": node, "phase": phase}, values["rss"])
+            for node, phase, values in phases
+            if values["rss"]
+        ],
+    )
+    lines += _gauge(
+        "eric_memory_site_peak_bytes",
+        "Peak memory allocated by a tracked function during a phase of a node",
+        [
+            ({"node": node, "phase": phase, "site": site}, size)
+            for node, phase, values in phases
+            for site, size in values["sites"].items()
+        ],
+    )
+    lines += _gauge(
+        "eric_memory_table_bytes",
+        "Estimated size of a table of the retrieved data of a node",
+        [
+            ({"node": node, "source": source, "table": table}, size)
+            for node, node_values in memory.items()
+            for source, tables in node_values["tables"].items()
+            for table, size in tables.items()
+        ],
+    )
+    return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -1,8 +1,11 @@
+import sys
+import threading
 import typing
 from collections import OrderedDict
-from dataclasses import dataclass
+from collections.abc import Mapping, MutableMapping, Sequence
+from dataclasses import asdict, dataclass
 from enum import Enum
-from typing import Dict, List
+from typing import Dict, Iterable, List, Optional
 
 
 class TableType(Enum):
@@ -22,38 +25,355 @@ class TableType(Enum):
         return f"eu_bbmri_eric_{self.value}"
 
 
+class AttributeType:
+    """Groups of MOLGENIS attribute types that are treated the same way."""
+
+    SINGLE_REFERENCES = frozenset({"xref", "categorical", "file"})
+    MULTI_REFERENCES = frozenset({"mref", "categoricalmref", "onetomany"})
+    REFERENCES = SINGLE_REFERENCES | MULTI_REFERENCES
+
+
+@dataclass(frozen=True)
+class TableSchema:
+    """
+    Compiled form of a table's metadata. Walking the attributes of the metadata API
+    output is done once, so that hot loops can look up attribute information directly.
+    """
+
+    id: str
+    id_attribute: typing.Optional[str]
+    attribute_names: typing.Tuple[str, ...]
+    types: Dict[str, str]
+    """Dictionary of attribute names and their MOLGENIS types"""
+
+    ref_entity_types: Dict[str, str]
+    """Dictionary of reference attribute names and the ids of the tables they refer
+    to"""
+
+    single_references: typing.FrozenSet[str]
+    """Attributes that refer to one row (xref, categorical, file)"""
+
+    multi_references: typing.FrozenSet[str]
+    """Attributes that refer to multiple rows (mref, categoricalmref, onetomany)"""
+
+    one_to_manys: typing.FrozenSet[str]
+    self_references: typing.FrozenSet[str]
+    nullable: typing.FrozenSet[str]
+    required: typing.FrozenSet[str]
+
+    @property
+    def references(self) -> typing.FrozenSet[str]:
+        return self.single_references | self.multi_references
+
+    @staticmethod
+    def compile(meta: dict) -> "TableSchema":
+        """Factory method that compiles the output of the metadata API."""
+        table_id = meta["data"]["id"]
+        id_attribute = None
+        names = []
+        types = dict()
+        ref_entity_types = dict()
+        self_references = set()
+        nullable = set()
+
+        for attribute in meta["data"]["attributes"]["items"]:
+            data = attribute["data"]
+            name = data["name"]
+            type_ = data["type"]
+            names.append(name)
+            types[name] = type_
+
+            if data.get("idAttribute") is True and id_attribute is None:
+                id_attribute = name
+            if data.get("nullable", True):
+                nullable.add(name)
+
+            ref_url = data.get("refEntityType", dict()).get("self")
+            if ref_url:
+                ref_entity_types[name] = ref_url.rstrip("/").split("/")[-1]
+                if type_ in ("xref", "mref") and table_id in ref_url:
+                    self_references.add(name)
+
+        def of_types(types_: typing.AbstractSet[str]) -> typing.FrozenSet[str]:
+            return frozenset(name for name in names if types[name] in types_)
+
+        return TableSchema(
+            id=table_id,
+            id_attribute=id_attribute,
+            attribute_names=tuple(names),
+            types=types,
+            ref_entity_types=ref_entity_types,
+            single_references=of_types(AttributeType.SINGLE_REFERENCES),
+            multi_references=of_types(AttributeType.MULTI_REFERENCES),
+            one_to_manys=of_types({"onetomany"}),
+            self_references=frozenset(self_references),
+            nullable=frozenset(nullable),
+            required=frozenset(names).difference(nullable),
+        )
+
+
 @dataclass(frozen=True)
 class TableMeta:
     """Convenient wrapper for the output of the metadata API."""
 
     meta: dict
 
+    @property
+    def schema(self) -> TableSchema:
+        """The compiled metadata. Compiled on first access and cached afterwards."""
+        schema = self.__dict__.get("_schema")
+        if schema is None:
+            schema = TableSchema.compile(self.meta)
+            object.__setattr__(self, "_schema", schema)
+        return schema
+
     @property
     def id(self):
         return self.meta["data"]["id"]
 
+    @property
+    def attribute_names(self) -> List[str]:
+        return list(self.schema.attribute_names)
+
     @property
     def id_attribute(self):
-        for attribute in self.meta["data"]["attributes"]["items"]:
-            if attribute["data"]["idAttribute"] is True:
-                return attribute["data"]["name"]
+        return self.schema.id_attribute
 
     @property
     def one_to_manys(self) -> List[str]:
-        one_to_manys = []
-        for attribute in self.meta["data"]["attributes"]["items"]:
-            if attribute["data"]["type"] == "onetomany":
-                one_to_manys.append(attribute["data"]["name"])
-        return one_to_manys
+        return [
+            name
+            for name in self.schema.attribute_names
+            if name in self.schema.one_to_manys
+        ]
 
     @property
     def self_references(self) -> List[str]:
-        self_references = []
-        for attribute in self.meta["data"]["attributes"]["items"]:
-            if attribute["data"]["type"] in ("xref", "mref"):
-                if self.id in attribute["data"]["refEntityType"]["self"]:
-                    self_references.append(attribute["data"]["name"])
-        return self_references
+        return [
+            name
+            for name in self.schema.attribute_names
+            if name in self.schema.self_references
+        ]
+
+    def __getstate__(self) -> dict:
+        return {"meta": self.meta}
+
+
+_MISSING = object()
+"""Marks an attribute that has no value in a Row."""
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+class RowSchema:
+    """
+    The attribute names of a table, shared by all of its rows. A row only stores its
+    values, at the position of the attribute in the schema. The schema is append-only:
+    setting an unknown attribute on a row adds it to the end of the schema.
+    """
+
+    __slots__ = ("names", "positions", "_lock")
+
+    def __init__(self, names: Iterable[str] = ()):
+        self.names: List[str] = []
+        self.positions: Dict[str, int] = dict()
+        self._lock = threading.Lock()
+        for name in names:
+            self.add(name)
+
+    def add(self, name: str) -> int:
+        position = self.positions.get(name)
+        if position is None:
+            # rows can be shared between nodes that are published concurrently
+            with self._lock:
+                position = self.positions.get(name)
+                if position is None:
+                    position = len(self.names)
+                    self.names.append(name)
+                    self.positions[name] = position
+        return position
+
+    def __reduce__(self):
+        return RowSchema, (list(self.names),)
+
+
+class Row(MutableMapping):
+    """
+    A compact, dict-compatible row. The attribute names are stored once in a shared
+    RowSchema, the row itself only keeps a list of values.
+    """
+
+    __slots__ = ("_schema", "_values")
+
+    def __init__(self, schema: RowSchema, values: list = None):
+        self._schema = schema
+        self._values = values if values is not None else []
+
+    @staticmethod
+    def of(schema: RowSchema, row: Mapping) -> "Row":
+        """Factory method that converts a dict to a Row of the provided schema."""
+        if isinstance(row, Row) and row._schema is schema:
+            return row
+
+        positions = [schema.add(name) for name in row]
+        values = [_MISSING] * (max(positions) + 1 if positions else 0)
+        for position, value in zip(positions, row.values()):
+            values[position] = value
+        return Row(schema, values)
+
+    def __getitem__(self, key):
+        position = self._schema.positions.get(key)
+        if position is None or position >= len(self._values):
+            raise KeyError(key)
+        value = self._values[position]
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        position = self._schema.add(key)
+        missing = position + 1 - len(self._values)
+        if missing > 0:
+            self._values.extend([_MISSING] * missing)
+        self._values[position] = value
+
+    def __delitem__(self, key):
+        self[key]  # raises a KeyError if the attribute has no value
+        self._values[self._schema.positions[key]] = _MISSING
+
+    def __contains__(self, key) -> bool:
+        position = self._schema.positions.get(key)
+        return (
+            position is not None
+            and position < len(self._values)
+            and self._values[position] is not _MISSING
+        )
+
+    def __iter__(self):
+        for name, value in zip(self._schema.names, self._values):
+            if value is not _MISSING:
+                yield name
+
+    def __len__(self) -> int:
+        return sum(1 for value in self._values if value is not _MISSING)
+
+    def __eq__(self, other):
+        if not isinstance(other, Mapping):
+            return NotImplemented
+        return self.to_dict() == dict(other.items())
+
+    def __repr__(self) -> str:
+        return repr(self.to_dict())
+
+    def __sizeof__(self) -> int:
+        return object.__sizeof__(self) + sys.getsizeof(self._values)
+
+    def __copy__(self) -> "Row":
+        return Row(self._schema, list(self._values))
+
+    def __deepcopy__(self, memo) -> "Row":
+        from copy import deepcopy
+
+        return Row(self._schema, deepcopy(self._values, memo))
+
+    def __reduce__(self):
+        return Row.of, (self._schema, self.to_dict())
+
+    def copy(self) -> "Row":
+        return self.__copy__()
+
+    def to_dict(self) -> dict:
+        return {
+            name: value
+            for name, value in zip(self._schema.names, self._values)
+            if value is not _MISSING
+        }
+
+
+class RowsById(OrderedDict):
+    """
+    The rows of a table by their identifier. Keeps a list of the rows for indexed
+    access (see RowsView), which is made on first use and dropped when the rows
+    change.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._rows: Optional[List[dict]] = None
+        super().__init__(*args, **kwargs)
+
+    def row_list(self) -> List[dict]:
+        """Returns the rows in insertion order. Don't change the returned list."""
+        rows = self._rows
+        if rows is None:
+            rows = self._rows = list(self.values())
+        return rows
+
+    def __setitem__(self, key, value):
+        self._rows = None
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._rows = None
+        super().__delitem__(key)
+
+    def clear(self):
+        self._rows = None
+        super().clear()
+
+    def pop(self, *args):
+        self._rows = None
+        return super().pop(*args)
+
+    def popitem(self, last: bool = True):
+        self._rows = None
+        return super().popitem(last)
+
+    def setdefault(self, key, default=None):
+        self._rows = None
+        return super().setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        self._rows = None
+        super().update(*args, **kwargs)
+
+    def move_to_end(self, key, last: bool = True):
+        self._rows = None
+        super().move_to_end(key, last)
+
+    def __reduce__(self):
+        return RowsById, (list(self.items()),)
+
+
+class RowsView(Sequence):
+    """Read-only view on the rows of a table, in insertion order."""
+
+    __slots__ = ("_rows_by_id",)
+
+    def __init__(self, rows_by_id: Mapping):
+        self._rows_by_id = rows_by_id
+
+    def __getitem__(self, index):
+        if isinstance(self._rows_by_id, RowsById):
+            rows = self._rows_by_id.row_list()
+        else:
+            rows = list(self._rows_by_id.values())
+        return rows[index]
+
+    def __iter__(self):
+        return iter(self._rows_by_id.values())
+
+    def __len__(self) -> int:
+        return len(self._rows_by_id)
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence) or isinstance(other, str):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self) -> str:
+        return repr(list(self))
 
 
 @dataclass(frozen=True)
@@ -61,6 +381,9 @@ class Table:
     """
     Simple representation of a BBMRI ERIC node table. The rows should be in the
     uploadable format. (See _utils.py)
+
+    Rows are stored compactly as Row objects that share one RowSchema per table, but
+    they can be used like ordinary dicts.
     """
 
     type: TableType
@@ -68,26 +391,61 @@ class Table:
     meta: TableMeta
 
     @property
-    def rows(self) -> List[dict]:
-        return list(self.rows_by_id.values())
+    def rows(self) -> Sequence:
+        return RowsView(self.rows_by_id)
 
     @property
     def full_name(self) -> str:
         return self.meta.id
 
     @staticmethod
-    def of(table_type: TableType, meta: TableMeta, rows: List[dict]) -> "Table":
+    def of(table_type: TableType, meta: TableMeta, rows: Iterable[dict]) -> "Table":
         """Factory method that takes a list of rows instead of an OrderedDict of
         ids/rows."""
-        rows_by_id = OrderedDict()
-        for row in rows:
-            rows_by_id[row["id"]] = row
         return Table(
             type=table_type,
             meta=meta,
-            rows_by_id=rows_by_id,
+            rows_by_id=Table._compact(meta, rows),
         )
 
+    @staticmethod
+    def _compact(meta: TableMeta, rows: Iterable[dict]) -> "typing.OrderedDict":
+        """Converts rows to Row objects that share a single RowSchema and interns
+        the identifiers and references, which are repeated in many rows."""
+        try:
+            schema = RowSchema(meta.schema.attribute_names)
+            single_refs = list(meta.schema.single_references)
+            multi_refs = list(meta.schema.multi_references)
+        except (KeyError, TypeError):
+            schema = RowSchema()
+            single_refs = []
+            multi_refs = []
+
+        rows_by_id = RowsById()
+        for row in rows:
+            row = Row.of(schema, row)
+            for attr in single_refs:
+                value = row.get(attr)
+                if type(value) is str:
+                    row[attr] = sys.intern(value)
+            for attr in multi_refs:
+                value = row.get(attr)
+                if value:
+                    row[attr] = [_intern(ref) for ref in value]
+
+            id_ = _intern(row["id"])
+            row["id"] = id_
+            rows_by_id[id_] = row
+        return rows_by_id
+
+    def __setstate__(self, state: dict):
+        """Compacts the rows of Tables that were pickled as dicts."""
+        state = dict(state)
+        state["rows_by_id"] = Table._compact(
+            state["meta"], state["rows_by_id"].values()
+        )
+        self.__dict__.update(state)
+
 
 @dataclass(frozen=True)
 class Node:
@@ -103,6 +461,17 @@ class Node:
         TableType.COLLECTIONS: "ID",
     }
 
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @staticmethod
+    def from_dict(data: dict) -> "Node":
+        """Factory method that creates a Node or ExternalServerNode from the output of
+        to_dict()."""
+        if "url" in data:
+            return ExternalServerNode(**data)
+        return Node(**data)
+
     def get_staging_id(self, table_type: TableType) -> str:
         """
         Returns the identifier of a node's staging table.
@@ -180,6 +549,19 @@ class NodeData:
             table_by_type=tables,
         )
 
+    def save(self, path: str):
+        """Writes the data to a snapshot file. (See snapshot.py)"""
+        from molgenis.bbmri_eric.snapshot import save_snapshot
+
+        save_snapshot(self, path)
+
+    @staticmethod
+    def load(path: str) -> "NodeData":
+        """Reads the data from a snapshot file. (See snapshot.py)"""
+        from molgenis.bbmri_eric.snapshot import load_snapshot
+
+        return load_snapshot(path)
+
 
 @dataclass(frozen=True)
 class QualityInfo:
@@ -119,7 +119,7 @@ class PidManagerFactory:
 
     @staticmethod
     def create(pid_service: BasePidService, printer: Printer) -> BasePidManager:
-        if type(pid_service) == NoOpPidService:
+        if isinstance(pid_service, NoOpPidService):
             return NoOpPidManager()
         else:
             return PidManager(pid_service, printer)
@@ -1,20 +1,17 @@
 import secrets
+import threading
 from abc import ABCMeta, abstractmethod
 from enum import Enum
-from typing import List, Optional
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
 from urllib.parse import quote
 
-from pyhandle.client.resthandleclient import RESTHandleClient
-from pyhandle.clientcredentials import PIDClientCredentials
-from pyhandle.handleclient import PyHandleClient
-from pyhandle.handleexceptions import (
-    HandleAuthenticationError,
-    HandleNotFoundException,
-    HandleSyntaxError,
-)
-
 from molgenis.bbmri_eric.errors import EricError
 
+if TYPE_CHECKING:
+    from pyhandle.client.resthandleclient import RESTHandleClient
+
+# pyhandle is imported where it's used: it is slow to import and not every run needs it
+
 
 class Status(Enum):
     TERMINATED = "TERMINATED"
@@ -27,6 +24,12 @@ def pyhandle_error_handler(func):
     """
 
     def inner_function(*args, **kwargs):
+        from pyhandle.handleexceptions import (
+            HandleAuthenticationError,
+            HandleNotFoundException,
+            HandleSyntaxError,
+        )
+
         try:
             return func(*args, **kwargs)
         except HandleAuthenticationError as e:
@@ -77,7 +80,7 @@ class PidService(BasePidService):
     Low level service for interacting with the handle server.
     """
 
-    def __init__(self, client: RESTHandleClient, prefix: str, base_url: str):
+    def __init__(self, client: "RESTHandleClient", prefix: str, base_url: str):
         self.client = client
         self.prefix = prefix
         self.base_url = base_url.rstrip("/") + "/"
@@ -103,6 +106,9 @@ class PidService(BasePidService):
         :param credentials_json: a full path to the credentials file
         :return: a PidService
         """
+        from pyhandle.clientcredentials import PIDClientCredentials
+        from pyhandle.handleclient import PyHandleClient
+
         credentials = PIDClientCredentials.load_from_JSON(credentials_json)
 
         if not base_url:
@@ -176,6 +182,97 @@ class PidService(BasePidService):
         self.client.delete_handle_value(pid, "STATUS")
 
 
+class RecordingPidService(BasePidService):
+    """
+    Records the changes that would be made to the handle server instead of making
+    them. Lookups are delegated to the wrapped service, because they don't change
+    anything. Registered PIDs are placeholders that should be replaced by real PIDs
+    when the recorded registrations are executed.
+    """
+
+    placeholder_prefix = "PLANNED:"
+
+    def __init__(self, pid_service: BasePidService):
+        self.pid_service = pid_service
+        # a NoOpPidService has no base URL
+        self.base_url = getattr(pid_service, "base_url", None)
+        self.registrations: List[Dict[str, str]] = []
+        self.names: Dict[str, str] = dict()
+        self.statuses: Dict[str, Status] = dict()
+
+    def reverse_lookup(self, url: str) -> Optional[List[str]]:
+        return self.pid_service.reverse_lookup(url)
+
+    def register_pid(self, url: str, name: str) -> str:
+        placeholder = f"{self.placeholder_prefix}{len(self.registrations) + 1}"
+        self.registrations.append({"pid": placeholder, "url": url, "name": name})
+        return placeholder
+
+    def set_name(self, pid: str, new_name: str):
+        self.names[pid] = new_name
+
+    def set_status(self, pid: str, status: Status):
+        self.statuses[pid] = status
+
+
+class MeteredPidService(BasePidService):
+    """
+    Delegates to another service and reports every operation, for example to count
+    the operations on the handle server.
+    """
+
+    def __init__(self, pid_service: BasePidService, on_operation: Callable[[], None]):
+        self.pid_service = pid_service
+        self.base_url = pid_service.base_url
+        self.on_operation = on_operation
+
+    def reverse_lookup(self, url: str) -> Optional[List[str]]:
+        self.on_operation()
+        return self.pid_service.reverse_lookup(url)
+
+    def register_pid(self, url: str, name: str) -> str:
+        self.on_operation()
+        return self.pid_service.register_pid(url, name)
+
+    def set_name(self, pid: str, new_name: str):
+        self.on_operation()
+        self.pid_service.set_name(pid, new_name)
+
+    def set_status(self, pid: str, status: Status):
+        self.on_operation()
+        self.pid_service.set_status(pid, status)
+
+
+class SynchronizedPidService(BasePidService):
+    """
+    Delegates to another service one call at a time. The handle client of a
+    PidService (pyhandle's RESTHandleClient) keeps one requests session and isn't
+    documented to be thread-safe, so nodes that are published concurrently share
+    the handle server through this service.
+    """
+
+    def __init__(self, pid_service: BasePidService):
+        self.pid_service = pid_service
+        self.base_url = pid_service.base_url
+        self._lock = threading.Lock()
+
+    def reverse_lookup(self, url: str) -> Optional[List[str]]:
+        with self._lock:
+            return self.pid_service.reverse_lookup(url)
+
+    def register_pid(self, url: str, name: str) -> str:
+        with self._lock:
+            return self.pid_service.register_pid(url, name)
+
+    def set_name(self, pid: str, new_name: str):
+        with self._lock:
+            self.pid_service.set_name(pid, new_name)
+
+    def set_status(self, pid: str, status: Status):
+        with self._lock:
+            self.pid_service.set_status(pid, status)
+
+
 class DummyPidService(BasePidService):
     """
     This dummy implementation can be used to test publishing without actually
@@ -0,0 +1,154 @@
+import json
+from dataclasses import dataclass, field
+from math import ceil
+from typing import Dict, List
+
+from molgenis.bbmri_eric.errors import EricWarning
+from molgenis.bbmri_eric.model import Node, TableType
+
+BATCH_SIZE = 1000
+"""The number of rows per request when adding or updating (see ExtendedSession)"""
+
+VERSION = 1
+
+
+@dataclass
+class TablePlan:
+    """The changes that publishing a node will make to a single published table."""
+
+    type: TableType
+    self_references: List[str] = field(default_factory=list)
+    add: List[dict] = field(default_factory=list)
+    """Rows that will be added (without their one-to-manys)"""
+
+    update: List[dict] = field(default_factory=list)
+    """Rows that will be updated"""
+
+    delete: List[str] = field(default_factory=list)
+    """Identifiers of rows that will be deleted"""
+
+    @property
+    def request_count(self) -> int:
+        return (
+            ceil(len(self.add) / BATCH_SIZE)
+            + ceil(len(self.update) / BATCH_SIZE)
+            + (1 if self.delete else 0)
+        )
+
+    @property
+    def payload_bytes(self) -> int:
+        size = 0
+        for rows in (self.add, self.update):
+            for i in range(0, len(rows), BATCH_SIZE):
+                size += _json_size({"entities": rows[i : i + BATCH_SIZE]})
+        if self.delete:
+            size += _json_size({"entityIds": self.delete})
+        return size
+
+
+@dataclass
+class PidPlan:
+    """The changes that publishing a node will make on the handle server."""
+
+    register: List[Dict[str, str]] = field(default_factory=list)
+    """New PIDs: their placeholder (used in the planned rows), URL and name"""
+
+    rename: Dict[str, str] = field(default_factory=dict)
+    """Dictionary of PIDs and their new names"""
+
+    terminate: List[str] = field(default_factory=list)
+    """PIDs that will get the TERMINATED status"""
+
+    @property
+    def request_count(self) -> int:
+        return len(self.register) + len(self.rename) + len(self.terminate)
+
+
+@dataclass
+class PublishPlan:
+    """
+    Everything that publishing a node will change, computed without writing anything.
+    A plan can be saved to a JSON file and applied later exactly as it was planned.
+    (See Publisher.plan and Publisher.apply)
+    """
+
+    node: Node
+    tables: List[TablePlan]
+    """Plans per table, in import order"""
+
+    pids: PidPlan
+    warnings: List[EricWarning] = field(default_factory=list)
+
+    @property
+    def request_count(self) -> int:
+        """Estimated number of write requests to the directory and handle server."""
+        return self.pids.request_count + sum(
+            table.request_count for table in self.tables
+        )
+
+    @property
+    def payload_bytes(self) -> int:
+        """Estimated number of bytes sent to the directory."""
+        return sum(table.payload_bytes for table in self.tables)
+
+    def get_table(self, table_type: TableType) -> TablePlan:
+        return next(table for table in self.tables if table.type == table_type)
+
+    def to_dict(self) -> dict:
+        return {
+            "version": VERSION,
+            "node": self.node.to_dict(),
+            "tables": [
+                {
+                    "type": table.type.value,
+                    "self_references": table.self_references,
+                    "add": [dict(row) for row in table.add],
+                    "update": [dict(row) for row in table.update],
+                    "delete": table.delete,
+                }
+                for table in self.tables
+            ],
+            "pids": {
+                "register": self.pids.register,
+                "rename": self.pids.rename,
+                "terminate": self.pids.terminate,
+            },
+            "warnings": [warning.message for warning in self.warnings],
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> "PublishPlan":
+        if data["version"] > VERSION:
+            raise ValueError(
+                f"Plan has version {data['version']}, only versions up to {VERSION} "
+                f"are supported"
+            )
+
+        return PublishPlan(
+            node=Node.from_dict(data["node"]),
+            tables=[
+                TablePlan(
+                    type=TableType(table["type"]),
+                    self_references=table["self_references"],
+                    add=table["add"],
+                    update=table["update"],
+                    delete=table["delete"],
+                )
+                for table in data["tables"]
+            ],
+            pids=PidPlan(**data["pids"]),
+            warnings=[EricWarning(message) for message in data["warnings"]],
+        )
+
+    def save(self, path: str):
+        with open(path, "w") as file:
+            json.dump(self.to_dict(), file)
+
+    @staticmethod
+    def load(path: str) -> "PublishPlan":
+        with open(path) as file:
+            return PublishPlan.from_dict(json.load(file))
+
+
+def _json_size(value) -> int:
+    return len(json.dumps(value).encode("utf-8"))
@@ -0,0 +1,212 @@
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from molgenis.bbmri_eric.bbmri_client import EricSession
+from molgenis.bbmri_eric.instrumentation import node_scope
+from molgenis.bbmri_eric.memory import MemoryBudget, estimate_size
+from molgenis.bbmri_eric.model import ExternalServerNode, Node, NodeData
+
+
+class _Prefetched:
+    """
+    Prefetched data, either held in memory or spilled to a snapshot file.
+    """
+
+    def __init__(self, data: NodeData, size: int = 0):
+        self.data: Optional[NodeData] = data
+        self.size = size
+        self.path: Optional[str] = None
+
+    def spill(self, path: str):
+        self.data.save(path)
+        self.data = None
+        self.path = path
+
+    def take(self) -> NodeData:
+        if self.path:
+            data = NodeData.load(self.path)
+            os.remove(self.path)
+            self.path = None
+            return data
+        return self.data
+
+
+class NodeDataPrefetcher:
+    """
+    Retrieves the staging and published data of upcoming nodes in a background thread,
+    so that the directory server is queried while the current node is being
+    validated, transformed and written. At most 'depth' nodes are fetched ahead of the
+    current one, which limits the amount of data held in memory.
+
+    The staging data of nodes with an external server can't be prefetched, because
+    these nodes are staged right before they are published. A depth of 0 turns
+    prefetching off: nothing is fetched and all getters return None.
+
+    With a MemoryBudget, data is only prefetched if the budget has room for it. The
+    size of the largest data fetched so far is reserved up front, because the size
+    isn't known until the data is retrieved. Data that turns out not to fit is spilled
+    to a snapshot file and loaded when it's needed.
+    """
+
+    def __init__(
+        self,
+        session: EricSession,
+        nodes: List[Node],
+        depth: int,
+        budget: Optional[MemoryBudget] = None,
+    ):
+        self.session = session
+        self.nodes = nodes
+        self.depth = max(0, depth)
+        self.budget = budget
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._staging: Dict[Node, Future] = dict()
+        self._published: Dict[Node, Future] = dict()
+        self._next = 0
+        self._lock = threading.Lock()
+        self._spill_dir: Optional[str] = None
+        self._expected_size = 0
+
+        if self.depth:
+            self._executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="prefetch"
+            )
+
+    def __enter__(self) -> "NodeDataPrefetcher":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Cancels all outstanding fetches and stops the background thread."""
+        if self._executor:
+            for future in list(self._staging.values()) + list(self._published.values()):
+                future.cancel()
+            self._executor.shutdown(wait=True)
+            for node in list(self._staging) + list(self._published):
+                self.release(node)
+            if self._spill_dir:
+                shutil.rmtree(self._spill_dir, ignore_errors=True)
+
+    def advance(self, node: Node):
+        """
+        Marks a node as the current node and schedules the fetches of the nodes that
+        follow it, up to the prefetch depth.
+        """
+        if not self._executor:
+            return
+
+        self._next = max(self._next, self.nodes.index(node))
+        last = min(len(self.nodes), self.nodes.index(node) + 1 + self.depth)
+        while self._next < last:
+            self._schedule(self.nodes[self._next])
+            self._next += 1
+
+    def staging_data(self, node: Node) -> Optional[NodeData]:
+        """
+        Returns the prefetched staging data of a node, waiting for it if it's still
+        being fetched. Returns None if the data was not prefetched. Errors that
+        occurred while fetching are raised here.
+        """
+        return self._pop(self._staging, node)
+
+    def published_data(self, node: Node) -> Optional[NodeData]:
+        """
+        Returns the prefetched published data of a node, waiting for it if it's still
+        being fetched. Returns None if the data was not prefetched. Errors that
+        occurred while fetching are raised here.
+        """
+        return self._pop(self._published, node)
+
+    def release(self, node: Node):
+        """Drops the prefetched data of a node that is not going to be used."""
+        for futures in (self._staging, self._published):
+            future = futures.pop(node, None)
+            if future and not future.cancel() and not future.exception():
+                if future.result():
+                    self._discard(future.result())
+
+    def spill(self):
+        """
+        Moves all prefetched data that is held in memory to snapshot files, to make
+        room in the memory budget. Waits for the outstanding fetches first, so they
+        can't take up the room that was made.
+        """
+        for future in list(self._staging.values()) + list(self._published.values()):
+            if not future.cancelled() and not future.exception() and future.result():
+                self._spill(future.result())
+
+    def _schedule(self, node: Node):
+        if not isinstance(node, ExternalServerNode):
+            self._staging[node] = self._executor.submit(
+                self._fetch, self.session.get_staging_node_data, node
+            )
+        self._published[node] = self._executor.submit(
+            self._fetch, self.session.get_published_node_data, node
+        )
+
+    def _fetch(
+        self, get: Callable[[Node], NodeData], node: Node
+    ) -> Optional[_Prefetched]:
+        if not self.budget:
+            with node_scope(node.code):
+                return _Prefetched(get(node))
+
+        expected = self._expected_size
+        if not self.budget.try_reserve(expected):
+            # no room, the data is retrieved when it's needed
+            return None
+        try:
+            with node_scope(node.code):
+                data = get(node)
+        finally:
+            self.budget.release(expected)
+
+        prefetched = _Prefetched(data, estimate_size(data))
+        self._expected_size = max(self._expected_size, prefetched.size)
+        if not self.budget.try_reserve(prefetched.size):
+            prefetched.size = 0
+            self._spill(prefetched)
+        return prefetched
+
+    def _spill(self, prefetched: _Prefetched):
+        with self._lock:
+            if prefetched.data is None:
+                return
+            if not self._spill_dir:
+                self._spill_dir = tempfile.mkdtemp(prefix="eric-prefetch-")
+            fd, path = tempfile.mkstemp(suffix=".snapshot", dir=self._spill_dir)
+            os.close(fd)
+            prefetched.spill(path)
+            if self.budget:
+                self.budget.release(prefetched.size)
+            prefetched.size = 0
+
+    def _discard(self, prefetched: _Prefetched):
+        with self._lock:
+            if self.budget:
+                self.budget.release(prefetched.size)
+            prefetched.size = 0
+            if prefetched.path:
+                os.remove(prefetched.path)
+                prefetched.path = None
+            prefetched.data = None
+
+    def _pop(self, futures: Dict[Node, Future], node: Node) -> Optional[NodeData]:
+        future = futures.pop(node, None)
+        if future is None:
+            return None
+        prefetched = future.result()
+        if prefetched is None:
+            return None
+        with self._lock:
+            # the data is handed over to the caller, who is responsible for it now
+            if self.budget:
+                self.budget.release(prefetched.size)
+            prefetched.size = 0
+            return prefetched.take()
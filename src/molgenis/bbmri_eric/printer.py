@@ -1,17 +1,157 @@
+"""
+Output of the stage and publish runs. A Printer formats lines and writes them to an
+Output: plain text (the default), JSON lines for log ingestion, or nothing but counts
+(see TextOutput, JsonLinesOutput and QuietOutput). Every line knows its level and the
+node it is about, so the same run can be written in any of these formats:
+
+>>> eric.printer.output = JsonLinesOutput(open("publish.jsonl", "w"))
+"""
+import json
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import Counter, defaultdict
 from contextlib import contextmanager
+from enum import Enum
+from typing import Dict, Iterable, List, Optional, TextIO
 
 from molgenis.bbmri_eric.errors import EricError, EricWarning, ErrorReport
+from molgenis.bbmri_eric.instrumentation import current_node
+from molgenis.bbmri_eric.metrics import PHASES, Metrics
 from molgenis.bbmri_eric.model import Node
+from molgenis.bbmri_eric.profiling import Profiler
+
+
+class Level(Enum):
+    INFO = "info"
+    WARNING = "warning"
+    ERROR = "error"
+
+
+class Line(str):
+    """
+    A printed line. The string is the line as it is written in text, including the
+    indentation, so buffered lines can still be used as strings. The attributes are
+    used for structured output.
+    """
+
+    text: str
+    indent: int
+    level: Level
+    node: Optional[str]
+    time: float
+
+    def __new__(
+        cls,
+        text: str,
+        indent: int = 0,
+        level: Level = Level.INFO,
+        node: Optional[str] = None,
+        time_: Optional[float] = None,
+    ) -> "Line":
+        line = super(Line, cls).__new__(cls, f"{'    ' * indent}{text}" if text else "")
+        line.text = text
+        line.indent = indent
+        line.level = level
+        line.node = node
+        line.time = time.time() if time_ is None else time_
+        return line
+
+    def to_dict(self) -> dict:
+        return {
+            "time": self.time,
+            "node": self.node,
+            "level": self.level.value,
+            "indent": self.indent,
+            "message": self.text,
+        }
+
+
+class Output(ABC):
+    """
+    Where a printer writes its lines. A printer never writes from two threads at the
+    same time, so outputs don't need to be thread-safe.
+    """
+
+    @abstractmethod
+    def write(self, lines: List[Line]):
+        """Writes lines in the given order. Called once per line or batch of lines."""
+        raise NotImplementedError
+
+
+class TextOutput(Output):
+    """Writes lines as text. All lines of a flushed buffer are written at once."""
+
+    def __init__(self, stream: Optional[TextIO] = None):
+        self.stream = stream
+        """The stream to write to. Standard output if None."""
+
+    def write(self, lines: List[Line]):
+        stream = self.stream or sys.stdout
+        stream.write("".join(f"{line}\n" for line in lines))
+
+
+class JsonLinesOutput(Output):
+    """
+    Writes every line as a JSON object with its time, node, level, indentation and
+    message. Empty lines are left out.
+    """
+
+    def __init__(self, stream: Optional[TextIO] = None):
+        self.stream = stream
+        """The stream to write to. Standard output if None."""
+
+    def write(self, lines: List[Line]):
+        stream = self.stream or sys.stdout
+        stream.write(
+            "".join(json.dumps(line.to_dict()) + "\n" for line in lines if line.text)
+        )
+
+
+class QuietOutput(Output):
+    """Writes nothing, but counts the lines of every node per level."""
+
+    def __init__(self):
+        self.counts: Dict[Optional[str], Counter] = defaultdict(Counter)
+
+    def write(self, lines: List[Line]):
+        for line in lines:
+            if line.text:
+                self.counts[line.node][line.level.value] += 1
+
+    def to_dict(self) -> Dict[Optional[str], Dict[str, int]]:
+        return {node: dict(counts) for node, counts in self.counts.items()}
 
 
 class Printer:
     """
     Simple printer that keeps track of indentation levels. Also has utility methods
     for printing some Eric objects.
+
+    Indentation is tracked per thread. A thread can collect its output in a buffer
+    (see buffer()) so that output of concurrent tasks can be written in order later.
+    Lines are attributed to the node of the current thread (see
+    instrumentation.node_scope).
+
+    Lines printed outside a buffer are written right away, one write per line, so the
+    progress of a run shows while it's going on. Where many lines are printed in a
+    row, like warnings, batch() writes them at once.
     """
 
-    def __init__(self):
-        self.indents = 0
+    def __init__(self, output: Optional[Output] = None):
+        self.output: Output = output or TextOutput()
+        """Where the lines are written. Can be replaced between runs."""
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def indents(self) -> int:
+        return getattr(self._local, "indents", 0)
+
+    @indents.setter
+    def indents(self, indents: int):
+        self._local.indents = indents
 
     def indent(self):
         self.indents += 1
@@ -23,21 +163,76 @@ class Printer:
         self.indents = 0
 
     def print(self, value: str = None, indent: int = 0):
-        self.indents += indent
-        if value:
-            print(f"{'    ' * self.indents}{value}")
+        """
+        Prints a value at the current indentation. A Line from a buffer keeps its
+        level and node, and its indentation is added to the current one.
+        """
+        self._print(value, indent)
+
+    def write_lines(self, lines: Iterable[str]):
+        """Writes lines that were collected in a buffer, in the same order."""
+        self._write([line if isinstance(line, Line) else Line(line) for line in lines])
+
+    @contextmanager
+    def buffer(self):
+        """
+        Collects everything the current thread prints in a list of Lines instead of
+        writing it directly. The list is returned by the context manager.
+        """
+        lines = []
+        previous = getattr(self._local, "buffer", None)
+        self._local.buffer = lines
+        try:
+            yield lines
+        finally:
+            self._local.buffer = previous
+
+    @contextmanager
+    def batch(self):
+        """
+        Collects everything the current thread prints in the block and writes it at
+        once when the block ends, even if it raises. Inside a buffer, the lines go to
+        the buffer.
+        """
+        lines = []
+        try:
+            with self.buffer() as lines:
+                yield
+        finally:
+            self._write(lines)
+
+    def _print(
+        self,
+        value: Optional[str],
+        indent: int = 0,
+        level: Level = Level.INFO,
+        node: Optional[str] = None,
+    ):
+        indents = self.indents + indent
+        if isinstance(value, Line):
+            line = Line(
+                value.text, indents + value.indent, value.level, value.node, value.time
+            )
         else:
-            print()
-        self.indents -= indent
+            line = Line(value or "", indents, level, node or current_node())
+        self._write([line])
+
+    def _write(self, lines: List[Line]):
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            with self._lock:
+                self.output.write(lines)
+        else:
+            buffer.extend(lines)
 
     def print_node_title(self, node: Node):
         title = f"🌍 Node {node.code} ({node.description})"
         border = "=" * (len(title) + 1)
         self.reset_indent()
-        self.print()
-        self.print(border)
-        self.print(title)
-        self.print(border)
+        self._print(None, node=node.code)
+        self._print(border, node=node.code)
+        self._print(title, node=node.code)
+        self._print(border, node=node.code)
 
     def print_sub_header(self, text: str):
         self.print()
@@ -47,10 +242,10 @@ class Printer:
         message = str(error)
         if error.__cause__:
             message += f" - Cause: {str(error.__cause__)}"
-        self.print(f"❌ {message}")
+        self._print(f"❌ {message}", level=Level.ERROR)
 
     def print_warning(self, warning: EricWarning, indent: int = 0):
-        self.print(f"⚠️ {warning.message}", indent)
+        self._print(f"⚠️ {warning.message}", indent, Level.WARNING)
 
     def print_summary(self, report: ErrorReport):
         self.reset_indent()
@@ -71,10 +266,81 @@ class Printer:
                 )
             else:
                 message = f"✅ Node {node.code} finished successfully"
-            self.print(message)
+            self._print(message, node=node.code)
+
+    def print_metrics(self, metrics: Metrics):
+        self.reset_indent()
+        self.print()
+        self.print("⏱️ Durations")
+        for node, values in metrics.to_dict()["nodes"].items():
+            phases = values["phases"]
+            if not phases:
+                continue
+            durations = ", ".join(
+                f"{phase} {phases[phase]:.1f}s" for phase in PHASES if phase in phases
+            )
+            counters = values["counters"]
+            self.print(
+                f"{node}: {durations} (total {sum(phases.values()):.1f}s, "
+                f"{counters.get('rows_read', 0)} rows read, "
+                f"{counters.get('rows_written', 0)} written, "
+                f"{counters.get('rows_deleted', 0)} deleted)",
+                indent=1,
+            )
+        if metrics.memory:
+            self._print_memory(metrics.memory.to_dict())
+
+    def _print_memory(self, memory: dict):
+        self.print()
+        self.print("💾 Memory")
+        for node, values in memory.items():
+            self.print(node, indent=1)
+            for phase in sorted(values["phases"], key=_phase_order):
+                phase_values = values["phases"][phase]
+                self.print(
+                    f"{phase}: peak {_mb(phase_values['peak'])} "
+                    f"(+{_mb(phase_values['growth'])}), "
+                    f"RSS {_mb(phase_values['rss'])}",
+                    indent=2,
+                )
+                for site, size in sorted(phase_values["sites"].items()):
+                    self.print(f"{site}: peak +{_mb(size)}", indent=3)
+                for site in phase_values["top"]:
+                    self.print(
+                        f"{site['location']}: +{_mb(site['size'])} "
+                        f"in {site['count']} block(s)",
+                        indent=3,
+                    )
+            for source, tables in values["tables"].items():
+                sizes = ", ".join(
+                    f"{table} {_mb(size)}" for table, size in tables.items()
+                )
+                self.print(f"{source} tables: {sizes}", indent=2)
+
+    def print_hot_functions(self, profiler: Profiler):
+        self.reset_indent()
+        self.print()
+        self.print(f"🔥 Hot functions (profiles are saved in {profiler.directory})")
+        hot_functions = profiler.get_hot_functions()
+        for phase in sorted(hot_functions, key=_phase_order):
+            self.print(phase, indent=1)
+            for hot in hot_functions[phase]:
+                self.print(
+                    f"{hot.own_time:.3f}s {hot.function} ({hot.location}), "
+                    f"{hot.calls} call(s), {hot.cumulative_time:.3f}s cumulative",
+                    indent=2,
+                )
 
     @contextmanager
     def indentation(self):
         self.indent()
         yield
         self.dedent()
+
+
+def _phase_order(phase: str) -> int:
+    return PHASES.index(phase) if phase in PHASES else len(PHASES)
+
+
+def _mb(size: int) -> str:
+    return f"{size / 1024 / 1024:.1f} MB"
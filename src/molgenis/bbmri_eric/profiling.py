@@ -0,0 +1,144 @@
+"""
+Opt-in profiling of the phases of staging and publishing runs (see metrics.PHASES).
+Every phase of every node is profiled with cProfile. The statistics are written to
+.pstats files that can be inspected with pstats or tools like snakeviz:
+
+    <directory>/<phase>.pstats          all nodes together
+    <directory>/<node>/<phase>.pstats   a single node
+
+Only the thread that runs a phase is profiled. Work that a phase hands over to other
+threads (like concurrent deletes) shows up as waiting time.
+"""
+
+import cProfile
+import os
+import pstats
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+from molgenis.bbmri_eric.instrumentation import current_node, no_scope
+
+
+@dataclass(frozen=True)
+class HotFunction:
+    """
+    A function that took a lot of time in a phase.
+    """
+
+    function: str
+    location: str
+    calls: int
+    own_time: float
+    cumulative_time: float
+
+
+class Profiler:
+    """
+    Profiles phases per node. Can be shared by threads: each thread is profiled
+    separately. A phase that runs inside another phase of the same thread is part of
+    the outer phase's profile.
+    """
+
+    def __init__(self, directory: str, top: int = 10):
+        """
+        :param str directory: the directory to write the .pstats files to
+        :param int top: the number of hot functions to show per phase
+        """
+        self.directory = directory
+        self.top = top
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats: Dict[Tuple[str, str], pstats.Stats] = dict()
+
+    @property
+    def enabled(self) -> bool:
+        return True
+
+    @contextmanager
+    def phase(self, name: str):
+        """Profiles a phase of the current node."""
+        if getattr(self._local, "active", False):
+            yield
+            return
+
+        profile = cProfile.Profile()
+        self._local.active = True
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self._local.active = False
+            self._add(current_node() or "-", name, profile)
+
+    def _add(self, node: str, phase: str, profile: cProfile.Profile):
+        with self._lock:
+            key = (node, phase)
+            if key in self._stats:
+                self._stats[key].add(profile)
+            else:
+                self._stats[key] = pstats.Stats(profile)
+
+    def get_stats(self) -> Dict[str, pstats.Stats]:
+        """Returns the statistics of each phase, with the nodes combined."""
+        with self._lock:
+            by_phase = defaultdict(list)
+            for (_, phase), stats in self._stats.items():
+                by_phase[phase].append(stats)
+
+        combined = dict()
+        for phase, stats in by_phase.items():
+            combined[phase] = pstats.Stats()
+            combined[phase].add(*stats)
+        return combined
+
+    def get_hot_functions(self) -> Dict[str, List[HotFunction]]:
+        """Returns the functions with the most own time of each phase."""
+        hot_functions = dict()
+        for phase, stats in self.get_stats().items():
+            entries = sorted(
+                stats.stats.items(), key=lambda item: item[1][2], reverse=True
+            )
+            hot_functions[phase] = [
+                HotFunction(
+                    function=function,
+                    location=f"{os.path.basename(file)}:{line}",
+                    calls=values[1],
+                    own_time=values[2],
+                    cumulative_time=values[3],
+                )
+                for (file, line, function), values in entries[: self.top]
+            ]
+        return hot_functions
+
+    def save(self):
+        """Writes the .pstats files of all phases and of every node's phases."""
+        with self._lock:
+            per_node = dict(self._stats)
+        for (node, phase), stats in per_node.items():
+            os.makedirs(os.path.join(self.directory, node), exist_ok=True)
+            stats.dump_stats(os.path.join(self.directory, node, f"{phase}.pstats"))
+        for phase, stats in self.get_stats().items():
+            stats.dump_stats(os.path.join(self.directory, f"{phase}.pstats"))
+
+
+class NoOpProfiler(Profiler):
+    """
+    Profiles nothing. Used when profiling is turned off.
+    """
+
+    def __init__(self):
+        super().__init__(directory="")
+
+    @property
+    def enabled(self) -> bool:
+        return False
+
+    def phase(self, name: str):
+        return no_scope()
+
+    def save(self):
+        pass
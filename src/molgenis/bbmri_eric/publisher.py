@@ -1,11 +1,22 @@
-from typing import List
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import chain
+from typing import List, Optional, Set, Tuple
 
 from molgenis.bbmri_eric.bbmri_client import EricSession
-from molgenis.bbmri_eric.errors import EricError, EricWarning
-from molgenis.bbmri_eric.model import NodeData, QualityInfo, Table, TableType
-from molgenis.bbmri_eric.pid_manager import PidManagerFactory
-from molgenis.bbmri_eric.pid_service import BasePidService
+from molgenis.bbmri_eric.context import PublishContext
+from molgenis.bbmri_eric.deleter import DeletionError, RowDeleter, get_deletion_levels
+from molgenis.bbmri_eric.errors import EricError, EricWarning, ErrorReport
+from molgenis.bbmri_eric.instrumentation import bind, node_scope
+from molgenis.bbmri_eric.journal import Checkpoint, CheckpointJournal
+from molgenis.bbmri_eric.metrics import Metrics, NoOpMetrics
+from molgenis.bbmri_eric.model import Node, NodeData, QualityInfo, Table, TableType
+from molgenis.bbmri_eric.pid_manager import PidManager, PidManagerFactory
+from molgenis.bbmri_eric.pid_service import BasePidService, RecordingPidService, Status
+from molgenis.bbmri_eric.plan import PidPlan, PublishPlan, TablePlan
 from molgenis.bbmri_eric.printer import Printer
+from molgenis.bbmri_eric.profiling import NoOpProfiler, Profiler
 from molgenis.bbmri_eric.transformer import Transformer
 from molgenis.client import MolgenisRequestError
 
@@ -13,33 +24,448 @@ from molgenis.client import MolgenisRequestError
 class Publisher:
     """
     This class is responsible for copying data from the staging areas to the combined
-    public tables.
+    public tables. A single Publisher can publish multiple nodes concurrently: the
+    warnings are kept per thread.
     """
 
     def __init__(
-        self, session: EricSession, printer: Printer, pid_service: BasePidService
+        self,
+        session: EricSession,
+        printer: Printer,
+        pid_service: BasePidService,
+        journal: Optional[CheckpointJournal] = None,
+        context: Optional[PublishContext] = None,
     ):
+        """
+        :param CheckpointJournal journal: if provided, written batches are recorded
+                                          in this journal and batches that were
+                                          written by a previous (failed) run are
+                                          skipped
+        :param PublishContext context: the quality info and data of node EU, is
+                                       created if not provided
+        """
         self.session = session
         self.printer = printer
         self.pid_service = pid_service
+        self.journal = journal
+        self.context = context if context else PublishContext(session)
         self.pid_manager = PidManagerFactory.create(pid_service, printer)
-        self.warnings: List[EricWarning] = []
-        self.quality_info: QualityInfo = session.get_quality_info()
-        self.eu_node_data: NodeData = session.get_staging_node_data(
-            session.get_node("EU")
-        )
+        self.deleter = RowDeleter(session)
+        self.metrics: Metrics = NoOpMetrics()
+        self.profiler: Profiler = NoOpProfiler()
+        self._local = threading.local()
+
+    @property
+    def quality_info(self) -> QualityInfo:
+        """
+        The quality info of the node that is being published in the current thread,
+        or the quality info of the whole directory if no node is being published.
+        """
+        quality_info = getattr(self._local, "quality_info", None)
+        if quality_info is None:
+            return self.context.quality_info
+        return quality_info
+
+    @quality_info.setter
+    def quality_info(self, quality_info: QualityInfo):
+        self.context.quality_info = quality_info
+
+    @property
+    def eu_node_data(self) -> NodeData:
+        return self.context.eu_node_data
+
+    @eu_node_data.setter
+    def eu_node_data(self, eu_node_data: NodeData):
+        self.context.eu_node_data = eu_node_data
 
-    def publish(self, node_data: NodeData) -> List[EricWarning]:
+    @property
+    def warnings(self) -> List[EricWarning]:
+        if not hasattr(self._local, "warnings"):
+            self._local.warnings = []
+        return self._local.warnings
+
+    @warnings.setter
+    def warnings(self, warnings: List[EricWarning]):
+        self._local.warnings = warnings
+
+    def publish(
+        self,
+        node_data: NodeData,
+        existing_node_data: Optional[NodeData] = None,
+        release: bool = False,
+    ) -> List[EricWarning]:
         """
         Publishes data from the provided node to the production tables. Before being
         copied over, the data is enriched with additional information.
+
+        :param NodeData node_data: the staging data of the node
+        :param NodeData existing_node_data: the node's published data, if it was
+                                            already retrieved
+        :param bool release: if True, the rows of each table are removed from the
+                             staging and published data as soon as the table is
+                             published, to free memory
+        """
+        existing_node_data, _ = self.prepare(node_data, existing_node_data)
+
+        self.printer.print("💾 Copying data to combined tables")
+        with self.printer.indentation():
+            self._copy_node_data(node_data, existing_node_data, release)
+        return self.warnings
+
+    def prepare(
+        self, node_data: NodeData, existing_node_data: Optional[NodeData] = None
+    ) -> Tuple[NodeData, List[EricWarning]]:
+        """
+        Does everything that's needed before a node's data can be copied to the
+        production tables: the data is enriched and PIDs are assigned. Returns the
+        node's published data and the warnings.
+
+        :param NodeData node_data: the staging data of the node
+        :param NodeData existing_node_data: the node's published data, if it was
+                                            already retrieved
+        """
+        self.warnings = []
+        node = node_data.node
+
+        existing_node_data = self._get_published_node_data(node, existing_node_data)
+        with self._phase("enrich"):
+            self._retrieve_quality_info(node_data, existing_node_data)
+            self._prepare(node_data, existing_node_data)
+
+        self.printer.print("🆔 Managing PIDs")
+        with self.printer.indentation(), self._phase("pids"):
+            self.warnings += self.pid_manager.assign_biobank_pids(node_data.biobanks)
+            self.pid_manager.update_biobank_pids(
+                node_data.biobanks, existing_node_data.biobanks
+            )
+        return existing_node_data, self.warnings
+
+    def publish_combined(
+        self, prepared: List[Tuple[NodeData, NodeData]]
+    ) -> ErrorReport:
+        """
+        Copies the data of multiple nodes that were prepared with prepare() to the
+        production tables. The rows of all nodes are merged per table and upserted
+        together, so the number of requests depends on the number of rows instead of
+        the number of nodes. If a combined upsert fails, the rows are upserted per
+        node to find out which node is to blame. Rows are deleted per node.
+
+        With a journal, the rows of a node's table are recorded as one batch once they
+        are upserted. Deleted rows are recorded per batch, like publish() does. A
+        combined run that failed halfway skips what was done for every node.
+
+        Returns a report with the errors and warnings per node. A node that fails is
+        left out of the tables that follow.
+
+        :param prepared: tuples of the staging data and published data of each node
+        """
+        nodes = [node_data.node for node_data, _ in prepared]
+        report = ErrorReport(nodes)
+
+        self.printer.print("💾 Copying data to combined tables")
+        with self.printer.indentation():
+            for table_type in TableType.get_import_order():
+                remaining = [
+                    node_data
+                    for node_data, _ in prepared
+                    if node_data.node not in report.errors
+                ]
+                if remaining:
+                    self._upsert_combined(table_type, remaining, report)
+
+            for node_data, existing_node_data in prepared:
+                node = node_data.node
+                if node in report.errors:
+                    continue
+
+                self.printer.print(f"Deleting rows of node {node.code}")
+                self.warnings = []
+                self._retrieve_quality_info(node_data, existing_node_data)
+                try:
+                    with node_scope(node.code), self.printer.indentation():
+                        for table in reversed(node_data.import_order):
+                            self._delete_rows(
+                                table,
+                                existing_node_data.table_by_type[table.type],
+                                self._checkpoint(node, table),
+                            )
+                except MolgenisRequestError as e:
+                    report.add_error(
+                        node, _wrap(f"Error deleting rows of node {node.code}", e)
+                    )
+                except EricError as e:
+                    report.add_error(node, e)
+                report.add_warnings(node, self.warnings)
+
+        return report
+
+    def _upsert_combined(
+        self, table_type: TableType, nodes: List[NodeData], report: ErrorReport
+    ):
+        id_ = table_type.base_id
+
+        # A node's table is recorded in the journal as one batch, skip the ones that
+        # were written by a previous run
+        checkpoints = {
+            node_data.node: self._checkpoint(
+                node_data.node, node_data.table_by_type[table_type]
+            )
+            for node_data in nodes
+        }
+        nodes = [
+            node_data
+            for node_data in nodes
+            if not _is_done(
+                checkpoints[node_data.node], node_data.table_by_type[table_type]
+            )
+        ]
+        skipped = len(checkpoints) - len(nodes)
+        if skipped:
+            self.printer.print(
+                f"Skipped {id_} of {skipped} node(s) that were completed in a "
+                f"previous run"
+            )
+        if not nodes:
+            return
+
+        # Nodes share rows of node EU, so the same row can occur more than once
+        rows = dict()
+        for node_data in nodes:
+            for row in node_data.table_by_type[table_type].rows:
+                rows[row["id"]] = row
+
+        self.printer.print(
+            f"Upserting {len(rows)} row(s) of {len(nodes)} node(s) in {id_}"
+        )
+        try:
+            with self._phase("upsert"):
+                self.session.upsert_batched(id_, list(rows.values()))
+            self.metrics.count("rows_written", len(rows))
+            for node_data in nodes:
+                checkpoint = checkpoints[node_data.node]
+                if checkpoint:
+                    checkpoint.record(
+                        "upsert", node_data.table_by_type[table_type].rows
+                    )
+            return
+        except MolgenisRequestError as e:
+            self.printer.print(f"Combined upsert failed, upserting per node ({e})")
+
+        with self.printer.indentation():
+            for node_data in nodes:
+                try:
+                    rows = node_data.table_by_type[table_type].rows
+                    with node_scope(node_data.node.code), self._phase("upsert"):
+                        self.session.upsert_batched(id_, rows)
+                        self.metrics.count("rows_written", len(rows))
+                    checkpoint = checkpoints[node_data.node]
+                    if checkpoint:
+                        checkpoint.record("upsert", rows)
+                except MolgenisRequestError as e:
+                    error = _wrap(f"Error upserting rows to {id_}", e)
+                    self.printer.print_error(error)
+                    report.add_error(node_data.node, error)
+
+    def plan(
+        self, node_data: NodeData, existing_node_data: Optional[NodeData] = None
+    ) -> PublishPlan:
+        """
+        Does everything that publish() does, except for making changes: the data is
+        enriched and compared with the published data, but nothing is written to the
+        directory or the handle server. Returns a plan of all the changes that
+        publishing would make. The plan can be executed later with apply().
+
+        :param NodeData node_data: the staging data of the node
+        :param NodeData existing_node_data: the node's published data, if it was
+                                            already retrieved
         """
         self.warnings = []
         node = node_data.node
 
+        existing_node_data = self._get_published_node_data(node, existing_node_data)
+        with self._phase("enrich"):
+            self._retrieve_quality_info(node_data, existing_node_data)
+            self._prepare(node_data, existing_node_data)
+
+        self.printer.print("🆔 Planning PID changes")
+        pid_service = RecordingPidService(self.pid_service)
+        pid_manager = self.pid_manager
+        if isinstance(pid_manager, PidManager):
+            pid_manager = PidManager(pid_service, self.printer)
+        with self.printer.indentation():
+            with self.printer.buffer():
+                # the PidManager reports changes as if they were made, hide them
+                self.warnings += pid_manager.assign_biobank_pids(node_data.biobanks)
+                pid_manager.update_biobank_pids(
+                    node_data.biobanks, existing_node_data.biobanks
+                )
+
+        self.printer.print("📝 Planning changes to combined tables")
+        tables = []
+        with self.printer.indentation():
+            for table in node_data.import_order:
+                try:
+                    meta, add, update = self.session.split_upsert(
+                        table.type.base_id, table.rows
+                    )
+                except MolgenisRequestError as e:
+                    raise EricError(
+                        f"Error retrieving existing rows of {table.type.base_id}"
+                    ) from e
+                tables.append(
+                    TablePlan(
+                        type=table.type,
+                        self_references=meta.self_references,
+                        add=[dict(row) for row in add],
+                        update=[dict(row) for row in update],
+                    )
+                )
+
+            for table, table_plan in reversed(
+                list(zip(node_data.import_order, tables))
+            ):
+                existing_table = existing_node_data.table_by_type[table.type]
+                deletable_ids = self._get_deletable_ids(table, existing_table)
+                table_plan.delete = sorted(deletable_ids)
+                if table.type == TableType.BIOBANKS:
+                    with self.printer.buffer():
+                        pid_manager.terminate_biobanks(
+                            [
+                                existing_table.rows_by_id[id_]["pid"]
+                                for id_ in deletable_ids
+                            ]
+                        )
+
+            for table_plan in tables:
+                self.printer.print(
+                    f"{table_plan.type.base_id}: {len(table_plan.add)} to add, "
+                    f"{len(table_plan.update)} to update, "
+                    f"{len(table_plan.delete)} to delete"
+                )
+
+        plan = PublishPlan(
+            node=node,
+            tables=tables,
+            pids=PidPlan(
+                register=pid_service.registrations,
+                rename=pid_service.names,
+                terminate=[
+                    pid
+                    for pid, status in pid_service.statuses.items()
+                    if status == Status.TERMINATED
+                ],
+            ),
+            warnings=list(self.warnings),
+        )
+        self.printer.print(
+            f"🧮 {len(plan.pids.register)} PID(s) to register, "
+            f"{len(plan.pids.rename)} to rename, "
+            f"{len(plan.pids.terminate)} to terminate. "
+            f"Estimated {plan.request_count} request(s) and {plan.payload_bytes} bytes"
+        )
+        return plan
+
+    def apply(self, plan: PublishPlan) -> List[EricWarning]:
+        """
+        Executes a plan that was made with plan(). Exactly the planned changes are
+        made: nothing is retrieved or compared again. Returns the warnings that
+        occurred while planning.
+
+        :param PublishPlan plan: the plan to execute
+        """
+        self.printer.print("🆔 Managing PIDs")
+        with self.printer.indentation(), self._phase("pids"):
+            pids = dict()
+            for registration in plan.pids.register:
+                pid = self.pid_service.register_pid(
+                    url=registration["url"], name=registration["name"]
+                )
+                pids[registration["pid"]] = pid
+                self.printer.print(
+                    f'Registered {pid} for new biobank "{registration["name"]}"'
+                )
+            for pid, name in plan.pids.rename.items():
+                self.pid_service.set_name(pid, name)
+                self.printer.print(f'Updated NAME of {pid} to "{name}"')
+
+        biobanks = plan.get_table(TableType.BIOBANKS)
+        for row in biobanks.add + biobanks.update:
+            if row.get("pid") in pids:
+                row["pid"] = pids[row["pid"]]
+
+        self.printer.print("💾 Copying data to combined tables")
+        with self.printer.indentation():
+            for table_plan in plan.tables:
+                id_ = table_plan.type.base_id
+                self.printer.print(f"Upserting rows in {id_}")
+                try:
+                    with self._phase("upsert"):
+                        self.session.add_batched(
+                            id_, table_plan.self_references, table_plan.add
+                        )
+                        self.session.update_batched(
+                            id_, table_plan.self_references, table_plan.update
+                        )
+                except MolgenisRequestError as e:
+                    raise EricError(f"Error upserting rows to {id_}") from e
+                self.metrics.count(
+                    "rows_written", len(table_plan.add) + len(table_plan.update)
+                )
+
+            for table_plan in reversed(plan.tables):
+                id_ = table_plan.type.base_id
+                self.printer.print(f"Deleting rows in {id_}")
+                with self.printer.indentation():
+                    if table_plan.type == TableType.BIOBANKS:
+                        self.pid_manager.terminate_biobanks(plan.pids.terminate)
+                    if not table_plan.delete:
+                        continue
+                    self.printer.print(
+                        f"Deleting {len(table_plan.delete)} row(s) in {id_}"
+                    )
+                    try:
+                        with self._phase("delete"):
+                            self.session.delete_list(id_, table_plan.delete)
+                    except MolgenisRequestError as e:
+                        raise EricError(f"Error deleting rows from {id_}") from e
+                    self.metrics.count("rows_deleted", len(table_plan.delete))
+
+        return plan.warnings
+
+    @contextmanager
+    def _phase(self, name: str):
+        with self.metrics.phase(name), self.profiler.phase(name):
+            yield
+
+    def _get_published_node_data(
+        self, node: Node, existing_node_data: Optional[NodeData]
+    ) -> NodeData:
         self.printer.print(f"📦 Retrieving existing published data of node {node.code}")
-        existing_node_data = self.session.get_published_node_data(node)
+        if existing_node_data is None:
+            with self._phase("fetch_published"):
+                existing_node_data = self.session.get_published_node_data(node)
+        self.metrics.add_node_data(existing_node_data)
+        return existing_node_data
 
+    def _retrieve_quality_info(self, node_data: NodeData, existing_node_data: NodeData):
+        """
+        Only the quality info of the node's staging and published biobanks and
+        collections is needed for publishing. Retrieves those if the quality info of
+        the whole directory isn't available.
+        """
+        self._local.quality_info = self.context.get_quality_info(
+            biobank_ids=chain(
+                node_data.biobanks.rows_by_id, existing_node_data.biobanks.rows_by_id
+            ),
+            collection_ids=chain(
+                node_data.collections.rows_by_id,
+                existing_node_data.collections.rows_by_id,
+            ),
+        )
+
+    def _prepare(self, node_data: NodeData, existing_node_data: NodeData):
+        # Node EU doesn't refer to itself, so its data is only retrieved when needed
+        is_eu = node_data.node.code == "EU"
         self.printer.print("✏️ Preparing data")
         with self.printer.indentation():
             self.warnings += Transformer(
@@ -47,53 +473,163 @@ class Publisher:
                 quality=self.quality_info,
                 printer=self.printer,
                 existing_biobanks=existing_node_data.biobanks,
-                eu_node_data=self.eu_node_data,
+                eu_node_data=None if is_eu else self.eu_node_data,
             ).enrich()
 
-        self.printer.print("🆔 Managing PIDs")
-        with self.printer.indentation():
-            self.warnings += self.pid_manager.assign_biobank_pids(node_data.biobanks)
-            self.pid_manager.update_biobank_pids(
-                node_data.biobanks, existing_node_data.biobanks
-            )
-
-        self.printer.print("💾 Copying data to combined tables")
-        with self.printer.indentation():
-            self._copy_node_data(node_data, existing_node_data)
-        return self.warnings
-
-    def _copy_node_data(self, node_data: NodeData, existing_node_data: NodeData):
+    def _copy_node_data(
+        self, node_data: NodeData, existing_node_data: NodeData, release: bool = False
+    ):
         """
         Copies the data of a staging area to the combined tables. This happens in two
         phases:
         1. New/existing rows are upserted in the combined tables
         2. Removed rows are deleted from the combined tables
+        A table is done after the second phase, so that's when its rows are released.
         """
+        node = node_data.node
         for table in node_data.import_order:
             self.printer.print(f"Upserting rows in {table.type.base_id}")
+            checkpoint = self._checkpoint(node, table)
             try:
-                self.session.upsert_batched(table.type.base_id, table.rows)
+                with self._phase("upsert"):
+                    self.session.upsert_batched(
+                        table.type.base_id, table.rows, checkpoint=checkpoint
+                    )
             except MolgenisRequestError as e:
                 raise EricError(f"Error upserting rows to {table.type.base_id}") from e
+            finally:
+                self._print_skipped(checkpoint)
+            self.metrics.count("rows_written", len(table.rows_by_id))
 
         for table in reversed(node_data.import_order):
             self.printer.print(f"Deleting rows in {table.type.base_id}")
             try:
                 with self.printer.indentation():
                     self._delete_rows(
-                        table, existing_node_data.table_by_type[table.type]
+                        table,
+                        existing_node_data.table_by_type[table.type],
+                        self._checkpoint(node, table),
                     )
             except MolgenisRequestError as e:
                 raise EricError(f"Error deleting rows from {table.type.base_id}") from e
 
-    def _delete_rows(self, table: Table, existing_table: Table):
+            if release:
+                table.rows_by_id.clear()
+                existing_node_data.table_by_type[table.type].rows_by_id.clear()
+
+    def _delete_rows(
+        self,
+        table: Table,
+        existing_table: Table,
+        checkpoint: Optional[Checkpoint] = None,
+    ):
         """
         Deletes rows from a combined table that are not present in the staging area's
         table. If a row is referenced from the quality info tables, it is not deleted
         but a warning will be raised.
 
         :param Table table: the staging area's table
-        :node Node node: the Node that is being published
+        :param Table existing_table: the published table
+        :param Checkpoint checkpoint: the checkpoint of the table, if any
+        """
+        deletable_ids = self._get_deletable_ids(table, existing_table)
+        if not deletable_ids:
+            return
+
+        # For deleted biobanks, update the handles of the rows that are deleted while
+        # the next batches are deleted
+        executor = None
+        terminations = []
+        if table.type == TableType.BIOBANKS:
+            executor = ThreadPoolExecutor(max_workers=1)
+        terminate = bind(self._terminate_biobanks)
+
+        def terminate_pids(ids: List[str]):
+            pids = [existing_table.rows_by_id[id_]["pid"] for id_ in ids]
+            terminations.append(executor.submit(terminate, pids))
+
+        # Actually delete the rows in the combined tables
+        self.printer.print(
+            f"Deleting {len(deletable_ids)} row(s) in {table.type.base_id}"
+        )
+        try:
+            with self._phase("delete"):
+                deleted = self.deleter.delete(
+                    table.type.base_id,
+                    get_deletion_levels(existing_table, deletable_ids),
+                    checkpoint,
+                    terminate_pids if executor else None,
+                )
+        except Exception as e:
+            if isinstance(e, DeletionError):
+                self._print_deletion_error(e)
+            if executor:
+                self._finish_terminations(executor, terminations, raise_errors=False)
+            raise
+
+        self.metrics.count("rows_deleted", len(deleted))
+        self._print_skipped(checkpoint)
+        if executor:
+            self._finish_terminations(executor, terminations)
+
+    def _finish_terminations(
+        self,
+        executor: ThreadPoolExecutor,
+        terminations: List[Future],
+        raise_errors: bool = True,
+    ):
+        """
+        Waits for the PID terminations and prints their output. When the deletes
+        failed, errors of the terminations are printed instead of raised, so they
+        don't hide the error of the deletes.
+        """
+        error = None
+        with executor:
+            for termination in terminations:
+                try:
+                    for line in termination.result():
+                        self.printer.print(line)
+                except Exception as e:
+                    error = error or e
+                    if not raise_errors:
+                        self.printer.print_error(
+                            _wrap("Error terminating the PIDs of deleted biobanks", e)
+                        )
+        if error and raise_errors:
+            raise error
+
+    def _print_deletion_error(self, error: DeletionError):
+        self.printer.print(
+            f"Deleted {len(error.deleted_ids)} row(s): {', '.join(error.deleted_ids)}"
+        )
+        self.printer.print(
+            f"Not deleted {len(error.failed_ids)} row(s): "
+            f"{', '.join(error.failed_ids)}"
+        )
+
+    def _terminate_biobanks(self, pids: List[str]) -> List[str]:
+        """Terminates PIDs in another thread and returns the output."""
+        with self.printer.buffer() as lines:
+            self.pid_manager.terminate_biobanks(pids)
+        return lines
+
+    def _checkpoint(self, node: Node, table: Table) -> Optional[Checkpoint]:
+        if self.journal is None:
+            return None
+        return self.journal.checkpoint(node, table.type.base_id)
+
+    def _print_skipped(self, checkpoint: Optional[Checkpoint]):
+        if checkpoint and checkpoint.skipped:
+            self.printer.print(
+                f"Skipped {checkpoint.skipped} batch(es) that were completed in a "
+                f"previous run"
+            )
+
+    def _get_deletable_ids(self, table: Table, existing_table: Table) -> Set[str]:
+        """
+        Returns the ids of the rows of a combined table that are not present in the
+        staging area's table. Rows that are referenced from the quality info tables
+        are left out and a warning is raised for each of them.
         """
         # Compare the ids from staging and production to see what was deleted
         staging_ids = {row["id"] for row in table.rows}
@@ -104,26 +640,26 @@ class Publisher:
         undeletable_ids = self.quality_info.get_qualities(table.type).keys()
         deletable_ids = deleted_ids.difference(undeletable_ids)
 
-        # For deleted biobanks, update the handle
-        if table.type == TableType.BIOBANKS:
-            self.pid_manager.terminate_biobanks(
-                [existing_table.rows_by_id[id_]["pid"] for id_ in deletable_ids]
-            )
-
-        # Actually delete the rows in the combined tables
-        if deletable_ids:
-            self.printer.print(
-                f"Deleting {len(deletable_ids)} row(s) in {table.type.base_id}"
-            )
-            self.session.delete_list(table.type.base_id, list(deletable_ids))
-
         # Show warning for every id that we prevented deletion of
         if deleted_ids != deletable_ids:
-            for id_ in undeletable_ids:
-                if id_ in deleted_ids:
-                    warning = EricWarning(
-                        f"Prevented the deletion of a row that is referenced from "
-                        f"the quality info: {table.type.value} {id_}."
-                    )
-                    self.printer.print_warning(warning)
-                    self.warnings.append(warning)
+            with self.printer.batch():
+                for id_ in undeletable_ids:
+                    if id_ in deleted_ids:
+                        warning = EricWarning(
+                            f"Prevented the deletion of a row that is referenced "
+                            f"from the quality info: {table.type.value} {id_}."
+                        )
+                        self.printer.print_warning(warning)
+                        self.warnings.append(warning)
+
+        return deletable_ids
+
+
+def _wrap(message: str, cause: Exception) -> EricError:
+    error = EricError(message)
+    error.__cause__ = cause
+    return error
+
+
+def _is_done(checkpoint: Optional[Checkpoint], table: Table) -> bool:
+    return checkpoint is not None and checkpoint.is_done("upsert", table.rows)
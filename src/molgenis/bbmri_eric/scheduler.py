@@ -0,0 +1,75 @@
+import json
+import threading
+from typing import Dict, List, Optional
+
+import requests
+
+from molgenis.bbmri_eric.bbmri_client import EricSession
+from molgenis.bbmri_eric.model import Node, NodeData
+from molgenis.client import MolgenisRequestError
+
+
+class NodeScheduler:
+    """
+    Decides in which order nodes are started when they are staged or published
+    concurrently. The largest nodes are started first: a large node that is started
+    last keeps the run going long after the other nodes are done.
+
+    The size of a node is the number of rows in its staging area. The sizes that were
+    recorded in a previous run are used when they are available. Other nodes are
+    counted with count queries, which only retrieve the number of rows.
+    """
+
+    def __init__(self, session: EricSession, sizes: Optional[Dict[str, int]] = None):
+        """
+        :param EricSession session: the session to count the rows with
+        :param sizes: the sizes of nodes by node code, for example from a previous run
+        """
+        self.session = session
+        self.sizes: Dict[str, int] = dict(sizes or {})
+        self._lock = threading.Lock()
+
+    def order(self, nodes: List[Node]) -> List[Node]:
+        """
+        Returns the nodes sorted from largest to smallest. Nodes of the same size, or
+        of which the size is unknown, keep their original order.
+        """
+        sizes = {node: self.estimate(node) for node in nodes}
+        return sorted(nodes, key=lambda node: sizes[node], reverse=True)
+
+    def estimate(self, node: Node) -> int:
+        """
+        Returns the size of a node. If the size wasn't recorded before, the rows of
+        its staging tables are counted. Returns 0 if the rows can't be counted.
+        """
+        with self._lock:
+            if node.code in self.sizes:
+                return self.sizes[node.code]
+
+        try:
+            size = self.session.get_staging_row_count(node)
+        except (MolgenisRequestError, requests.RequestException):
+            return 0
+
+        with self._lock:
+            self.sizes[node.code] = size
+        return size
+
+    def record(self, node_data: NodeData):
+        """Records the size of a node, to schedule it in next runs."""
+        size = sum(len(table.rows_by_id) for table in node_data.import_order)
+        with self._lock:
+            self.sizes[node_data.node.code] = size
+
+    def save(self, path: str):
+        """Writes the recorded sizes to a JSON file, so a next run can use them."""
+        with self._lock:
+            sizes = dict(self.sizes)
+        with open(path, "w") as file:
+            json.dump(sizes, file, indent=2, sort_keys=True)
+
+    @staticmethod
+    def load(session: EricSession, path: str) -> "NodeScheduler":
+        """Creates a scheduler with the sizes that were saved with save()."""
+        with open(path) as file:
+            return NodeScheduler(session, json.load(file))
@@ -0,0 +1,195 @@
+"""
+Versioned on-disk format for NodeData snapshots.
+
+A snapshot file consists of:
+1. The magic bytes ERICSNAP, followed by the format version (unsigned short) and the
+   length of the header (unsigned int), both big-endian
+2. A zlib-compressed JSON header describing the node, the source and, per table, its
+   metadata, row count and the location of its data block
+3. One zlib-compressed data block per table. Rows are stored column by column: each
+   column only stores the values of the rows that have a value for that attribute.
+
+Because the header knows where every table is stored, a single table can be read
+without decompressing the others. Files are read through a memory map.
+"""
+import json
+import mmap
+import struct
+import zlib
+from typing import Dict, List
+
+from molgenis.bbmri_eric.model import (
+    Node,
+    NodeData,
+    Source,
+    Table,
+    TableMeta,
+    TableType,
+)
+
+MAGIC = b"ERICSNAP"
+VERSION = 1
+_PREAMBLE = struct.Struct(">8sHI")
+
+
+def save_snapshot(node_data: NodeData, path: str):
+    """
+    Writes a NodeData object to a snapshot file.
+
+    :param NodeData node_data: the data to write
+    :param str path: the file to write to
+    """
+    blocks = [_encode_table(table) for table in node_data.import_order]
+
+    tables = []
+    offset = 0
+    for table, block in zip(node_data.import_order, blocks):
+        tables.append(
+            {
+                "type": table.type.value,
+                "meta": table.meta.meta,
+                "rows": len(table.rows_by_id),
+                "offset": offset,
+                "length": len(block),
+            }
+        )
+        offset += len(block)
+
+    header = json.dumps(
+        {
+            "node": node_data.node.to_dict(),
+            "source": node_data.source.value,
+            "tables": tables,
+        }
+    )
+    header = zlib.compress(header.encode("utf-8"))
+
+    with open(path, "wb") as file:
+        file.write(_PREAMBLE.pack(MAGIC, VERSION, len(header)))
+        file.write(header)
+        for block in blocks:
+            file.write(block)
+
+
+def load_snapshot(path: str) -> NodeData:
+    """
+    Reads a complete NodeData object from a snapshot file.
+
+    :param str path: the snapshot file
+    :return: a NodeData object
+    """
+    with SnapshotReader(path) as reader:
+        return reader.read_node_data()
+
+
+class SnapshotReader:
+    """
+    Reads a snapshot file through a memory map. Tables are decoded on request, so
+    reading a single table does not require loading the complete snapshot.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._read_header()
+        except Exception:
+            self._file.close()
+            raise
+
+    def __enter__(self) -> "SnapshotReader":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    @property
+    def table_types(self) -> List[TableType]:
+        return list(self._tables.keys())
+
+    def row_count(self, table_type: TableType) -> int:
+        return self._tables[table_type]["rows"]
+
+    def read_table(self, table_type: TableType) -> Table:
+        """
+        Decodes a single table of the snapshot.
+
+        :param TableType table_type: the table to read
+        :return: a Table object
+        """
+        info = self._tables[table_type]
+        start = self._data_start + info["offset"]
+        block = self._map[start : start + info["length"]]
+        return Table.of(
+            table_type=table_type,
+            meta=TableMeta(meta=info["meta"]),
+            rows=_decode_rows(block),
+        )
+
+    def read_node_data(self) -> NodeData:
+        tables = {type_: self.read_table(type_) for type_ in self.table_types}
+        return NodeData.from_dict(node=self.node, source=self.source, tables=tables)
+
+    def _read_header(self):
+        if len(self._map) < _PREAMBLE.size:
+            raise ValueError(f"{self.path} is not a snapshot file")
+
+        magic, version, header_length = _PREAMBLE.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a snapshot file")
+        if version > VERSION:
+            raise ValueError(
+                f"{self.path} has snapshot version {version}, only versions up to "
+                f"{VERSION} are supported"
+            )
+
+        header_start = _PREAMBLE.size
+        self._data_start = header_start + header_length
+        header = self._map[header_start : self._data_start]
+        header = json.loads(zlib.decompress(header))
+
+        self.node: Node = Node.from_dict(header["node"])
+        self.source = Source(header["source"])
+        self._tables: Dict[TableType, dict] = {
+            TableType(table["type"]): table for table in header["tables"]
+        }
+
+
+def _encode_table(table: Table) -> bytes:
+    """
+    Encodes the rows of a table column by column. Columns that have a value in every
+    row only store the values, sparse columns also store the positions of the rows.
+    """
+    rows = list(table.rows)
+    columns: Dict[str, dict] = dict()
+    for position, row in enumerate(rows):
+        for name, value in row.items():
+            column = columns.get(name)
+            if column is None:
+                column = columns[name] = {"rows": [], "values": []}
+            column["rows"].append(position)
+            column["values"].append(value)
+
+    for column in columns.values():
+        if len(column["rows"]) == len(rows):
+            column["rows"] = None
+
+    encoded = json.dumps({"count": len(rows), "columns": columns})
+    return zlib.compress(encoded.encode("utf-8"))
+
+
+def _decode_rows(block: bytes) -> List[dict]:
+    decoded = json.loads(zlib.decompress(block))
+    rows = [dict() for _ in range(decoded["count"])]
+    for name, column in decoded["columns"].items():
+        positions = column["rows"]
+        if positions is None:
+            positions = range(len(rows))
+        for position, value in zip(positions, column["values"]):
+            rows[position][name] = value
+    return rows
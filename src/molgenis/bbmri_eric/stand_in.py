@@ -0,0 +1,768 @@
+"""
+A local stand-in for a MOLGENIS server, for integration and load tests. It implements
+the part of the REST API that this library uses:
+
+    POST   /api/v1/login
+    GET    /api/v1/<entity type>/meta
+    DELETE /api/v1/<entity type>           deletes all rows
+    GET    /api/metadata/<entity type>
+    GET    /api/v2/<entity type>           supports q, attrs, sort, num and start
+    GET    /api/v2/<entity type>/<id>
+    POST   /api/v2/<entity type>           adds rows
+    PUT    /api/v2/<entity type>           updates rows
+    DELETE /api/v2/<entity type>           deletes rows by id
+
+The data is kept in memory. Like MOLGENIS, the server refuses batches of more than
+max_batch_size rows, unknown attributes, missing required values and references to rows
+that don't exist. References are only checked if the referenced table was added to the
+server. Deleting rows that are still referenced is allowed. One-to-many attributes are
+not derived from the references: rows only have the values they were added with.
+
+StandInPidService stands in for the handle server. It keeps its handles in memory
+instead of serving them over HTTP.
+
+>>> with StandInServer(latency=0.01) as server:
+...     server.add_node_data(node_data)
+...     session = EricSession(url=server.url)
+"""
+
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, quote, unquote, urlparse
+
+from molgenis.bbmri_eric.errors import EricError
+from molgenis.bbmri_eric.model import NodeData, TableMeta, TableSchema
+from molgenis.bbmri_eric.pid_service import BasePidService, Status
+
+_RSQL_TOKEN = re.compile(
+    r"""\s*(?:(?P<punctuation>[();,])|(?P<operator>==|!=|=in=|=out=)"""
+    r"""|"(?P<double>(?:[^"\\]|\\.)*)"|'(?P<single>(?:[^'\\]|\\.)*)'"""
+    r"""|(?P<word>[^\s();,=!"']+))"""
+)
+
+
+@dataclass
+class Failure:
+    """
+    A failure to inject: matching requests are answered with an error status instead
+    of being handled.
+    """
+
+    method: Optional[str] = None
+    """The HTTP method to fail, or None for all methods"""
+
+    path: Optional[str] = None
+    """A regular expression that is searched for in the path, or None for all paths"""
+
+    status: int = 500
+
+    times: Optional[int] = 1
+    """The number of requests to fail, or None to keep failing"""
+
+    probability: float = 1.0
+    """The chance that a matching request fails"""
+
+    def matches(self, method: str, path: str) -> bool:
+        return (self.method is None or self.method == method) and (
+            self.path is None or re.search(self.path, path) is not None
+        )
+
+
+class StandInError(Exception):
+    """An error that is returned to the client with an HTTP status."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class _Table:
+    """
+    The rows of a table, in the order they were added. The indexes and sort orders
+    that are used to query the rows are built when first needed, and dropped when the
+    rows change.
+    """
+
+    def __init__(self, meta: TableMeta):
+        self.meta = meta
+        self.schema: TableSchema = meta.schema
+        self.rows: "OrderedDict[str, dict]" = OrderedDict()
+        self._indexes: Dict[str, Dict[str, Set[str]]] = dict()
+        self._sorted: Dict[str, List[dict]] = dict()
+        self._positions: Optional[Dict[str, int]] = None
+
+    def changed(self):
+        self._indexes.clear()
+        self._sorted.clear()
+        self._positions = None
+
+    def lookup(self, attribute: str, values: Set[str]) -> Set[str]:
+        """Returns the ids of the rows with one of the values for an attribute."""
+        if attribute not in self._indexes:
+            index = defaultdict(set)
+            for id_, row in self.rows.items():
+                value = row.get(attribute)
+                for item in value if isinstance(value, list) else [value]:
+                    index[_to_text(item)].add(id_)
+            self._indexes[attribute] = index
+        index = self._indexes[attribute]
+        return set().union(*(index.get(value, ()) for value in values))
+
+    def in_order(self, ids: Set[str]) -> List[dict]:
+        """Returns the rows with the given ids, in the order they were added."""
+        if self._positions is None:
+            self._positions = {id_: i for i, id_ in enumerate(self.rows)}
+        return [self.rows[id_] for id_ in sorted(ids, key=self._positions.__getitem__)]
+
+    def sorted_rows(self, attribute: str) -> List[dict]:
+        if attribute not in self._sorted:
+            self._sorted[attribute] = sorted(
+                self.rows.values(), key=lambda row: _sort_key(row.get(attribute))
+            )
+        return self._sorted[attribute]
+
+
+class StandInServer:
+    """
+    A MOLGENIS stand-in that runs in a background thread. Can be used as a context
+    manager, which starts and stops the server.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        row_latency: float = 0.0,
+        page_size: int = 10000,
+        max_batch_size: int = 1000,
+        credentials: Optional[Tuple[str, str]] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        seed: int = 0,
+    ):
+        """
+        :param float latency: the number of seconds every request takes
+        :param float row_latency: the number of seconds that is added to a request
+                                  for every row that is read or written
+        :param int page_size: the maximum number of rows that is returned per request
+        :param int max_batch_size: the maximum number of rows per write request
+        :param credentials: the username and password to log in with, if provided
+                            all other requests need the token of the login
+        :param int port: the port to listen on, 0 picks a free port
+        :param int seed: the seed of the failures that have a probability
+        """
+        self.latency = latency
+        self.row_latency = row_latency
+        self.page_size = page_size
+        self.max_batch_size = max_batch_size
+        self.credentials = credentials
+        self.failures: List[Failure] = list()
+        self.request_count = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self._random = random.Random(seed)
+        self._tokens = set()
+        self._tables: Dict[str, _Table] = dict()
+        self._lock = threading.RLock()
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.stand_in = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self) -> "StandInServer":
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, name="stand-in", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self) -> "StandInServer":
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def add_table(self, meta: TableMeta, rows: Iterable[dict] = ()):
+        """
+        Adds a table (or replaces it) with its rows, in the uploadable format. The rows
+        are not checked.
+        """
+        table = _Table(meta)
+        id_attribute = table.schema.id_attribute
+        for row in rows:
+            table.rows[row[id_attribute]] = dict(row)
+        with self._lock:
+            self._tables[meta.id] = table
+
+    def add_node_data(self, node_data: NodeData):
+        """Adds the four tables of a node, under the ids of their metadata."""
+        for table in node_data.import_order:
+            self.add_table(table.meta, table.rows)
+
+    def rows(self, entity_type_id: str) -> List[dict]:
+        """Returns copies of the rows of a table."""
+        with self._lock:
+            return [dict(row) for row in self._get_table(entity_type_id).rows.values()]
+
+    def fail(self, failure: Failure):
+        """Injects a failure. Failures are tried in the order they were added."""
+        with self._lock:
+            self.failures.append(failure)
+
+    def handle(
+        self, method: str, url: str, headers: Dict[str, str], body: bytes
+    ) -> Tuple[int, bytes]:
+        """Handles a request and returns the status and the JSON content to respond."""
+        parsed = urlparse(url)
+        path = unquote(parsed.path)
+        query = parse_qs(parsed.query)
+        data = json.loads(body) if body else None
+        rows = 0
+        try:
+            with self._lock:
+                self.request_count += 1
+                self.request_bytes += len(body)
+                self._inject_failure(method, path)
+                if not path.endswith("/v1/login"):
+                    self._authorize(headers)
+                status, document, rows = self._route(method, path, query, data)
+        except StandInError as e:
+            status, document = e.status, {"errors": [{"message": e.message}]}
+
+        content = json.dumps(document).encode("utf-8") if document is not None else b""
+        with self._lock:
+            self.response_bytes += len(content)
+
+        delay = self.latency + self.row_latency * rows
+        if delay:
+            time.sleep(delay)
+        return status, content
+
+    def _inject_failure(self, method: str, path: str):
+        for failure in self.failures:
+            if failure.matches(method, path):
+                if self._random.random() >= failure.probability:
+                    return
+                if failure.times is not None:
+                    failure.times -= 1
+                    if failure.times <= 0:
+                        self.failures.remove(failure)
+                raise StandInError(failure.status, "Injected failure")
+
+    def _authorize(self, headers: Dict[str, str]):
+        if self.credentials and headers.get("x-molgenis-token") not in self._tokens:
+            raise StandInError(401, "No (valid) authentication token found.")
+
+    def _route(
+        self, method: str, path: str, query: Dict[str, List[str]], data
+    ) -> Tuple[int, Optional[dict], int]:
+        parts = [part for part in path.split("/") if part]
+        if len(parts) < 3 or parts[0] != "api":
+            raise StandInError(404, f"Unknown path: {path}")
+        api, entity_type_id, rest = parts[1], parts[2], parts[3:]
+
+        if api == "v1" and entity_type_id == "login" and method == "POST":
+            return 200, self._login(data), 0
+        if api == "v1" and rest == ["meta"] and method == "GET":
+            return 200, self._get_v1_meta(entity_type_id), 0
+        if api == "v1" and not rest and method == "DELETE":
+            return 204, None, self._delete_all(entity_type_id)
+        if api == "metadata" and not rest and method == "GET":
+            return 200, self._get_table(entity_type_id).meta.meta, 0
+        if api == "v2" and len(rest) == 1 and method == "GET":
+            document = self._get_row(entity_type_id, rest[0], query)
+            return 200, document, 1
+        if api == "v2" and not rest:
+            if method == "GET":
+                document = self._get_rows(entity_type_id, query)
+                return 200, document, len(document["items"])
+            entities = (data or {}).get(
+                "entityIds" if method == "DELETE" else "entities"
+            )
+            if entities is None:
+                raise StandInError(400, "Missing entities in request body")
+            self._check_batch_size(entities)
+            if method == "POST":
+                return 201, self._add(entity_type_id, entities), len(entities)
+            if method == "PUT":
+                self._update(entity_type_id, entities)
+                return 204, None, len(entities)
+            if method == "DELETE":
+                self._delete(entity_type_id, entities)
+                return 204, None, len(entities)
+        raise StandInError(404, f"Unsupported request: {method} {path}")
+
+    def _login(self, data: dict) -> dict:
+        credentials = (data.get("username"), data.get("password"))
+        if self.credentials and credentials != self.credentials:
+            raise StandInError(401, "Login failed")
+        token = uuid.uuid4().hex
+        self._tokens.add(token)
+        return {"token": token, "username": credentials[0]}
+
+    def _get_table(self, entity_type_id: str) -> _Table:
+        if entity_type_id not in self._tables:
+            raise StandInError(404, f"Unknown entity type [{entity_type_id}]")
+        return self._tables[entity_type_id]
+
+    def _get_v1_meta(self, entity_type_id: str) -> dict:
+        table = self._get_table(entity_type_id)
+        return {
+            "href": f"/api/v1/{entity_type_id}/meta",
+            "name": entity_type_id,
+            "idAttribute": table.schema.id_attribute,
+        }
+
+    def _get_row(self, entity_type_id: str, id_: str, query) -> dict:
+        table = self._get_table(entity_type_id)
+        if id_ not in table.rows:
+            raise StandInError(
+                404, f"Unknown entity [{id_}] of type [{entity_type_id}]"
+            )
+        return self._to_response(table, table.rows[id_], _attributes(query))
+
+    def _get_rows(self, entity_type_id: str, query: Dict[str, List[str]]) -> dict:
+        table = self._get_table(entity_type_id)
+        attribute, _, order = query.get("sort", [""])[0].partition(":")
+        if "q" in query:
+            predicate = parse_rsql(query["q"][0])
+            ids = predicate.candidates(table)
+            if ids is None:
+                rows = list(table.rows.values())
+            else:
+                rows = table.in_order(ids)
+            rows = [row for row in rows if predicate(row)]
+            if attribute:
+                rows.sort(key=lambda row: _sort_key(row.get(attribute)))
+        elif attribute:
+            rows = table.sorted_rows(attribute)
+        else:
+            rows = list(table.rows.values())
+        if order.lower() == "desc":
+            rows = rows[::-1]
+
+        start = int(query.get("start", ["0"])[0])
+        num = min(int(query.get("num", ["100"])[0]), self.page_size)
+        page = rows[start : start + num]
+        attributes = _attributes(query)
+
+        href = f"/api/v2/{quote(entity_type_id)}"
+        document = {
+            "href": href,
+            "start": start,
+            "num": num,
+            "total": len(rows),
+            "items": [self._to_response(table, row, attributes) for row in page],
+        }
+        if start + num < len(rows):
+            document["nextHref"] = f"{href}?num={num}&start={start + num}"
+        return document
+
+    def _to_response(
+        self, table: _Table, row: dict, attributes: Optional[List[str]]
+    ) -> dict:
+        """Converts a row to the format of the REST API: references become objects."""
+        schema = table.schema
+        id_ = row[schema.id_attribute]
+        response = {"_href": f"/api/v2/{quote(schema.id)}/{quote(str(id_))}"}
+        for name in attributes or schema.attribute_names:
+            if name not in row:
+                continue
+            value = row[name]
+            if name in schema.single_references and value is not None:
+                value = self._to_reference(schema.ref_entity_types[name], value)
+            elif name in schema.multi_references:
+                ref_id = schema.ref_entity_types[name]
+                value = [self._to_reference(ref_id, ref) for ref in value or []]
+            response[name] = value
+        return response
+
+    def _to_reference(self, entity_type_id: str, id_) -> dict:
+        table = self._tables.get(entity_type_id)
+        id_attribute = table.schema.id_attribute if table else "id"
+        return {
+            "_href": f"/api/v2/{quote(entity_type_id)}/{quote(str(id_))}",
+            id_attribute: id_,
+        }
+
+    def _check_batch_size(self, entities: List):
+        if len(entities) > self.max_batch_size:
+            raise StandInError(
+                400,
+                f"Number of entities cannot be more than {self.max_batch_size}.",
+            )
+
+    def _add(self, entity_type_id: str, entities: List[dict]) -> dict:
+        table = self._get_table(entity_type_id)
+        id_attribute = table.schema.id_attribute
+        added = OrderedDict()
+        for entity in entities:
+            id_ = entity.get(id_attribute)
+            if id_ in table.rows or id_ in added:
+                raise StandInError(
+                    400,
+                    f"Duplicate value '{id_}' for unique attribute '{id_attribute}'",
+                )
+            added[id_] = dict(entity)
+        for entity in entities:
+            self._check_entity(table, entity, added)
+
+        table.rows.update(added)
+        table.changed()
+        href = f"/api/v2/{quote(entity_type_id)}"
+        return {
+            "location": f"{href}?q={id_attribute}=in=({','.join(map(str, added))})",
+            "resources": [{"href": f"{href}/{quote(str(id_))}"} for id_ in added],
+        }
+
+    def _update(self, entity_type_id: str, entities: List[dict]):
+        table = self._get_table(entity_type_id)
+        id_attribute = table.schema.id_attribute
+        updated = OrderedDict()
+        for entity in entities:
+            id_ = entity.get(id_attribute)
+            if id_ not in table.rows:
+                raise StandInError(
+                    400, f"Unknown entity [{id_}] of type [{entity_type_id}]"
+                )
+            updated[id_] = dict(entity)
+        for entity in entities:
+            self._check_entity(table, entity, updated)
+        table.rows.update(updated)
+        table.changed()
+
+    def _check_entity(self, table: _Table, entity: dict, batch: Dict[str, dict]):
+        """
+        Checks the attributes and references of a row that is added or updated. The
+        other rows of the same batch can be referenced, in any order.
+        """
+        schema = table.schema
+        id_ = entity.get(schema.id_attribute)
+        if id_ is None:
+            raise StandInError(400, f"Missing id attribute in [{schema.id}]")
+
+        unknown = set(entity).difference(schema.attribute_names)
+        if unknown:
+            raise StandInError(
+                400, f"Unknown attribute(s) {sorted(unknown)} of [{schema.id}]"
+            )
+        missing = [name for name in schema.required if entity.get(name) is None]
+        if missing:
+            raise StandInError(
+                400, f"The attribute(s) {missing} of entity [{id_}] can't be null"
+            )
+
+        for name in schema.references:
+            ref_table = self._tables.get(schema.ref_entity_types[name])
+            value = entity.get(name)
+            if ref_table is None or value is None:
+                continue
+            for ref in value if isinstance(value, list) else [value]:
+                known = ref in ref_table.rows or (ref_table is table and ref in batch)
+                if not known:
+                    raise StandInError(
+                        400,
+                        f"Unknown xref value '{ref}' for attribute '{name}' of "
+                        f"entity [{id_}]",
+                    )
+
+    def _delete(self, entity_type_id: str, ids: List[str]):
+        table = self._get_table(entity_type_id)
+        for id_ in ids:
+            table.rows.pop(id_, None)
+        table.changed()
+
+    def _delete_all(self, entity_type_id: str) -> int:
+        table = self._get_table(entity_type_id)
+        count = len(table.rows)
+        table.rows.clear()
+        table.changed()
+        return count
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._respond("GET")
+
+    def do_POST(self):
+        self._respond("POST")
+
+    def do_PUT(self):
+        self._respond("PUT")
+
+    def do_DELETE(self):
+        self._respond("DELETE")
+
+    def _respond(self, method: str):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        headers = {key.lower(): value for key, value in self.headers.items()}
+
+        status, content = self.server.stand_in.handle(method, self.path, headers, body)
+
+        self.send_response(status)
+        if content:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInPidService(BasePidService):
+    """
+    A handle server that keeps its handles in memory. Every operation takes a
+    configurable number of seconds, like a request to a real handle server would. Can
+    be shared by threads.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        prefix: str = "21.12110",
+        base_url: str = "https://directory.example.org/",
+    ):
+        """
+        :param float latency: the number of seconds every operation takes
+        :param str prefix: the prefix of the PIDs that are registered
+        :param str base_url: the base URL to which the PIDs link
+        """
+        self.latency = latency
+        self.prefix = prefix
+        self.base_url = base_url
+        self.operation_count = 0
+        self.handles: Dict[str, Dict[str, str]] = dict()
+        self._pids_by_url: Dict[str, List[str]] = dict()
+        self._lock = threading.Lock()
+
+    def add_handle(self, pid: str, url: str, name: str):
+        """Adds an existing handle, without counting it as an operation."""
+        with self._lock:
+            self.handles[pid] = {"URL": url, "NAME": name}
+            self._pids_by_url.setdefault(url, []).append(pid)
+
+    def reverse_lookup(self, url: str) -> Optional[List[str]]:
+        with self._operation():
+            return list(self._pids_by_url.get(url, []))
+
+    def register_pid(self, url: str, name: str) -> str:
+        pid = self.generate_pid(self.prefix)
+        with self._operation():
+            self.handles[pid] = {"URL": url, "NAME": name}
+            self._pids_by_url.setdefault(url, []).append(pid)
+        return pid
+
+    def set_name(self, pid: str, new_name: str):
+        with self._operation():
+            self._get_handle(pid)["NAME"] = new_name
+
+    def set_status(self, pid: str, status: Status):
+        with self._operation():
+            self._get_handle(pid)["STATUS"] = status.value
+
+    def _get_handle(self, pid: str) -> Dict[str, str]:
+        if pid not in self.handles:
+            raise EricError(f"Handle not found on handle server: {pid}")
+        return self.handles[pid]
+
+    @contextmanager
+    def _operation(self):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.operation_count += 1
+            yield
+
+
+class _Query:
+    """A parsed RSQL query, which is called with a row to tell whether it matches."""
+
+    def __call__(self, row: dict) -> bool:
+        raise NotImplementedError
+
+    def candidates(self, table: _Table) -> Optional[Set[str]]:
+        """
+        Returns the ids of the rows that might match, looked up in the indexes of the
+        table, or None if all rows have to be checked.
+        """
+        return None
+
+
+class _Comparison(_Query):
+    def __init__(self, attribute: str, values: Set[str], negate: bool):
+        self.attribute = attribute
+        self.values = values
+        self.negate = negate
+
+    def __call__(self, row: dict) -> bool:
+        return _matches(row.get(self.attribute), self.values) != self.negate
+
+    def candidates(self, table: _Table) -> Optional[Set[str]]:
+        return None if self.negate else table.lookup(self.attribute, self.values)
+
+
+class _And(_Query):
+    def __init__(self, operands: List[_Query]):
+        self.operands = operands
+
+    def __call__(self, row: dict) -> bool:
+        return all(operand(row) for operand in self.operands)
+
+    def candidates(self, table: _Table) -> Optional[Set[str]]:
+        for operand in self.operands:
+            ids = operand.candidates(table)
+            if ids is not None:
+                return ids
+        return None
+
+
+class _Or(_Query):
+    def __init__(self, operands: List[_Query]):
+        self.operands = operands
+
+    def __call__(self, row: dict) -> bool:
+        return any(operand(row) for operand in self.operands)
+
+    def candidates(self, table: _Table) -> Optional[Set[str]]:
+        ids = set()
+        for operand in self.operands:
+            operand_ids = operand.candidates(table)
+            if operand_ids is None:
+                return None
+            ids.update(operand_ids)
+        return ids
+
+
+def parse_rsql(query: str) -> _Query:
+    """
+    Parses an RSQL query into a callable that tells whether a row matches. Supports
+    the ==, !=, =in= and =out= comparisons, combined with ; (and), , (or) and
+    parentheses. A comparison with a list attribute matches if any of its values
+    matches.
+    """
+    tokens = _tokenize(query)
+    parsed, position = _parse_or(tokens, 0)
+    if position != len(tokens):
+        raise StandInError(400, f"Invalid RSQL query: {query}")
+    return parsed
+
+
+def _tokenize(query: str) -> List[Tuple[str, str]]:
+    tokens = list()
+    position = 0
+    query = query.strip()
+    while position < len(query):
+        match = _RSQL_TOKEN.match(query, position)
+        if not match or match.end() == position:
+            raise StandInError(400, f"Invalid RSQL query: {query}")
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind in ("double", "single"):
+            kind, text = "word", re.sub(r"\\(.)", r"\1", text)
+        tokens.append((kind, text))
+        position = match.end()
+    return tokens
+
+
+def _parse_or(tokens, position) -> Tuple[_Query, int]:
+    operands = list()
+    while True:
+        operand, position = _parse_and(tokens, position)
+        operands.append(operand)
+        if position < len(tokens) and tokens[position] == ("punctuation", ","):
+            position += 1
+        else:
+            return (_Or(operands) if len(operands) > 1 else operand), position
+
+
+def _parse_and(tokens, position) -> Tuple[_Query, int]:
+    operands = list()
+    while True:
+        operand, position = _parse_comparison(tokens, position)
+        operands.append(operand)
+        if position < len(tokens) and tokens[position] == ("punctuation", ";"):
+            position += 1
+        else:
+            return (_And(operands) if len(operands) > 1 else operand), position
+
+
+def _parse_comparison(tokens, position) -> Tuple[_Query, int]:
+    def expect(kind: str, text: Optional[str] = None) -> str:
+        nonlocal position
+        if position >= len(tokens) or tokens[position][0] != kind:
+            raise StandInError(400, "Invalid RSQL query")
+        token_text = tokens[position][1]
+        if text is not None and token_text != text:
+            raise StandInError(400, "Invalid RSQL query")
+        position += 1
+        return token_text
+
+    if position < len(tokens) and tokens[position] == ("punctuation", "("):
+        parsed, position = _parse_or(tokens, position + 1)
+        expect("punctuation", ")")
+        return parsed, position
+
+    attribute = expect("word")
+    operator = expect("operator")
+    if operator in ("=in=", "=out="):
+        expect("punctuation", "(")
+        values = {expect("word")}
+        while position < len(tokens) and tokens[position] == ("punctuation", ","):
+            position += 1
+            values.add(expect("word"))
+        expect("punctuation", ")")
+    else:
+        values = {expect("word")}
+
+    return _Comparison(attribute, values, operator in ("!=", "=out=")), position
+
+
+def _matches(value, values: set) -> bool:
+    if isinstance(value, list):
+        return any(_to_text(item) in values for item in value)
+    return _to_text(value) in values
+
+
+def _to_text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _attributes(query: Dict[str, List[str]]) -> Optional[List[str]]:
+    """Returns the attributes of the attrs parameter, without expands."""
+    if "attrs" not in query:
+        return None
+    attributes = [attr.split("(")[0] for attr in query["attrs"][0].split(",")]
+    return None if "*" in attributes else attributes
+
+
+def _sort_key(value):
+    return (value is not None, _to_text(value))
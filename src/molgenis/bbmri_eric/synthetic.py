@@ -0,0 +1,521 @@
+"""
+Deterministic synthetic data for benchmarks and stress tests. The generator produces
+the NodeData of any node, with the same identifiers, references and values every time
+it is given the same Spec:
+
+>>> generator = Generator(Spec.of_rows(100_000))
+>>> eu_node_data = generator.node_data(Node("EU", "Europe"))
+>>> node_data = generator.node_data(Node("NL", "Netherlands"))
+>>> quality_info = generator.quality_info(node_data)
+
+The persons and networks of a node partly refer to rows of node EU (see
+Spec.eu_fraction). The data of node EU that is generated with the same Spec contains
+all of these rows.
+"""
+import itertools
+import random
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from molgenis.bbmri_eric.model import (
+    ExternalServerNode,
+    Node,
+    NodeData,
+    QualityInfo,
+    Source,
+    Table,
+    TableMeta,
+    TableType,
+)
+
+_URL = "https://synthetic.example.org"
+_NODES_TABLE = "eu_bbmri_eric_national_nodes"
+
+_ATTRIBUTES: Dict[TableType, List[Tuple[str, str, Optional[str], bool]]] = {
+    TableType.PERSONS: [
+        ("id", "string", None, False),
+        ("first_name", "string", None, True),
+        ("last_name", "string", None, True),
+        ("email", "email", None, False),
+        ("country", "xref", "eu_bbmri_eric_countries", False),
+        ("biobanks", "onetomany", TableType.BIOBANKS.value, True),
+        ("collections", "onetomany", TableType.COLLECTIONS.value, True),
+        ("networks", "onetomany", TableType.NETWORKS.value, True),
+    ],
+    TableType.NETWORKS: [
+        ("id", "string", None, False),
+        ("name", "string", None, False),
+        ("description", "text", None, True),
+        ("contact", "xref", TableType.PERSONS.value, False),
+        ("parent_network", "mref", TableType.NETWORKS.value, True),
+    ],
+    TableType.BIOBANKS: [
+        ("id", "string", None, False),
+        ("name", "string", None, False),
+        ("juridical_person", "string", None, False),
+        ("country", "xref", "eu_bbmri_eric_countries", False),
+        ("contact", "xref", TableType.PERSONS.value, True),
+        ("collections", "onetomany", TableType.COLLECTIONS.value, True),
+        ("network", "mref", TableType.NETWORKS.value, True),
+        ("collaboration_commercial", "bool", None, True),
+        ("capabilities", "categoricalmref", "eu_bbmri_eric_capabilities", True),
+    ],
+    TableType.COLLECTIONS: [
+        ("id", "string", None, False),
+        ("country", "categorical", "eu_bbmri_eric_countries", False),
+        ("biobank", "xref", TableType.BIOBANKS.value, False),
+        ("name", "string", None, False),
+        ("description", "text", None, True),
+        ("network", "mref", TableType.NETWORKS.value, True),
+        ("type", "categoricalmref", "eu_bbmri_eric_collection_types", False),
+        ("data_categories", "categoricalmref", "eu_bbmri_eric_data_types", False),
+        ("order_of_magnitude", "categorical", "eu_bbmri_eric_biobank_size", False),
+        ("size", "int", None, True),
+        ("parent_collection", "xref", TableType.COLLECTIONS.value, True),
+        ("sub_collections", "onetomany", TableType.COLLECTIONS.value, True),
+        ("contact", "xref", TableType.PERSONS.value, False),
+        ("materials", "categoricalmref", "eu_bbmri_eric_material_types", True),
+        ("collaboration_commercial", "bool", None, True),
+    ],
+}
+"""The attributes of the tables: name, type, referenced table and nullability. The
+references to the four node tables are given as TableType values."""
+
+_PUBLISHED_ATTRIBUTES: Dict[TableType, List[Tuple[str, str, Optional[str], bool]]] = {
+    TableType.PERSONS: [],
+    TableType.NETWORKS: [],
+    TableType.BIOBANKS: [
+        ("pid", "string", None, True),
+        ("quality", "onetomany", "eu_bbmri_eric_bio_qual_info", True),
+    ],
+    TableType.COLLECTIONS: [
+        ("commercial_use", "bool", None, True),
+        ("combined_network", "mref", TableType.NETWORKS.value, True),
+        ("quality", "onetomany", "eu_bbmri_eric_col_qual_info", True),
+    ],
+}
+"""The attributes that only the published tables have, besides national_node"""
+
+_WORDS = (
+    "biobank cancer cohort population tissue blood serum plasma DNA study registry "
+    "hospital university regional national research clinical genetic rare disease "
+    "longitudinal pediatric"
+).split()
+
+
+def _combinations(values: List[str], smallest: int, largest: int) -> List[tuple]:
+    """All combinations of a number of values, to pick categorical mref values from."""
+    return [
+        combination
+        for size in range(smallest, largest + 1)
+        for combination in itertools.combinations(values, size)
+    ]
+
+
+_CAPABILITIES = _combinations(
+    ["biomaterial-storage", "data-storage", "recontact", "tma-creation"], 0, 3
+)
+_COLLECTION_TYPES = _combinations(
+    ["CASE_CONTROL", "COHORT", "DISEASE_SPECIFIC", "HOSPITAL"], 1, 2
+)
+_DATA_CATEGORIES = _combinations(
+    ["BIOLOGICAL_SAMPLES", "MEDICAL_RECORDS", "SURVEY_DATA"], 1, 2
+)
+_MATERIALS = _combinations(
+    ["DNA", "PLASMA", "SERUM", "TISSUE_FROZEN", "WHOLE_BLOOD"], 0, 3
+)
+
+
+@dataclass(frozen=True)
+class Spec:
+    """
+    Describes the synthetic data of a node.
+    """
+
+    persons: int = 20
+    networks: int = 5
+    biobanks: int = 10
+    collections: int = 50
+
+    max_networks: int = 3
+    """The maximum number of networks that a biobank or collection refers to"""
+
+    collection_depth: int = 3
+    """The number of levels of the parent_collection hierarchies of a biobank"""
+
+    eu_fraction: float = 0.1
+    """The fraction of persons and networks that are rows of node EU"""
+
+    quality_fraction: float = 0.2
+    """The fraction of biobanks and collections that have quality info"""
+
+    invalid_fraction: float = 0.0
+    """The fraction of rows with an invalid identifier"""
+
+    seed: int = 0
+
+    @property
+    def rows(self) -> int:
+        return self.persons + self.networks + self.biobanks + self.collections
+
+    @staticmethod
+    def of_rows(rows: int, **kwargs) -> "Spec":
+        """
+        Factory method that spreads a total number of rows over the tables in the
+        proportions of a typical node: mostly collections.
+
+        :param int rows: the total number of rows
+        :param kwargs: the other fields of the Spec
+        """
+        persons = max(1, rows // 5)
+        networks = max(1, rows // 50)
+        biobanks = max(1, rows // 10)
+        collections = max(1, rows - persons - networks - biobanks)
+        return Spec(
+            persons=persons,
+            networks=networks,
+            biobanks=biobanks,
+            collections=collections,
+            **kwargs,
+        )
+
+
+class Generator:
+    """
+    Generates the synthetic data of nodes, based on a Spec.
+    """
+
+    def __init__(self, spec: Spec):
+        self.spec = spec
+
+    def node_data(self, node: Node, source: Source = Source.STAGING) -> NodeData:
+        """
+        Generates the data of a node. The published data has the same rows as the
+        staging data, with the national node code and PIDs that publishing adds.
+
+        :param Node node: the node to generate the data of
+        :param Source source: determines the table ids and attributes, the tables of
+                              an external server have the ids of the published
+                              tables and the attributes of the staging tables
+        """
+        rng = random.Random(f"{self.spec.seed}:{node.code}")
+        ids = _Ids(node, self.spec)
+        links = _Links(self.spec, rng)
+
+        rows = {
+            TableType.PERSONS: self._persons(ids, links),
+            TableType.NETWORKS: self._networks(ids, links, rng),
+            TableType.BIOBANKS: self._biobanks(node, ids, links, rng),
+            TableType.COLLECTIONS: self._collections(node, ids, links, rng),
+        }
+        tables = dict()
+        for table_type in TableType.get_import_order():
+            table_rows = rows[table_type]
+            if source == Source.PUBLISHED:
+                table_rows = _published(node, table_type, table_rows)
+            tables[table_type] = Table.of(
+                table_type, _meta(node, table_type, source), table_rows
+            )
+        return NodeData.from_dict(node, source, tables)
+
+    def quality_info(self, *node_data: NodeData) -> QualityInfo:
+        """Generates quality info for a fraction of the biobanks and collections."""
+        biobanks = dict()
+        collections = dict()
+        for data in node_data:
+            rng = random.Random(f"{self.spec.seed}:{data.node.code}:quality")
+            for table, qualities in (
+                (data.biobanks, biobanks),
+                (data.collections, collections),
+            ):
+                for id_ in table.rows_by_id:
+                    if rng.random() < self.spec.quality_fraction:
+                        count = rng.randint(1, 3)
+                        qualities[id_] = [
+                            str(rng.randrange(1_000_000)) for _ in range(count)
+                        ]
+        return QualityInfo(biobanks=biobanks, collections=collections)
+
+    def _persons(self, ids: "_Ids", links: "_Links") -> Iterator[dict]:
+        for i in range(self.spec.persons):
+            yield {
+                "id": ids.persons[i],
+                "first_name": f"First{i}",
+                "last_name": f"Last{i}",
+                "email": f"person{i}@example.org",
+                "country": ids.node.code,
+                "biobanks": [ids.biobanks[b] for b in links.biobanks_of_person[i]],
+                "collections": [
+                    ids.collections[c] for c in links.collections_of_person[i]
+                ],
+                "networks": [ids.networks[n] for n in links.networks_of_person[i]],
+            }
+
+    def _networks(
+        self, ids: "_Ids", links: "_Links", rng: random.Random
+    ) -> Iterator[dict]:
+        for i in range(self.spec.networks):
+            yield {
+                "id": ids.networks[i],
+                "name": f"Network {i}",
+                "description": _text(rng, 12),
+                "contact": ids.persons[links.network_contacts[i]],
+                "parent_network": [ids.networks[rng.randrange(i)]] if i > 0 else [],
+            }
+
+    def _biobanks(
+        self, node: Node, ids: "_Ids", links: "_Links", rng: random.Random
+    ) -> Iterator[dict]:
+        for i in range(self.spec.biobanks):
+            yield {
+                "id": ids.biobanks[i],
+                "name": f"Biobank {i} {_text(rng, 3)}",
+                "juridical_person": f"Juridical person {i}",
+                "country": node.code,
+                "contact": ids.persons[links.biobank_contacts[i]],
+                "collections": [
+                    ids.collections[c] for c in links.collections_of_biobank[i]
+                ],
+                "network": [ids.networks[n] for n in links.networks(rng)],
+                "collaboration_commercial": rng.random() < 0.5,
+                "capabilities": list(rng.choice(_CAPABILITIES)),
+            }
+
+    def _collections(
+        self, node: Node, ids: "_Ids", links: "_Links", rng: random.Random
+    ) -> Iterator[dict]:
+        for i in range(self.spec.collections):
+            row = {
+                "id": ids.collections[i],
+                "country": node.code,
+                "biobank": ids.biobanks[links.collection_biobanks[i]],
+                "name": f"Collection {i} {_text(rng, 3)}",
+                "description": _text(rng, 30),
+                "network": [ids.networks[n] for n in links.networks(rng)],
+                "type": list(rng.choice(_COLLECTION_TYPES)),
+                "data_categories": list(rng.choice(_DATA_CATEGORIES)),
+                "order_of_magnitude": rng.randint(0, 6),
+                "size": rng.randint(1, 1_000_000),
+                "sub_collections": [
+                    ids.collections[c] for c in links.sub_collections[i]
+                ],
+                "contact": ids.persons[links.collection_contacts[i]],
+                "materials": list(rng.choice(_MATERIALS)),
+                "collaboration_commercial": rng.random() < 0.5,
+            }
+            parent = links.parent_collections[i]
+            if parent is not None:
+                row["parent_collection"] = ids.collections[parent]
+            yield row
+
+
+def directory_tables(
+    nodes: List[Node], quality_info: QualityInfo
+) -> List[Tuple[TableMeta, List[dict]]]:
+    """
+    Returns the tables of the directory that aren't tables of a node: the national
+    nodes, with the URLs of the nodes that have an external server, and the quality
+    info of the biobanks and collections.
+    """
+    nodes_meta = _table_meta(
+        _NODES_TABLE,
+        "National nodes",
+        [
+            ("id", "string", None, False),
+            ("description", "string", None, False),
+            ("dns", "hyperlink", None, True),
+        ],
+    )
+    node_rows = list()
+    for node in nodes:
+        row = {"id": node.code, "description": node.description}
+        if isinstance(node, ExternalServerNode):
+            row["dns"] = node.url
+        node_rows.append(row)
+
+    tables = [(nodes_meta, node_rows)]
+    for table_id, attribute, table_type, qualities in (
+        (
+            "eu_bbmri_eric_bio_qual_info",
+            "biobank",
+            TableType.BIOBANKS,
+            quality_info.biobanks,
+        ),
+        (
+            "eu_bbmri_eric_col_qual_info",
+            "collection",
+            TableType.COLLECTIONS,
+            quality_info.collections,
+        ),
+    ):
+        meta = _table_meta(
+            table_id,
+            table_id,
+            [
+                ("id", "string", None, False),
+                (attribute, "xref", table_type.base_id, False),
+            ],
+        )
+        rows = [
+            {"id": quality_id, attribute: id_}
+            for id_, quality_ids in qualities.items()
+            for quality_id in quality_ids
+        ]
+        tables.append((meta, rows))
+    return tables
+
+
+class _Ids:
+    """The identifiers of the rows of a node. Some are invalid (see
+    Spec.invalid_fraction) and some persons and networks are rows of node EU."""
+
+    def __init__(self, node: Node, spec: Spec):
+        self.node = node
+        self.spec = spec
+        self.persons = self._ids(TableType.PERSONS, "person", spec.persons)
+        self.networks = self._ids(TableType.NETWORKS, "network", spec.networks)
+        self.biobanks = self._ids(TableType.BIOBANKS, "biobank", spec.biobanks)
+        self.collections = self._ids(
+            TableType.COLLECTIONS, "collection", spec.collections
+        )
+
+    def _ids(self, table_type: TableType, name: str, count: int) -> List[str]:
+        prefix = self.node.get_id_prefix(table_type)
+        eu_prefix = Node.get_eu_id_prefix(table_type)
+        eu_count = 0
+        if table_type in (TableType.PERSONS, TableType.NETWORKS):
+            eu_count = int(count * self.spec.eu_fraction)
+        invalid_every = (
+            round(1 / self.spec.invalid_fraction) if self.spec.invalid_fraction else 0
+        )
+
+        ids = list()
+        for i in range(count):
+            if i < eu_count:
+                ids.append(f"{eu_prefix}{name}{i}")
+            elif invalid_every and i % invalid_every == invalid_every - 1:
+                # alternately a wrong prefix and invalid characters
+                if i // invalid_every % 2 == 0:
+                    ids.append(f"bbmri-eric:invalid:{self.node.code}_{name}{i}")
+                else:
+                    ids.append(f"{prefix}{name} {i}!")
+            else:
+                ids.append(f"{prefix}{name}{i}")
+        return ids
+
+
+class _Links:
+    """The references between the rows of a node, by row index."""
+
+    def __init__(self, spec: Spec, rng: random.Random):
+        self.spec = spec
+        self.network_contacts = [
+            int(rng.random() * spec.persons) for _ in range(spec.networks)
+        ]
+        self.biobank_contacts = [
+            int(rng.random() * spec.persons) for _ in range(spec.biobanks)
+        ]
+        self.collection_contacts = [
+            int(rng.random() * spec.persons) for _ in range(spec.collections)
+        ]
+        self.collection_biobanks = [
+            i * spec.biobanks // spec.collections for i in range(spec.collections)
+        ]
+        self.parent_collections = self._parent_collections()
+
+        self.networks_of_person = _inverse(self.network_contacts, spec.persons)
+        self.biobanks_of_person = _inverse(self.biobank_contacts, spec.persons)
+        self.collections_of_person = _inverse(self.collection_contacts, spec.persons)
+        self.collections_of_biobank = _inverse(self.collection_biobanks, spec.biobanks)
+        self.sub_collections = _inverse(self.parent_collections, spec.collections)
+
+    def networks(self, rng: random.Random) -> List[int]:
+        count = min(rng.randint(0, self.spec.max_networks), self.spec.networks)
+        return rng.sample(range(self.spec.networks), count)
+
+    def _parent_collections(self) -> List[Optional[int]]:
+        """
+        The collections of a biobank form chains of collection_depth levels: every
+        collection is a sub collection of the collection before it, except for the
+        first collection of every chain.
+        """
+        parents = list()
+        first_of_biobank = 0
+        for i, biobank in enumerate(self.collection_biobanks):
+            if i > 0 and biobank != self.collection_biobanks[i - 1]:
+                first_of_biobank = i
+            level = (i - first_of_biobank) % max(1, self.spec.collection_depth)
+            parents.append(i - 1 if level > 0 else None)
+        return parents
+
+
+def _inverse(references: List[Optional[int]], count: int) -> List[List[int]]:
+    """Returns the indexes of the rows that refer to each row."""
+    inverse = [[] for _ in range(count)]
+    for i, reference in enumerate(references):
+        if reference is not None:
+            inverse[reference].append(i)
+    return inverse
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choices(_WORDS, k=words))
+
+
+def _published(node: Node, table_type: TableType, rows: Iterator[dict]):
+    for i, row in enumerate(rows):
+        row["national_node"] = node.code
+        if table_type == TableType.BIOBANKS:
+            row["pid"] = f"21.12110/{node.code}-{i}"
+        yield row
+
+
+def _meta(node: Node, table_type: TableType, source: Source) -> TableMeta:
+    """Returns the metadata of a table in the format of the metadata API."""
+
+    def table_id(type_: TableType) -> str:
+        if source == Source.STAGING:
+            return node.get_staging_id(type_)
+        return type_.base_id
+
+    attributes = _ATTRIBUTES[table_type]
+    if source == Source.PUBLISHED:
+        attributes = attributes + _PUBLISHED_ATTRIBUTES[table_type]
+        attributes.append(("national_node", "xref", _NODES_TABLE, False))
+
+    resolved = list()
+    for name, type_, ref, nullable in attributes:
+        if ref in _TABLE_VALUES:
+            ref = table_id(TableType(ref))
+        resolved.append((name, type_, ref, nullable))
+    return _table_meta(table_id(table_type), table_type.value, resolved)
+
+
+def _table_meta(
+    id_: str, label: str, attributes: List[Tuple[str, str, Optional[str], bool]]
+) -> TableMeta:
+    items = list()
+    for name, type_, ref, nullable in attributes:
+        data = {
+            "name": name,
+            "type": type_,
+            "idAttribute": name == "id",
+            "nullable": nullable,
+        }
+        if ref:
+            data["refEntityType"] = {"self": f"{_URL}/api/metadata/{ref}"}
+        items.append({"data": data})
+
+    return TableMeta(
+        meta={
+            "links": {"self": f"{_URL}/api/metadata/{id_}"},
+            "data": {
+                "id": id_,
+                "label": label,
+                "attributes": {"items": items},
+            },
+        }
+    )
+
+
+_TABLE_VALUES = {type_.value for type_ in TableType}
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from molgenis.bbmri_eric.errors import EricWarning
 from molgenis.bbmri_eric.model import Node, NodeData, QualityInfo, Table
 from molgenis.bbmri_eric.printer import Printer
@@ -16,8 +18,12 @@ class Transformer:
         quality: QualityInfo,
         printer: Printer,
         existing_biobanks: Table,
-        eu_node_data: NodeData,
+        eu_node_data: Optional[NodeData],
     ):
+        """
+        :param NodeData eu_node_data: the staging data of node EU, can be None when
+                                      node EU itself is transformed
+        """
         self.node_data = node_data
         self.quality = quality
         self.printer = printer
@@ -110,8 +116,9 @@ class Transformer:
             return
 
         self.printer.print("Replacing EU networks and persons")
-        self._replace_rows(node, node_data.persons, self.eu_node_data.persons)
-        self._replace_rows(node, node_data.networks, self.eu_node_data.networks)
+        with self.printer.batch():
+            self._replace_rows(node, node_data.persons, self.eu_node_data.persons)
+            self._replace_rows(node, node_data.networks, self.eu_node_data.networks)
 
     def _replace_rows(self, node: Node, table: Table, eu_table: Table):
         eu_prefix = node.get_eu_id_prefix(table.type)
@@ -119,7 +126,8 @@ class Transformer:
             id_ = network["id"]
             if id_.startswith(eu_prefix):
                 if id_ in eu_table.rows_by_id:
-                    table.rows_by_id[id_] = eu_table.rows_by_id[id_]
+                    # copy, because node EU's data is shared by all nodes
+                    table.rows_by_id[id_] = eu_table.rows_by_id[id_].copy()
 
                     # overwrite EU code that was added in previous enrichment step
                     table.rows_by_id[id_]["national_node"] = self.eu_node_data.node.code
@@ -133,11 +141,13 @@ class Transformer:
     def _set_combined_networks(self):
         """
         For every collection of the Node, adds to the `combined_network` field, the
-        union of the networks of the collection itself and the ones of its biobank
+        union of the networks of the collection itself and the ones of its biobank. The
+        networks are sorted, so the rows are the same in every run (see
+        journal.hash_batch).
         """
         self.printer.print("Adding combined networks")
         for collection in self.node_data.collections.rows:
             biobank = self.node_data.biobanks.rows_by_id[collection["biobank"]]
-            collection["combined_network"] = list(
+            collection["combined_network"] = sorted(
                 set(biobank["network"] + collection["network"])
             )
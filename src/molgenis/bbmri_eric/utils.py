@@ -1,9 +1,8 @@
-import copy
-from typing import List
+from typing import Callable, Iterable, Iterator, List
+from urllib.parse import quote_plus
 
-import pandas as pd
-
-from molgenis.bbmri_eric.model import TableMeta
+from molgenis.bbmri_eric.memory import tracked
+from molgenis.bbmri_eric.model import TableMeta, TableSchema
 
 
 def to_upload_format(rows: List[dict]) -> List[dict]:
@@ -32,29 +31,77 @@ def to_upload_format(rows: List[dict]) -> List[dict]:
     return upload_format
 
 
+def iter_upload_format(
+    pages: Iterable[List[dict]], schema: TableSchema
+) -> Iterator[dict]:
+    """
+    Schema-directed version of to_upload_format that yields the converted rows of one
+    or more pages. Only the reference attributes of the table are inspected.
+    """
+    convert = upload_format_converter(schema)
+    for page in pages:
+        for row in page:
+            yield convert(row)
+
+
+def upload_format_converter(schema: TableSchema) -> Callable[[dict], dict]:
+    """
+    Returns a function that changes a single row of the REST Client's output to the
+    uploadable format (in place), based on the schema of the table. The function can
+    also be used as an object_hook when decoding a JSON response: reference objects
+    are then stripped before the row that contains them is converted.
+    """
+    single_refs = list(schema.single_references)
+    multi_refs = list(schema.multi_references)
+
+    def convert(row: dict) -> dict:
+        if "_href" not in row:
+            return row
+        del row["_href"]
+        row.pop("_meta", None)
+
+        for attr in single_refs:
+            ref = row.get(attr)
+            if ref is not None:
+                row[attr] = ref["id"]
+        for attr in multi_refs:
+            refs = row.get(attr)
+            if refs:
+                row[attr] = [ref["id"] for ref in refs]
+        return row
+
+    return convert
+
+
+@tracked("remove_one_to_manys")
 def remove_one_to_manys(rows: List[dict], meta: TableMeta) -> List[dict]:
     """
     Removes all one-to-manys from a list of rows based on the table's metadata. Removing
-    one-to-manys is necessary when addingnew rows. Returns a copy so that the original
-    rows are not changed in any way.
+    one-to-manys is necessary when addingnew rows. Returns a copy (as plain dicts) so
+    that the original rows are not changed in any way. The copy is shallow: the values
+    are shared with the original rows.
     """
-    copied_rows = copy.deepcopy(rows)
-    for row in copied_rows:
-        for one_to_many in meta.one_to_manys:
-            row.pop(one_to_many, None)
-    return copied_rows
+    one_to_manys = meta.schema.one_to_manys
+    return [
+        {name: value for name, value in row.items() if name not in one_to_manys}
+        for row in rows
+    ]
 
 
+@tracked("sort_self_references")
 def sort_self_references(rows: List[dict], self_references: List[str]) -> List[dict]:
     """
     Make sure rows with a self-referencing column are added after the rows
     with the reference
     """
+    # pandas is imported here because it is slow to import and rarely needed
+    import pandas as pd
+
     df = pd.DataFrame(rows)
 
     # If all rows have a missing value for the self_referencing column, it won't be in
     # the DataFrame
-    ref_columns = list(set(self_references).intersection(df.columns))
+    ref_columns = sorted(set(self_references).intersection(df.columns))
 
     if ref_columns:
         df.sort_values(by=ref_columns, na_position="first", inplace=True)
@@ -77,6 +124,32 @@ def batched(list_: List, batch_size: int):
         yield list_[i : i + batch_size]
 
 
+def rsql_in_queries(
+    attribute: str, values: Iterable[str], max_length: int = 4000
+) -> Iterator[str]:
+    """
+    Yields RSQL queries that together select all rows with one of the provided
+    values: 'attribute=in=("value1","value2")'. The values are split over multiple
+    queries so that no URL encoded query is longer than max_length characters.
+    """
+    prefix = f"{attribute}=in=("
+    query_values = []
+    length = len(quote_plus(prefix + ")"))
+    for value in values:
+        escaped = value.replace("\\", "\\\\").replace('"', '\\"')
+        quoted = f'"{escaped}"'
+        value_length = len(quote_plus(quoted + ","))
+        if query_values and length + value_length > max_length:
+            yield prefix + ",".join(query_values) + ")"
+            query_values = []
+            length = len(quote_plus(prefix + ")"))
+        query_values.append(quoted)
+        length += value_length
+
+    if query_values:
+        yield prefix + ",".join(query_values) + ")"
+
+
 def isnan(value):
     # A NaN implemented following the standard, is the only value for which
     # the inequality comparison with itself should return True:
@@ -23,12 +23,14 @@ class Validator:
         self.warnings: List[EricWarning] = list()
 
     def validate(self) -> List[EricWarning]:
-        for table in self.node_data.import_order:
-            self._validate_ids(table)
-
-        self._validate_networks()
-        self._validate_biobanks()
-        self._validate_collections()
+        # a node can have many warnings, they are written at once
+        with self.printer.batch():
+            for table in self.node_data.import_order:
+                self._validate_ids(table)
+
+            self._validate_networks()
+            self._validate_biobanks()
+            self._validate_collections()
 
         return self.warnings
 
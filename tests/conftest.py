@@ -1,4 +1,3 @@
-import pickle
 from unittest.mock import MagicMock
 
 import pkg_resources
@@ -12,15 +11,12 @@ from molgenis.bbmri_eric.publisher import Publisher
 @pytest.fixture
 def node_data() -> NodeData:
     """
-    Returns NodeData from node_data.pkl to test with.
+    Returns NodeData from node_data.snapshot to test with.
     """
 
-    file = open(
-        pkg_resources.resource_filename("tests.resources", "node_data.pkl"), "rb"
+    return NodeData.load(
+        pkg_resources.resource_filename("tests.resources", "node_data.snapshot")
     )
-    node_data: NodeData = pickle.load(file)
-    file.close()
-    return node_data
 
 
 @pytest.fixture
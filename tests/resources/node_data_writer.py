@@ -1,10 +1,8 @@
 """
-Use this script to update the node_data.pkl file that contains test data (the staging
-data of node NO).
+Use this script to update the node_data.snapshot file that contains test data (the
+staging data of node NO).
 """
 
-import pickle
-
 from dotenv import dotenv_values
 
 from molgenis.bbmri_eric.bbmri_client import EricSession
@@ -23,7 +21,5 @@ session = EricSession(url=target)
 session.login(username, password)
 node_data = session.get_staging_node_data((Node("NO", "Norway")))
 
-# pickle and write the NodeData object to file
-file = open("node_data.pkl", "wb")
-pickle.dump(node_data, file)
-file.close()
+# write the NodeData object to a snapshot file
+node_data.save("node_data.snapshot")
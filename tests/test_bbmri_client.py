@@ -0,0 +1,196 @@
+import json
+from unittest import mock
+from unittest.mock import MagicMock
+
+import pytest
+import requests
+
+from molgenis.bbmri_eric.bbmri_client import EricSession, ExtendedSession
+from molgenis.bbmri_eric.journal import CheckpointJournal
+from molgenis.bbmri_eric.model import Node, TableMeta
+from molgenis.client import MolgenisRequestError
+
+
+def _response(body: dict) -> MagicMock:
+    response = MagicMock()
+    response.content = json.dumps(body).encode("utf-8")
+    return response
+
+
+def test_iter_uploadable_data():
+    meta = TableMeta(
+        {
+            "data": {
+                "id": "eu_bbmri_eric_biobanks",
+                "attributes": {
+                    "items": [
+                        {"data": {"name": "id", "type": "string", "idAttribute": True}},
+                        {
+                            "data": {
+                                "name": "contact",
+                                "type": "xref",
+                                "idAttribute": False,
+                            }
+                        },
+                        {
+                            "data": {
+                                "name": "network",
+                                "type": "mref",
+                                "idAttribute": False,
+                            }
+                        },
+                    ]
+                },
+            }
+        }
+    )
+    session = ExtendedSession("http://directory")
+    session._session = MagicMock()
+    session._session.get.side_effect = [
+        _response(
+            {
+                "items": [
+                    {
+                        "_href": "/api/v2/eu_bbmri_eric_biobanks/b1",
+                        "id": "b1",
+                        "contact": {
+                            "_href": "/api/v2/eu_bbmri_eric_persons/p1",
+                            "id": "p1",
+                        },
+                        "network": [],
+                    }
+                ],
+                "nextHref": "/api/v2/eu_bbmri_eric_biobanks?num=1&start=1",
+            }
+        ),
+        _response(
+            {
+                "items": [
+                    {
+                        "_href": "/api/v2/eu_bbmri_eric_biobanks/b2",
+                        "id": "b2",
+                        "network": [
+                            {"_href": "/api/v2/eu_bbmri_eric_networks/n1", "id": "n1"}
+                        ],
+                    }
+                ]
+            }
+        ),
+    ]
+
+    rows = list(session.iter_uploadable_data(meta, q="national_node==NL", batch_size=1))
+
+    assert rows == [
+        {"id": "b1", "contact": "p1", "network": []},
+        {"id": "b2", "network": ["n1"]},
+    ]
+    url = "http://directory/api/v2/eu_bbmri_eric_biobanks?q=national_node==NL"
+    assert session._session.get.mock_calls == [
+        mock.call(f"{url}&num=1&sort=id", headers=mock.ANY),
+        mock.call(f"{url}&num=1&start=1&sort=id", headers=mock.ANY),
+    ]
+
+
+def test_upsert_batched_with_checkpoint(tmp_path):
+    session = ExtendedSession("http://directory")
+    meta = MagicMock()
+    meta.id = "eu_bbmri_eric_persons"
+    meta.id_attribute = "id"
+    meta.self_references = []
+    meta.schema.one_to_manys = []
+    session.get_meta = MagicMock(return_value=meta)
+    session.get = MagicMock(return_value=[{"id": "existing"}])
+    session.add_all = MagicMock()
+    session.update = MagicMock()
+    rows = [{"id": str(i)} for i in range(2500)] + [{"id": "existing"}]
+    checkpoint = CheckpointJournal(str(tmp_path / "journal")).checkpoint(
+        Node("NL", "Netherlands"), meta.id
+    )
+    checkpoint.record("upsert", rows[1000:2000])
+
+    session.upsert_batched(meta.id, rows, checkpoint=checkpoint)
+
+    assert session.add_all.mock_calls == [
+        mock.call(meta.id, rows[:1000]),
+        mock.call(meta.id, rows[2000:2500]),
+    ]
+    session.update.assert_called_once_with(meta.id, [{"id": "existing"}])
+    assert checkpoint.skipped == 1
+    assert checkpoint.is_done("upsert", rows[:1000])
+    assert checkpoint.is_done("upsert", rows[2000:])
+
+
+def test_get_quality_info_of_ids():
+    session = EricSession("http://directory")
+    session.get = MagicMock(
+        side_effect=[
+            [
+                {"id": "q1", "biobank": {"id": "b1"}},
+                {"id": "q2", "biobank": {"id": "b1"}},
+            ],
+            [],
+        ]
+    )
+
+    quality_info = session.get_quality_info(biobank_ids=["b2", "b1"], collection_ids=[])
+
+    session.get.assert_called_once_with(
+        "eu_bbmri_eric_bio_qual_info",
+        q='biobank=in=("b1","b2")',
+        batch_size=10000,
+        attributes="id,biobank",
+    )
+    assert quality_info.biobanks == {"b1": ["q1", "q2"]}
+    assert quality_info.collections == {}
+
+
+def test_get_staging_row_count():
+    session = EricSession("http://directory")
+    session._session = MagicMock()
+    session._session.get.return_value.json.side_effect = [
+        {"total": 1},
+        {"total": 2},
+        {"total": 3},
+        {"total": 4},
+    ]
+
+    count = session.get_staging_row_count(Node("NL", "NL"))
+
+    assert count == 10
+    assert session._session.get.mock_calls[0] == mock.call(
+        "http://directory/api/v2/eu_bbmri_eric_NL_persons?num=1",
+        headers=session._get_token_header(),
+    )
+
+
+def test_upsert_batched_with_checkpoint_failed_add(tmp_path):
+    session = ExtendedSession("http://directory")
+    meta = MagicMock()
+    meta.id = "eu_bbmri_eric_persons"
+    meta.id_attribute = "id"
+    meta.self_references = []
+    meta.schema.one_to_manys = []
+    session.get_meta = MagicMock(return_value=meta)
+    session.get = MagicMock(return_value=[])
+    session._session = MagicMock()
+    failed = MagicMock()
+    failed.raise_for_status.side_effect = requests.HTTPError(
+        "400 Client Error", response=MagicMock(content=b"")
+    )
+    session._session.post.side_effect = [failed, MagicMock()]
+    rows = [{"id": "p1"}, {"id": "p2"}]
+    checkpoint = CheckpointJournal(str(tmp_path / "journal")).checkpoint(
+        Node("NL", "Netherlands"), meta.id
+    )
+
+    with pytest.raises(MolgenisRequestError):
+        session.upsert_batched(meta.id, rows, checkpoint=checkpoint)
+    assert not checkpoint.is_done("upsert", rows)
+
+    session.upsert_batched(meta.id, rows, checkpoint=checkpoint)
+
+    assert session._session.post.call_count == 2
+    assert json.loads(session._session.post.call_args.kwargs["data"]) == {
+        "entities": rows
+    }
+    assert checkpoint.is_done("upsert", rows)
@@ -0,0 +1,111 @@
+import gzip
+import time
+
+import pytest
+
+from molgenis.bbmri_eric.bbmri_client import EricSession
+from molgenis.bbmri_eric.cassette import SCRUBBED, Cassette, Interaction
+from molgenis.bbmri_eric.errors import EricError
+from molgenis.bbmri_eric.instrumentation import RequestStats
+from molgenis.bbmri_eric.model import Node
+from molgenis.bbmri_eric.stand_in import StandInServer
+from molgenis.bbmri_eric.synthetic import Generator, Spec
+
+NL = Node("NL", "Netherlands")
+NODES = "eu_bbmri_eric_national_nodes"
+
+
+@pytest.fixture
+def node_data():
+    return Generator(Spec.of_rows(100)).node_data(NL)
+
+
+def workload(session: EricSession, node_data) -> list:
+    persons = node_data.persons
+    results = [session.count(persons.full_name)]
+    session.delete_list(persons.full_name, list(persons.rows_by_id)[:10])
+    results.append(session.count(persons.full_name))
+    results.append(session.get_staging_node_data(NL).persons.rows_by_id)
+    return results
+
+
+def test_record_and_replay(tmp_path, node_data):
+    path = str(tmp_path / "cassette.jsonl.gz")
+    with StandInServer(credentials=("admin", "secret")) as server:
+        server.add_node_data(node_data)
+        session = EricSession(url=server.url)
+        recording = RequestStats()
+        session.instrument(recording.record)
+        cassette = Cassette()
+        session.record(cassette)
+        session.login("admin", "secret")
+        token = session._token
+        recorded = workload(session, node_data)
+    cassette.save(path)
+
+    session = EricSession(url="https://directory.example.org")
+    replaying = RequestStats()
+    session.instrument(replaying.record)
+    replay = session.replay(Cassette.load(path), latencies=False)
+    session.login("admin", "another password")
+    replayed = workload(session, node_data)
+
+    assert replayed == recorded
+    assert recorded[0] == recorded[1] + 10
+    assert replay.replayed == len(cassette.interactions) == server.request_count
+    assert replay.remaining == replay.mismatched == 0
+    assert replaying.summary()["run"]["requests"] == len(cassette.interactions)
+    assert recording.summary()["run"]["rows"] == replaying.summary()["run"]["rows"]
+    assert session._token == SCRUBBED
+    with gzip.open(path, "rt") as file:
+        content = file.read()
+    assert "secret" not in content and token not in content
+    with pytest.raises(EricError, match="No recorded response for GET"):
+        session.count(NODES)
+
+
+def test_replay_latencies():
+    cassette = Cassette(
+        interactions=[
+            Interaction("GET", f"/api/v2/{NODES}?num=1", "", 200, 0.05, b'{"total": 1}')
+        ]
+        * 2
+    )
+
+    session = EricSession(url="https://directory.example.org")
+    session.replay(cassette)
+    started = time.perf_counter()
+    session.count(NODES)
+    assert time.perf_counter() - started >= 0.05
+
+    session.replay(cassette, latencies=False)
+    started = time.perf_counter()
+    session.count(NODES)
+    assert time.perf_counter() - started < 0.05
+
+
+def test_replay_mismatched_body():
+    cassette = Cassette(
+        interactions=[
+            Interaction(
+                "POST", f"/api/v2/{NODES}", "other", 201, 0.0, b'{"resources": []}'
+            ),
+            Interaction("POST", f"/api/v2/{NODES}", "another", 400, 0.0, b"{}"),
+        ]
+    )
+    session = EricSession(url="https://directory.example.org")
+    replay = session.replay(cassette)
+
+    session.add_all(NODES, [{"id": "NL"}])
+
+    assert replay.mismatched == 1
+    assert replay.remaining == 1
+
+
+def test_load_unsupported_version(tmp_path):
+    path = str(tmp_path / "cassette.jsonl.gz")
+    with gzip.open(path, "wt") as file:
+        file.write('{"version": 99, "url": null}\n')
+
+    with pytest.raises(EricError, match="Unsupported cassette version 99"):
+        Cassette.load(path)
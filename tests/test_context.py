@@ -0,0 +1,95 @@
+import threading
+import time
+from unittest import mock
+from unittest.mock import MagicMock
+
+from molgenis.bbmri_eric.context import PublishContext
+from molgenis.bbmri_eric.model import QualityInfo
+
+
+def test_lazy(session):
+    context = PublishContext(session)
+
+    assert not session.method_calls
+
+    assert context.quality_info == session.get_quality_info.return_value
+    assert context.quality_info == session.get_quality_info.return_value
+    session.get_quality_info.assert_called_once()
+    session.get_staging_node_data.assert_not_called()
+
+    assert context.eu_node_data == session.get_staging_node_data.return_value
+    assert context.eu_node_data == session.get_staging_node_data.return_value
+    session.get_node.assert_called_once_with("EU")
+    session.get_staging_node_data.assert_called_once_with(session.get_node.return_value)
+
+
+def test_loaded_once_concurrently(session):
+    def slow_quality_info():
+        time.sleep(0.05)
+        return MagicMock()
+
+    session.get_quality_info.side_effect = slow_quality_info
+    context = PublishContext(session)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(context.quality_info))
+        for _ in range(4)
+    ]
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    session.get_quality_info.assert_called_once()
+    assert len({id(result) for result in results}) == 1
+
+
+def test_invalidate(session):
+    context = PublishContext(session)
+    _ = context.quality_info
+    _ = context.eu_node_data
+
+    context.invalidate(eu_node_data=False)
+    _ = context.quality_info
+    _ = context.eu_node_data
+
+    assert session.get_quality_info.call_count == 2
+    assert session.get_staging_node_data.call_count == 1
+
+
+def test_refresh(session):
+    context = PublishContext(session)
+
+    context.refresh(quality_info=False)
+
+    session.get_quality_info.assert_not_called()
+    session.get_staging_node_data.assert_called_once()
+
+
+def test_get_quality_info(session):
+    session.get_quality_info.side_effect = [
+        QualityInfo(biobanks={"b1": ["q1"]}, collections={}),
+        QualityInfo(biobanks={}, collections={"c2": ["q2"]}),
+    ]
+    context = PublishContext(session)
+
+    first = context.get_quality_info(["b1", "b2"], ["c1"])
+    second = context.get_quality_info(["b1", "b2"], ["c1", "c2"])
+    third = context.get_quality_info(["b1"], ["c2"])
+
+    assert session.get_quality_info.mock_calls == [
+        mock.call(biobank_ids={"b1", "b2"}, collection_ids={"c1"}),
+        mock.call(biobank_ids=set(), collection_ids={"c2"}),
+    ]
+    assert first == QualityInfo(biobanks={"b1": ["q1"]}, collections={})
+    assert second == QualityInfo(biobanks={"b1": ["q1"]}, collections={"c2": ["q2"]})
+    assert third == second
+
+
+def test_get_quality_info_complete(session):
+    context = PublishContext(session)
+    _ = context.quality_info
+
+    assert context.get_quality_info(["b1"], ["c1"]) == context.quality_info
+    session.get_quality_info.assert_called_once_with()
@@ -0,0 +1,107 @@
+import threading
+from unittest import mock
+from unittest.mock import MagicMock
+
+import pytest
+
+from molgenis.bbmri_eric.deleter import DeletionError, RowDeleter, get_deletion_levels
+from molgenis.bbmri_eric.model import Table, TableType
+from molgenis.client import MolgenisRequestError
+
+
+@pytest.fixture
+def networks() -> Table:
+    meta = MagicMock()
+    meta.self_references = ["parent_network"]
+    return Table.of(
+        TableType.NETWORKS,
+        meta,
+        [
+            {"id": "root"},
+            {"id": "child", "parent_network": ["root"]},
+            {"id": "grandchild", "parent_network": ["child", "kept"]},
+            {"id": "kept", "parent_network": ["root"]},
+            {"id": "cycle1", "parent_network": ["cycle2"]},
+            {"id": "cycle2", "parent_network": ["cycle1"]},
+        ],
+    )
+
+
+def test_get_deletion_levels(networks):
+    levels = get_deletion_levels(networks, ["child", "root", "grandchild"])
+
+    assert levels == [["grandchild"], ["child"], ["root"]]
+
+
+def test_get_deletion_levels_cycle(networks):
+    assert get_deletion_levels(networks, ["cycle2", "cycle1", "root"]) == [
+        ["root"],
+        ["cycle1", "cycle2"],
+    ]
+
+
+def test_get_deletion_levels_without_self_references():
+    meta = MagicMock()
+    meta.self_references = []
+    persons = Table.of(TableType.PERSONS, meta, [{"id": "b"}, {"id": "a"}])
+
+    assert get_deletion_levels(persons, ["b", "a", "unknown"]) == [
+        ["a", "b", "unknown"]
+    ]
+
+
+def test_delete_batched_and_concurrently():
+    session = MagicMock()
+    running = set()
+    concurrent = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(2, timeout=5)
+
+    def delete_list(table_id, ids):
+        with lock:
+            running.add(ids[0])
+            concurrent.append(len(running))
+        if ids[0] in ("1", "3"):
+            barrier.wait()
+        with lock:
+            running.discard(ids[0])
+
+    session.delete_list.side_effect = delete_list
+    deleter = RowDeleter(session, batch_size=2, workers=2)
+
+    deleted = deleter.delete("table", [["1", "2", "3", "4"], ["5"]])
+
+    assert deleted == ["1", "2", "3", "4", "5"]
+    assert session.delete_list.mock_calls[-1] == mock.call("table", ["5"])
+    assert max(concurrent) == 2
+
+
+def test_delete_failure():
+    session = MagicMock()
+    error = MolgenisRequestError("error")
+    session.delete_list.side_effect = [None, error]
+    deleter = RowDeleter(session, batch_size=2, workers=1)
+    on_deleted = MagicMock()
+
+    with pytest.raises(DeletionError) as exception_info:
+        deleter.delete("table", [["1", "2", "3", "4"], ["5"]], on_deleted=on_deleted)
+
+    on_deleted.assert_called_once_with(["1", "2"])
+
+    assert exception_info.value.deleted_ids == ["1", "2"]
+    assert exception_info.value.failed_ids == ["3", "4", "5"]
+    assert exception_info.value.__cause__ == error
+    assert session.delete_list.call_count == 2
+
+
+def test_delete_with_checkpoint():
+    session = MagicMock()
+    checkpoint = MagicMock()
+    checkpoint.is_done.side_effect = lambda operation, batch: batch == ["1", "2"]
+    deleter = RowDeleter(session, batch_size=2)
+
+    deleted = deleter.delete("table", [["1", "2", "3"]], checkpoint)
+
+    assert deleted == ["3"]
+    session.delete_list.assert_called_once_with("table", ["3"])
+    checkpoint.record.assert_called_once_with("delete", ["3"])
@@ -3,8 +3,20 @@ from unittest.mock import MagicMock, patch
 
 import pytest
 
-from molgenis.bbmri_eric.errors import EricError, EricWarning
-from molgenis.bbmri_eric.model import ExternalServerNode, Node, NodeData, Source
+from molgenis.bbmri_eric.bbmri_client import EricSession
+from molgenis.bbmri_eric.eric import Eric
+from molgenis.bbmri_eric.errors import EricError, EricWarning, ErrorReport
+from molgenis.bbmri_eric.model import (
+    ExternalServerNode,
+    Node,
+    NodeData,
+    Source,
+    TableType,
+)
+from molgenis.bbmri_eric.pid_service import NoOpPidService, SynchronizedPidService
+from molgenis.bbmri_eric.printer import Printer, QuietOutput
+from molgenis.bbmri_eric.stand_in import StandInServer
+from molgenis.bbmri_eric.synthetic import Generator, Spec, directory_tables
 
 
 @pytest.fixture
@@ -45,6 +57,37 @@ def test_stage_external_nodes(stager_init, eric, printer):
     printer.print_summary.assert_called_once_with(report)
 
 
+def test_stage_external_nodes_concurrently(stager_init, session, printer):
+    eric = Eric(session)
+    eric.printer = printer
+    error = EricError("error")
+    nl = ExternalServerNode("NL", "small", "url.nl")
+    be = ExternalServerNode("BE", "large, fails", "url.be")
+    session.get_staging_row_count.side_effect = lambda node: len(node.description)
+    stager_init.return_value.stage.side_effect = lambda node: _raise_for(
+        node, be, error
+    )
+
+    report = eric.stage_external_nodes([nl, be], workers=2)
+
+    assert eric.scheduler.order([nl, be]) == [be, nl]
+    assert sorted(
+        c.args[0].code for c in stager_init.return_value.stage.mock_calls
+    ) == [
+        "BE",
+        "NL",
+    ]
+    assert report.nodes == [nl, be]
+    assert report.errors == {be: error}
+    assert printer.write_lines.call_count == 2
+    printer.print_summary.assert_called_once_with(report)
+
+
+def _raise_for(node: Node, failing: Node, error: EricError):
+    if node == failing:
+        raise error
+
+
 def test_publish_node_staging_fails(
     eric,
     session,
@@ -60,7 +103,9 @@ def test_publish_node_staging_fails(
     report = eric.publish_nodes([nl])
 
     eric.printer.print_node_title.assert_called_once_with(nl)
-    publisher_init.assert_called_with(session, eric.printer, pid_service)
+    publisher_init.assert_called_with(
+        session, eric.printer, pid_service, journal=None, context=eric.context
+    )
     stager_init.assert_called_with(session, eric.printer)
     stager_init.return_value.stage.assert_called_with(nl)
     assert not session.get_published_node_data.called
@@ -85,7 +130,9 @@ def test_publish_node_get_data_fails(
     report = eric.publish_nodes([nl])
 
     eric.printer.print_node_title.assert_called_once_with(nl)
-    publisher_init.assert_called_with(session, eric.printer, pid_service)
+    publisher_init.assert_called_with(
+        session, eric.printer, pid_service, journal=None, context=eric.context
+    )
     stager_init.assert_called_with(session, eric.printer)
     stager_init.return_value.stage.assert_called_with(nl)
     session.get_staging_node_data.assert_called_with(nl)
@@ -120,9 +167,11 @@ def test_publish_nodes(
         mock.call().validate(),
     ]
     assert publisher_init.mock_calls == [
-        mock.call(session, eric.printer, pid_service),
-        mock.call().publish(no_data),
-        mock.call().publish(nl_data),
+        mock.call(
+            session, eric.printer, pid_service, journal=None, context=eric.context
+        ),
+        mock.call().publish(no_data, None, release=False),
+        mock.call().publish(nl_data, None, release=False),
     ]
     assert no not in report.errors
     assert report.errors[nl] == error
@@ -131,6 +180,92 @@ def test_publish_nodes(
     eric.printer.print_summary.assert_called_once_with(report)
 
 
+def test_publish_nodes_with_prefetching(
+    eric, pid_service, publisher_init, validator_init, stager_init, session
+):
+    no = Node("NO", "prefetched")
+    nl = ExternalServerNode("NL", "staged first", "url")
+    no_data = _mock_node_data(no)
+    nl_data = _mock_node_data(nl)
+    no_published = _mock_node_data(no)
+    nl_published = _mock_node_data(nl)
+    session.get_staging_node_data.side_effect = [no_data, nl_data]
+    session.get_published_node_data.side_effect = [no_published, nl_published]
+    validator_init.return_value.validate.return_value = []
+    publisher_init.return_value.publish.return_value = []
+
+    report = eric.publish_nodes([no, nl], prefetch_depth=1)
+
+    assert eric.printer.print_node_title.mock_calls == [mock.call(no), mock.call(nl)]
+    assert session.get_staging_node_data.mock_calls == [mock.call(no), mock.call(nl)]
+    stager_init.return_value.stage.assert_called_once_with(nl)
+    assert publisher_init.mock_calls == [
+        mock.call(
+            session, eric.printer, pid_service, journal=None, context=eric.context
+        ),
+        mock.call().publish(no_data, no_published, release=False),
+        mock.call().publish(nl_data, nl_published, release=False),
+    ]
+    assert not report.has_errors()
+
+
+def test_publish_nodes_concurrently(
+    eric, pid_service, publisher_init, validator_init, stager_init, session
+):
+    nodes = [Node("A", "first"), Node("EU", "EU"), Node("B", "fails"), Node("C", "C")]
+    error = EricError("error")
+    warning = EricWarning("warning")
+    published = []
+    session.get_staging_row_count.return_value = 0
+
+    def publish(node_data, existing_node_data, release=False):
+        published.append(node_data.node.code)
+        if node_data.node.code == "B":
+            raise error
+        if node_data.node.code == "C":
+            return [warning]
+        return []
+
+    session.get_staging_node_data.side_effect = _mock_node_data
+    validator_init.return_value.validate.return_value = []
+    publisher_init.return_value.publish.side_effect = publish
+
+    report = eric.publish_nodes(nodes, workers=3)
+
+    publisher_init.assert_called_once_with(
+        session, eric.printer, mock.ANY, journal=None, context=eric.context
+    )
+    synchronized = publisher_init.call_args[0][2]
+    assert isinstance(synchronized, SynchronizedPidService)
+    assert synchronized.pid_service is pid_service
+    assert published[0] == "EU"
+    assert sorted(published) == ["A", "B", "C", "EU"]
+    assert report.nodes == nodes
+    assert report.errors == {nodes[2]: error}
+    assert report.warnings == {nodes[3]: [warning]}
+    assert eric.printer.write_lines.call_count == 4
+    eric.printer.print_summary.assert_called_once_with(report)
+
+
+def test_publish_nodes_concurrently_output_order(
+    session, pid_service, publisher_init, validator_init, stager_init, capsys
+):
+    eric = Eric(session, pid_service)
+    nodes = [Node("A", "A"), Node("B", "B"), Node("C", "C")]
+    # the largest node is started first
+    sizes = {"A": 1, "B": 2, "C": 3}
+    session.get_staging_row_count.side_effect = lambda node: sizes[node.code]
+    session.get_staging_node_data.side_effect = _mock_node_data
+    validator_init.return_value.validate.return_value = []
+    publisher_init.return_value.publish.return_value = []
+
+    eric.publish_nodes(nodes, workers=3)
+
+    output = capsys.readouterr().out
+    titles = [output.index(f"🌍 Node {node.code}") for node in nodes]
+    assert titles == sorted(titles)
+
+
 def _mock_node_data(node: Node):
     return NodeData(
         node=node,
@@ -141,3 +276,127 @@ def _mock_node_data(node: Node):
         collections=MagicMock(),
         table_by_type=MagicMock(),
     )
+
+
+def test_plan_nodes(eric, pid_service, publisher_init, validator_init, session):
+    no = Node("NO", "succeeds")
+    nl = ExternalServerNode("NL", "fails during planning", "url")
+    no_data = _mock_node_data(no)
+    nl_data = _mock_node_data(nl)
+    session.get_staging_node_data.side_effect = [no_data, nl_data]
+    validator_init.return_value.validate.return_value = []
+    plan = MagicMock()
+    plan.warnings = [EricWarning("warning")]
+    error = EricError("error")
+    publisher_init.return_value.plan.side_effect = [plan, error]
+
+    plans, report = eric.plan_nodes([no, nl])
+
+    assert plans == [plan]
+    assert publisher_init.mock_calls == [
+        mock.call(session, eric.printer, pid_service, context=eric.context),
+        mock.call().plan(no_data),
+        mock.call().plan(nl_data),
+    ]
+    publisher_init.return_value.publish.assert_not_called()
+    assert report.warnings[no] == [EricWarning("warning")]
+    assert report.errors[nl] == error
+
+
+def test_plan_nodes_without_pid_service():
+    eu = Node("EU", "Europe")
+    nl = Node("NL", "Netherlands")
+    generator = Generator(Spec.of_rows(100))
+    staging = [generator.node_data(eu), generator.node_data(nl)]
+
+    with StandInServer() as server:
+        for node_data in staging:
+            server.add_node_data(node_data)
+        for table in generator.node_data(nl, Source.PUBLISHED).import_order:
+            server.add_table(table.meta)
+        quality_info = generator.quality_info(*staging)
+        for meta, rows in directory_tables([eu, nl], quality_info):
+            server.add_table(meta, rows)
+        eric = Eric(EricSession(url=server.url), NoOpPidService())
+        eric.printer = Printer(QuietOutput())
+
+        plans, report = eric.plan_nodes([nl])
+
+    assert not report.errors
+    biobanks = plans[0].get_table(TableType.BIOBANKS)
+    assert len(biobanks.add) == len(staging[1].biobanks.rows)
+    assert plans[0].pids.register == []
+
+
+def test_apply_plans(eric, pid_service, publisher_init, session):
+    no = Node("NO", "succeeds")
+    nl = Node("NL", "fails")
+    no_plan = MagicMock(node=no)
+    nl_plan = MagicMock(node=nl)
+    error = EricError("error")
+    publisher_init.return_value.apply.side_effect = [[], error]
+
+    report = eric.apply_plans([no_plan, nl_plan])
+
+    assert publisher_init.mock_calls == [
+        mock.call(session, eric.printer, pid_service, context=eric.context),
+        mock.call().apply(no_plan),
+        mock.call().apply(nl_plan),
+    ]
+    assert no not in report.errors
+    assert report.errors[nl] == error
+    eric.printer.print_summary.assert_called_once_with(report)
+
+
+def test_publish_nodes_with_journal(
+    eric, pid_service, publisher_init, validator_init, session
+):
+    no = Node("NO", "succeeds")
+    nl = Node("NL", "fails")
+    session.get_staging_node_data.side_effect = [
+        _mock_node_data(no),
+        _mock_node_data(nl),
+    ]
+    validator_init.return_value.validate.return_value = []
+    publisher_init.return_value.publish.side_effect = [[], EricError("error")]
+    journal = MagicMock()
+
+    eric.publish_nodes([no, nl], journal=journal)
+
+    publisher_init.assert_called_once_with(
+        session, eric.printer, pid_service, journal=journal, context=eric.context
+    )
+    journal.clear.assert_called_once_with(no)
+
+
+def test_publish_nodes_combined(
+    eric, pid_service, publisher_init, validator_init, stager_init, session
+):
+    no = Node("NO", "succeeds")
+    nl = ExternalServerNode("NL", "fails staging", "url")
+    be = Node("BE", "fails publishing")
+    no_data = _mock_node_data(no)
+    be_data = _mock_node_data(be)
+    session.get_staging_node_data.side_effect = [no_data, be_data]
+    stager_init.return_value.stage.side_effect = EricError("staging error")
+    validator_init.return_value.validate.return_value = []
+    publisher = publisher_init.return_value
+    publisher.prepare.side_effect = [
+        ("no_published", [EricWarning("warning")]),
+        ("be_published", []),
+    ]
+    combined_report = ErrorReport([no, be])
+    combined_report.add_error(be, EricError("publish error"))
+    publisher.publish_combined.return_value = combined_report
+
+    report = eric.publish_nodes([no, nl, be], combined=True)
+
+    publisher.publish.assert_not_called()
+    publisher.publish_combined.assert_called_once_with(
+        [(no_data, "no_published"), (be_data, "be_published")]
+    )
+    assert report.nodes == [no, nl, be]
+    assert no not in report.errors
+    assert str(report.errors[nl]) == "staging error"
+    assert str(report.errors[be]) == "publish error"
+    assert report.warnings[no] == [EricWarning("warning")]
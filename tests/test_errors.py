@@ -45,6 +45,23 @@ def test_error_report():
     assert report.has_warnings()
 
 
+def test_error_report_merge():
+    a = Node("A", "A")
+    b = Node("B", "B")
+    report = ErrorReport([a, b])
+    report.add_warnings(a, [EricWarning("first")])
+    other = ErrorReport([a])
+    error = EricError("error")
+    other.add_error(a, error)
+    other.add_warnings(a, [EricWarning("second")])
+
+    report.merge(other)
+
+    assert report.nodes == [a, b]
+    assert report.errors[a] == error
+    assert report.warnings[a] == [EricWarning("first"), EricWarning("second")]
+
+
 def test_requests_error_handler():
     exception = requests.exceptions.ConnectionError()
 
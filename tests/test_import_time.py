@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+from typing import Dict
+
+import pytest
+
+MODULES = [
+    "molgenis.bbmri_eric.bbmri_client",
+    "molgenis.bbmri_eric.eric",
+    "molgenis.bbmri_eric.publisher",
+    "molgenis.bbmri_eric.stager",
+]
+
+HEAVY_DEPENDENCIES = ["pandas", "numpy", "pyhandle"]
+
+MAX_IMPORT_TIME_US = int(os.environ.get("ERIC_MAX_IMPORT_TIME_MS", "1000")) * 1000
+"""Upper limit for the cumulative import time of a module, configurable because
+import times depend heavily on the machine"""
+
+pytestmark = pytest.mark.skipif(
+    sys.version_info < (3, 7), reason="-X importtime requires Python 3.7"
+)
+
+
+def import_times(module: str) -> Dict[str, int]:
+    """
+    Imports a module in a fresh interpreter with -X importtime and returns the
+    cumulative import time (in microseconds) of every module that was imported.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+
+    times = dict()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+@pytest.mark.parametrize("module", MODULES)
+def test_heavy_dependencies_are_imported_lazily(module):
+    times = import_times(module)
+
+    assert module in times
+    for dependency in HEAVY_DEPENDENCIES:
+        assert dependency not in times, f"{module} imports {dependency}"
+
+
+@pytest.mark.parametrize("module", MODULES)
+def test_import_time(module):
+    times = import_times(module)
+
+    assert times[module] < MAX_IMPORT_TIME_US
@@ -0,0 +1,142 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import BaseAdapter
+
+from molgenis.bbmri_eric.bbmri_client import ExtendedSession
+from molgenis.bbmri_eric.instrumentation import (
+    RequestRecord,
+    RequestStats,
+    _percentile,
+    bind,
+    current_node,
+    node_scope,
+)
+
+
+class _Adapter(BaseAdapter):
+    """Answers every request with the same status and body."""
+
+    def __init__(self, status: int, body: dict):
+        super().__init__()
+        self.status = status
+        self.body = body
+
+    def send(self, request, **kwargs):
+        response = requests.Response()
+        response.status_code = self.status
+        response._content = json.dumps(self.body).encode("utf-8")
+        response.request = request
+        response.url = request.url
+        return response
+
+    def close(self):
+        pass
+
+
+def _session(status: int = 200, body: dict = None) -> ExtendedSession:
+    session = ExtendedSession("http://directory")
+    session._session.mount("http://", _Adapter(status, body or {}))
+    return session
+
+
+def test_instrument_get():
+    session = _session(body={"meta": {}, "start": 0, "num": 100, "total": 250})
+    stats = RequestStats()
+    session.instrument(stats.record)
+
+    with node_scope("NL"):
+        session._session.get(
+            "http://directory/api/v2/eu_bbmri_eric_NL_persons?num=100&start=200"
+        )
+
+    [record] = stats.records
+    assert record.method == "GET"
+    assert record.endpoint == "v2"
+    assert record.entity_type == "eu_bbmri_eric_NL_persons"
+    assert record.rows == 50
+    assert record.request_bytes == 0
+    assert record.response_bytes > 0
+    assert record.latency > 0
+    assert record.status == 200
+    assert record.node == "NL"
+
+
+def test_instrument_writes():
+    session = _session(body={"resources": [{"href": "/api/v2/persons/p1"}]})
+    records = []
+    session.instrument(records.append)
+
+    session.add_all("eu_bbmri_eric_persons", [{"id": "p1"}, {"id": "p2"}])
+    session.update("eu_bbmri_eric_persons", [{"id": "p1"}])
+    session.delete_list("eu_bbmri_eric_persons", ["p1"])
+    session.delete("eu_bbmri_eric_persons", "p2")
+
+    assert [(r.method, r.entity_type, r.rows) for r in records] == [
+        ("POST", "eu_bbmri_eric_persons", 2),
+        ("PUT", "eu_bbmri_eric_persons", 1),
+        ("DELETE", "eu_bbmri_eric_persons", 1),
+        ("DELETE", "eu_bbmri_eric_persons", 1),
+    ]
+    assert records[0].request_bytes > records[1].request_bytes
+    assert records[0].node is None
+
+
+def test_instrument_errors():
+    session = _session(status=404)
+    stats = RequestStats()
+    session.instrument(stats.record)
+
+    session._session.get("http://directory/api/metadata/unknown")
+
+    assert stats.summary()["run"]["errors"] == 1
+    assert stats.records[0].endpoint == "metadata"
+
+
+def test_bind():
+    with node_scope("NL"):
+        bound = bind(current_node)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert executor.submit(current_node).result() is None
+        assert executor.submit(bound).result() == "NL"
+    assert current_node() is None
+
+
+def test_summary(tmp_path):
+    stats = RequestStats()
+    for node, table, latency in [
+        ("NL", "persons", 0.1),
+        ("NL", "biobanks", 0.3),
+        ("BE", "persons", 0.2),
+    ]:
+        stats.record(RequestRecord("GET", "v2", table, 10, 0, 100, latency, 200, node))
+
+    summary = stats.summary()
+
+    assert summary["run"]["requests"] == 3
+    assert summary["run"]["rows"] == 30
+    assert summary["run"]["latency_p50"] == 0.2
+    assert summary["run"]["latency_max"] == 0.3
+    assert summary["nodes"]["NL"]["requests"] == 2
+    assert summary["nodes"]["BE"]["response_bytes"] == 100
+    assert summary["tables"]["persons"]["latency_total"] == 0.1 + 0.2
+    assert list(summary["nodes"]["NL"]["tables"]) == ["biobanks", "persons"]
+    assert summary["nodes"]["NL"]["tables"]["persons"]["latency_total"] == 0.1
+    assert summary["nodes"]["BE"]["tables"]["persons"]["requests"] == 1
+
+    path = str(tmp_path / "requests.json")
+    stats.save(path, include_records=True)
+    with open(path) as file:
+        saved = json.load(file)
+    assert saved["run"] == summary["run"]
+    assert len(saved["records"]) == 3
+
+
+def test_percentile():
+    values = [float(i) for i in range(1, 101)]
+
+    assert _percentile(values, 50) == 50.0
+    assert _percentile(values, 99) == 99.0
+    assert _percentile([1.0], 90) == 1.0
+    assert _percentile([], 90) == 0.0
@@ -0,0 +1,99 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+from molgenis.bbmri_eric.journal import CheckpointJournal, hash_batch
+from molgenis.bbmri_eric.model import Node, Row, RowSchema
+
+
+def test_hash_batch():
+    row = Row.of(RowSchema(), {"id": "1", "name": "a"})
+
+    assert hash_batch([row]) == hash_batch([{"name": "a", "id": "1"}])
+    assert hash_batch([row]) != hash_batch([{"id": "1", "name": "b"}])
+    assert hash_batch(["1", "2"]) != hash_batch(["2", "1"])
+
+
+def test_hash_of_transformed_rows_is_stable_across_processes():
+    script = textwrap.dedent("""\
+        from unittest.mock import MagicMock
+
+        from molgenis.bbmri_eric.journal import hash_batch
+        from molgenis.bbmri_eric.printer import Printer, QuietOutput
+        from molgenis.bbmri_eric.transformer import Transformer
+
+        node_data = MagicMock()
+        node_data.collections.rows = [
+            {"id": "c", "biobank": "b", "network": ["n3", "n1", "n5"]}
+        ]
+        node_data.biobanks.rows_by_id = {"b": {"network": ["n4", "n2", "n1"]}}
+        Transformer(
+            node_data=node_data,
+            quality=MagicMock(),
+            printer=Printer(QuietOutput()),
+            existing_biobanks=MagicMock(),
+            eu_node_data=MagicMock(),
+        )._set_combined_networks()
+        print(hash_batch(node_data.collections.rows))
+        """)
+
+    hashes = set()
+    for seed in ("1", "2", "3"):
+        result = subprocess.run(
+            [sys.executable, "-c", script],
+            env=dict(os.environ, PYTHONHASHSEED=seed),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        hashes.add(result.stdout.strip())
+
+    assert len(hashes) == 1
+
+
+def test_checkpoint(tmp_path):
+    path = str(tmp_path / "publish.journal")
+    nl = Node("NL", "Netherlands")
+    checkpoint = CheckpointJournal(path).checkpoint(nl, "eu_bbmri_eric_persons")
+
+    assert not checkpoint.is_done("upsert", [{"id": "1"}])
+    checkpoint.record("upsert", [{"id": "1"}])
+
+    assert checkpoint.is_done("upsert", [{"id": "1"}])
+    assert not checkpoint.is_done("delete", [{"id": "1"}])
+    assert not checkpoint.is_done("upsert", [{"id": "2"}])
+    assert checkpoint.skipped == 1
+
+
+def test_journal_is_persisted(tmp_path):
+    path = str(tmp_path / "publish.journal")
+    nl = Node("NL", "Netherlands")
+    be = Node("BE", "Belgium")
+    journal = CheckpointJournal(path)
+    journal.checkpoint(nl, "eu_bbmri_eric_persons").record("upsert", ["a"])
+    journal.checkpoint(be, "eu_bbmri_eric_persons").record("delete", ["b"])
+
+    reloaded = CheckpointJournal(path)
+
+    assert len(reloaded) == 2
+    assert reloaded.checkpoint(nl, "eu_bbmri_eric_persons").is_done("upsert", ["a"])
+    assert not reloaded.checkpoint(be, "eu_bbmri_eric_biobanks").is_done(
+        "delete", ["b"]
+    )
+
+
+def test_clear(tmp_path):
+    path = str(tmp_path / "publish.journal")
+    nl = Node("NL", "Netherlands")
+    be = Node("BE", "Belgium")
+    journal = CheckpointJournal(path)
+    journal.checkpoint(nl, "eu_bbmri_eric_persons").record("upsert", ["a"])
+    journal.checkpoint(be, "eu_bbmri_eric_persons").record("upsert", ["a"])
+
+    journal.clear(nl)
+
+    reloaded = CheckpointJournal(path)
+    assert len(journal) == len(reloaded) == 1
+    assert not reloaded.checkpoint(nl, "eu_bbmri_eric_persons").is_done("upsert", ["a"])
+    assert reloaded.checkpoint(be, "eu_bbmri_eric_persons").is_done("upsert", ["a"])
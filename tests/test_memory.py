@@ -0,0 +1,304 @@
+import json
+import tracemalloc
+from unittest.mock import MagicMock
+
+import pkg_resources
+import pytest
+
+from molgenis.bbmri_eric import utils
+from molgenis.bbmri_eric.eric import Eric
+from molgenis.bbmri_eric.errors import EricError
+from molgenis.bbmri_eric.instrumentation import node_scope
+from molgenis.bbmri_eric.memory import (
+    ROW_SIZE,
+    WORKING_SET_FACTOR,
+    MemoryBudget,
+    MemoryBudgetExceeded,
+    MemoryTracker,
+    estimate_size,
+)
+from molgenis.bbmri_eric.metrics import Metrics
+from molgenis.bbmri_eric.model import Node, NodeData, QualityInfo
+from molgenis.bbmri_eric.pid_service import NoOpPidService
+from molgenis.bbmri_eric.prefetch import NodeDataPrefetcher
+from molgenis.bbmri_eric.printer import Printer, QuietOutput
+
+SNAPSHOT = pkg_resources.resource_filename("tests.resources", "node_data.snapshot")
+
+
+class _Session:
+    """
+    A session that loads fresh data for every node and drops the rows that are
+    published. (Mocks would keep the data alive.)
+    """
+
+    url = "url"
+
+    def __init__(self):
+        self.upserted = 0
+        self.retrieved = 0
+
+    def get_staging_node_data(self, node: Node) -> NodeData:
+        self.retrieved += 1
+        return NodeData.load(SNAPSHOT)
+
+    @staticmethod
+    def get_staging_row_count(node: Node) -> int:
+        return sum(
+            len(table.rows_by_id) for table in NodeData.load(SNAPSHOT).import_order
+        )
+
+    @staticmethod
+    def get_published_node_data(node: Node) -> NodeData:
+        return NodeData.load(SNAPSHOT)
+
+    @staticmethod
+    def get_quality_info(biobank_ids=None, collection_ids=None) -> QualityInfo:
+        return QualityInfo(biobanks={}, collections={})
+
+    def upsert_batched(self, entity_type_id, entities, checkpoint=None):
+        json.dumps({"entities": list(entities)}, default=dict)
+        self.upserted += len(entities)
+
+    @staticmethod
+    def delete_list(entity_type_id, ids):
+        pass
+
+
+@pytest.fixture
+def budgeted_eric():
+    eric = Eric(_Session(), NoOpPidService())
+    eric.printer = Printer(QuietOutput())
+    eric.context.eu_node_data = NodeData.load(SNAPSHOT)
+    return eric
+
+
+def test_memory_budget():
+    budget = MemoryBudget(100)
+
+    assert budget.try_reserve(60)
+    assert not budget.try_reserve(50)
+    with pytest.raises(MemoryBudgetExceeded):
+        budget.reserve(50, "data")
+    budget.release(60)
+    budget.reserve(100, "data")
+
+    assert budget.reserved == 100
+    assert budget.available == 0
+
+
+def test_memory_budget_reserve_shared():
+    budget = MemoryBudget(100)
+    size = MagicMock(return_value=40)
+
+    budget.reserve_shared("EU", size, "EU")
+    budget.reserve_shared("EU", size, "EU")
+
+    size.assert_called_once_with()
+    assert budget.reserved == 40
+
+
+def test_estimate_size(node_data):
+    size = estimate_size(node_data)
+
+    node_data.persons.rows_by_id.clear()
+
+    assert 0 < estimate_size(node_data) < size
+
+
+def test_prefetch_spills_over_budget(node_data):
+    small_data = NodeData.load(SNAPSHOT)
+    for table in small_data.import_order:
+        table.rows_by_id.clear()
+    session = MagicMock()
+    session.get_staging_node_data.return_value = small_data
+    session.get_published_node_data.return_value = node_data
+    node = Node("NL", "NL")
+    budget = MemoryBudget(estimate_size(small_data) * 2)
+
+    with NodeDataPrefetcher(session, [node], depth=1, budget=budget) as prefetcher:
+        prefetcher.advance(node)
+        # the published data is larger than expected and doesn't fit anymore
+        published = prefetcher.published_data(node)
+        staging = prefetcher.staging_data(node)
+
+    assert budget.reserved == 0
+    assert staging is small_data
+    assert published is not node_data
+    assert published.persons.rows_by_id.keys() == node_data.persons.rows_by_id.keys()
+
+
+def test_prefetch_skipped_without_room(node_data):
+    session = MagicMock()
+    session.get_staging_node_data.return_value = node_data
+    session.get_published_node_data.return_value = node_data
+    node = Node("NL", "NL")
+    budget = MemoryBudget(estimate_size(node_data))
+
+    with NodeDataPrefetcher(session, [node], depth=1, budget=budget) as prefetcher:
+        prefetcher.advance(node)
+        published = prefetcher.published_data(node)
+        staging = prefetcher.staging_data(node)
+
+    assert budget.reserved == 0
+    assert staging is node_data
+    assert published is None
+    session.get_published_node_data.assert_not_called()
+
+
+def test_prefetch_failure_releases_reservation(node_data):
+    nl = Node("NL", "NL")
+    be = Node("BE", "BE")
+    session = MagicMock()
+    session.get_staging_node_data.side_effect = [node_data, EricError("unavailable")]
+    session.get_published_node_data.return_value = node_data
+    budget = MemoryBudget(estimate_size(node_data) * 10)
+
+    with NodeDataPrefetcher(session, [nl, be], depth=2, budget=budget) as prefetcher:
+        prefetcher.advance(nl)
+        prefetcher.staging_data(nl)
+        prefetcher.published_data(nl)
+        # the size of NL's data was reserved while BE's staging data was fetched
+        with pytest.raises(EricError):
+            prefetcher.staging_data(be)
+        prefetcher.published_data(be)
+
+    assert budget.reserved == 0
+
+
+def test_publish_nodes_memory_budget_invalid(eric):
+    with pytest.raises(ValueError):
+        eric.publish_nodes([Node("NL", "NL")], workers=2, memory_budget=1000)
+
+
+def test_publish_nodes_memory_budget_refuses_node(budgeted_eric):
+    node = Node("NL", "NL")
+    size = estimate_size(NodeData.load(SNAPSHOT))
+
+    report = budgeted_eric.publish_nodes(
+        [node], memory_budget=size * WORKING_SET_FACTOR
+    )
+
+    assert isinstance(report.errors[node], MemoryBudgetExceeded)
+
+
+def test_publish_nodes_memory_budget_refuses_node_before_retrieving(budgeted_eric):
+    node = Node("NL", "NL")
+    eu_size = estimate_size(budgeted_eric.context.eu_node_data)
+
+    report = budgeted_eric.publish_nodes([node], memory_budget=eu_size + ROW_SIZE)
+
+    assert isinstance(report.errors[node], MemoryBudgetExceeded)
+    assert budgeted_eric.session.retrieved == 0
+
+
+def test_memory_budget_estimate_rows(node_data):
+    budget = MemoryBudget(100)
+    assert budget.estimate_rows(10) == 10 * ROW_SIZE * WORKING_SET_FACTOR
+
+    rows = sum(len(table.rows_by_id) for table in node_data.import_order)
+    budget.record_row_size(node_data, rows * 100)
+
+    assert budget.estimate_rows(10) == 10 * 100 * WORKING_SET_FACTOR
+
+
+def test_publish_nodes_memory_budget_enforced(budgeted_eric):
+    nodes = [Node(f"N{i}", f"node {i}") for i in range(10)]
+    size = estimate_size(NodeData.load(SNAPSHOT))
+    # room for the data of node EU, the current node and one prefetch
+    limit = size * (2 + WORKING_SET_FACTOR)
+
+    # warm up, so that only the publication itself is measured
+    budgeted_eric.publish_nodes(nodes[:2], prefetch_depth=2, memory_budget=limit)
+
+    tracemalloc.start()
+    try:
+        report = budgeted_eric.publish_nodes(
+            nodes, prefetch_depth=2, memory_budget=limit
+        )
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert not report.has_errors()
+    assert budgeted_eric.session.upserted > 0
+    assert peak <= limit
+
+
+@pytest.fixture
+def tracker():
+    tracker = MemoryTracker()
+    yield tracker
+    tracker.stop()
+
+
+def test_memory_tracker_phase(tracker):
+    with node_scope("NL"), tracker.phase("fetch"):
+        data = [bytearray(1024 * 1024)]
+        del data
+        kept = bytearray(1024 * 1024)
+
+    phase = tracker.to_dict()["NL"]["phases"]["fetch"]
+    assert phase["growth"] >= 1000 * 1000
+    assert phase["peak"] >= phase["growth"]
+    assert phase["top"][0]["location"].startswith("test_memory.py:")
+    assert phase["top"][0]["size"] >= len(kept)
+
+
+def test_memory_tracker_nested_phases(tracker):
+    with node_scope("NL"), tracker.phase("upsert"):
+        with tracker.phase("pids"):
+            data = [bytearray(1024 * 1024)]
+            del data
+
+    phases = tracker.to_dict()["NL"]["phases"]
+    assert phases["upsert"]["growth"] >= 1000 * 1000
+    assert phases["pids"]["growth"] >= 1000 * 1000
+    assert phases["pids"]["top"] == []
+
+
+def test_memory_tracker_sites(tracker, node_data):
+    table = node_data.collections
+
+    with node_scope("NL"), tracker.phase("upsert"):
+        utils.remove_one_to_manys(list(table.rows), table.meta)
+
+    sites = tracker.to_dict()["NL"]["phases"]["upsert"]["sites"]
+    assert sites["remove_one_to_manys"] > 0
+
+
+def test_memory_tracker_stop(tracker, node_data):
+    with tracker.phase("upsert"):
+        pass
+    tracker.stop()
+
+    table = node_data.collections
+    utils.remove_one_to_manys(list(table.rows), table.meta)
+
+    assert not tracemalloc.is_tracing()
+    assert tracker.to_dict()["-"]["phases"]["upsert"]["sites"] == {}
+
+
+def test_memory_tracker_add_tables(tracker, node_data):
+    tracker.add_tables(node_data)
+
+    tables = tracker.to_dict()["NO"]["tables"]["staging"]
+    assert list(tables) == ["persons", "networks", "biobanks", "collections"]
+    assert sum(tables.values()) == estimate_size(node_data)
+
+
+def test_metrics_with_memory(tracker, node_data):
+    metrics = Metrics(memory=tracker)
+
+    with node_scope("NO"), metrics.phase("fetch"):
+        metrics.add_node_data(node_data)
+
+    document = metrics.to_dict()
+    assert document["nodes"]["NO"]["counters"]["rows_read"] > 0
+    assert "fetch" in document["memory"]["NO"]["phases"]
+    lines = metrics.to_prometheus().splitlines()
+    assert "# TYPE eric_memory_peak_bytes gauge" in lines
+    assert any(
+        line.startswith('eric_memory_table_bytes{node="NO",source="staging",')
+        for line in lines
+    )
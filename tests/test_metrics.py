@@ -0,0 +1,140 @@
+import json
+from unittest.mock import MagicMock, patch
+
+from molgenis.bbmri_eric.errors import EricError, ErrorReport
+from molgenis.bbmri_eric.instrumentation import RequestRecord, RequestStats, node_scope
+from molgenis.bbmri_eric.metrics import Metrics, NoOpMetrics
+from molgenis.bbmri_eric.model import Node
+from molgenis.bbmri_eric.pid_service import MeteredPidService
+
+
+def _metrics() -> Metrics:
+    metrics = Metrics()
+    with node_scope("NL"):
+        metrics.add_duration("fetch", 1.0)
+        metrics.add_duration("fetch", 0.5)
+        metrics.count("rows_read", 10)
+        metrics.count("rows_written", 8)
+        metrics.count("pid_operations")
+    metrics.add_duration("upsert", 2.0)
+
+    nl, be = Node("NL", "NL"), Node("BE", "BE")
+    report = ErrorReport([nl, be])
+    report.add_error(be, EricError("error"))
+    report.add_warnings(nl, ["warning 1", "warning 2"])
+    metrics.add_report(report)
+    return metrics
+
+
+def test_phase():
+    metrics = Metrics()
+
+    with node_scope("NL"):
+        with metrics.phase("validate"):
+            pass
+        with metrics.phase("validate"):
+            pass
+
+    phases = metrics.to_dict()["nodes"]["NL"]["phases"]
+    assert list(phases) == ["validate"]
+    assert phases["validate"] >= 0
+
+
+def test_to_dict():
+    nodes = _metrics().to_dict()["nodes"]
+
+    assert nodes["NL"] == {
+        "status": "ok",
+        "warnings": 2,
+        "phases": {"fetch": 1.5},
+        "counters": {"rows_read": 10, "rows_written": 8, "pid_operations": 1},
+    }
+    assert nodes["BE"]["status"] == "error"
+    assert nodes["-"]["phases"] == {"upsert": 2.0}
+
+
+def test_to_prometheus():
+    text = _metrics().to_prometheus()
+
+    lines = text.splitlines()
+    assert "# TYPE eric_phase_duration_seconds gauge" in lines
+    assert 'eric_phase_duration_seconds{node="NL",phase="fetch"} 1.5' in lines
+    assert 'eric_phase_duration_seconds{node="-",phase="upsert"} 2.0' in lines
+    assert 'eric_rows{node="NL",operation="read"} 10' in lines
+    assert 'eric_rows{node="NL",operation="written"} 8' in lines
+    assert 'eric_pid_operations{node="NL"} 1' in lines
+    assert 'eric_warnings{node="NL"} 2' in lines
+    assert 'eric_node_success{node="NL"} 1' in lines
+    assert 'eric_node_success{node="BE"} 0' in lines
+    assert text.endswith("\n")
+
+
+def test_to_prometheus_with_requests():
+    requests = RequestStats()
+    requests.record(RequestRecord("GET", "v2", "persons", 1, 0, 10, 0.25, 200, "NL"))
+    metrics = Metrics(requests=requests)
+
+    lines = metrics.to_prometheus().splitlines()
+
+    assert 'eric_requests{node="NL"} 1' in lines
+    assert 'eric_request_bytes{node="NL",direction="response"} 10' in lines
+    assert 'eric_request_latency_seconds{node="NL",quantile="0.5"} 0.25' in lines
+
+
+def test_save(tmp_path):
+    metrics = _metrics()
+
+    metrics.save(str(tmp_path / "metrics"), name="run")
+
+    with open(tmp_path / "metrics" / "run.json") as file:
+        assert json.load(file)["nodes"]["NL"]["phases"] == {"fetch": 1.5}
+    with open(tmp_path / "metrics" / "run.prom") as file:
+        assert file.read() == metrics.to_prometheus()
+
+
+def test_no_op_metrics():
+    metrics = NoOpMetrics()
+
+    with node_scope("NL"), metrics.phase("fetch"):
+        metrics.count("rows_read", 10)
+    metrics.add_report(ErrorReport([Node("NL", "NL")]))
+
+    assert not metrics.enabled
+    assert metrics.to_dict()["nodes"] == {}
+
+
+def test_metered_pid_service():
+    service = MagicMock()
+    on_operation = MagicMock()
+    metered = MeteredPidService(service, on_operation)
+
+    metered.reverse_lookup("url")
+    metered.register_pid("url", "name")
+    metered.set_name("pid", "name")
+    metered.set_status("pid", "status")
+
+    assert on_operation.call_count == 4
+    service.register_pid.assert_called_once_with("url", "name")
+
+
+def test_publish_nodes_with_metrics(eric, session, pid_service):
+    nl = Node("NL", "NL")
+    session.get_staging_node_data.return_value = MagicMock(import_order=[])
+    eric.metrics = Metrics()
+
+    with patch("molgenis.bbmri_eric.eric.Validator") as validator_init, patch(
+        "molgenis.bbmri_eric.eric.Publisher"
+    ) as publisher_init:
+        validator_init.return_value.validate.return_value = []
+        publisher_init.return_value.publish.return_value = []
+        report = eric.publish_nodes([nl])
+
+    service = publisher_init.call_args.args[2]
+    assert isinstance(service, MeteredPidService)
+    assert service.pid_service is pid_service
+    assert publisher_init.return_value.metrics is eric.metrics
+    nodes = eric.metrics.to_dict()["nodes"]
+    assert set(nodes["NL"]["phases"]) == {"fetch", "validate"}
+    assert nodes["NL"]["status"] == "ok"
+    eric.printer.print_metrics.assert_called_once_with(eric.metrics)
+    assert not report.has_errors()
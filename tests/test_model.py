@@ -1,16 +1,76 @@
 # noinspection PyProtectedMember
+import copy
+import json
+import pickle
+import tracemalloc
+from collections import OrderedDict
 from unittest.mock import MagicMock
 
+import pytest
+
 from molgenis.bbmri_eric.model import (
     ExternalServerNode,
     Node,
     NodeData,
+    Row,
+    RowSchema,
     Source,
     Table,
+    TableMeta,
     TableType,
 )
 
 
+def _attribute(name: str, type_: str, **kwargs) -> dict:
+    return {"data": {"name": name, "type": type_, "idAttribute": False, **kwargs}}
+
+
+@pytest.fixture
+def meta() -> TableMeta:
+    ref = "http://directory/api/metadata/{}"
+    return TableMeta(
+        {
+            "data": {
+                "id": "eu_bbmri_eric_collections",
+                "attributes": {
+                    "items": [
+                        _attribute("id", "string", idAttribute=True, nullable=False),
+                        _attribute("name", "string", nullable=False),
+                        _attribute(
+                            "biobank",
+                            "xref",
+                            refEntityType={
+                                "self": ref.format("eu_bbmri_eric_biobanks")
+                            },
+                        ),
+                        _attribute(
+                            "parent_collection",
+                            "xref",
+                            refEntityType={
+                                "self": ref.format("eu_bbmri_eric_collections")
+                            },
+                        ),
+                        _attribute(
+                            "sub_collections",
+                            "onetomany",
+                            refEntityType={
+                                "self": ref.format("eu_bbmri_eric_collections")
+                            },
+                        ),
+                        _attribute(
+                            "type",
+                            "categoricalmref",
+                            refEntityType={
+                                "self": ref.format("eu_bbmri_eric_collection_types")
+                            },
+                        ),
+                    ]
+                },
+            }
+        }
+    )
+
+
 def test_table_type_order():
     assert TableType.get_import_order() == [
         TableType.PERSONS,
@@ -39,6 +99,144 @@ def test_table_factory_method():
     assert table.rows[1] == row2
 
 
+def test_table_meta_schema(meta):
+    schema = meta.schema
+
+    assert meta.schema is schema
+    assert schema.id == "eu_bbmri_eric_collections"
+    assert schema.id_attribute == "id"
+    assert schema.attribute_names == (
+        "id",
+        "name",
+        "biobank",
+        "parent_collection",
+        "sub_collections",
+        "type",
+    )
+    assert schema.types["type"] == "categoricalmref"
+    assert schema.ref_entity_types["biobank"] == "eu_bbmri_eric_biobanks"
+    assert schema.single_references == {"biobank", "parent_collection"}
+    assert schema.multi_references == {"sub_collections", "type"}
+    assert schema.one_to_manys == {"sub_collections"}
+    assert schema.self_references == {"parent_collection"}
+    assert schema.required == {"id", "name"}
+    assert "biobank" in schema.nullable
+
+
+def test_table_meta_properties(meta):
+    assert meta.id_attribute == "id"
+    assert meta.one_to_manys == ["sub_collections"]
+    assert meta.self_references == ["parent_collection"]
+    assert meta.attribute_names[:2] == ["id", "name"]
+    assert "_schema" not in pickle.loads(pickle.dumps(meta)).__dict__
+
+
+def test_table_interns_references(meta):
+    rows = [
+        {"id": "c1", "biobank": "".join(["b", "1"]), "type": ["".join(["t", "1"])]},
+        {"id": "c2", "biobank": "".join(["b", "1"]), "type": ["".join(["t", "1"])]},
+    ]
+
+    table = Table.of(TableType.COLLECTIONS, meta, rows)
+
+    c1 = table.rows_by_id["c1"]
+    c2 = table.rows_by_id["c2"]
+    assert c1["biobank"] is c2["biobank"]
+    assert c1["type"][0] is c2["type"][0]
+
+
+def test_table_rows_are_compact():
+    table = Table.of(
+        TableType.PERSONS,
+        MagicMock(),
+        [{"id": "1", "name": "a"}, {"id": "2", "email": "b"}],
+    )
+
+    row1 = table.rows_by_id["1"]
+    row2 = table.rows_by_id["2"]
+    assert type(row1) is Row
+    assert row1._schema is row2._schema
+    assert row1._schema.names == ["id", "name", "email"]
+    assert table.rows == [{"id": "1", "name": "a"}, {"id": "2", "email": "b"}]
+    assert len(table.rows) == 2
+    assert table.rows[-1] == row2
+
+
+def test_table_rows_follow_changes():
+    table = Table.of(
+        TableType.PERSONS, MagicMock(), [{"id": "1"}, {"id": "2"}, {"id": "3"}]
+    )
+    rows = table.rows
+    assert rows[1] == {"id": "2"}
+    assert rows[1] is rows[1]
+
+    table.rows_by_id["2"] = {"id": "2", "name": "b"}
+    assert rows[1] == {"id": "2", "name": "b"}
+    del table.rows_by_id["1"]
+    assert rows[0] == {"id": "2", "name": "b"}
+    table.rows_by_id.pop("2")
+    table.rows_by_id.setdefault("4", {"id": "4"})
+    assert rows[:] == [{"id": "3"}, {"id": "4"}]
+    table.rows_by_id.move_to_end("3")
+    assert rows[-1] == {"id": "3"}
+    table.rows_by_id.clear()
+    with pytest.raises(IndexError):
+        rows[0]
+
+
+def test_row_dict_api():
+    row = Row.of(RowSchema(["id", "name", "network"]), {"id": "1", "name": "a"})
+
+    assert row["id"] == "1"
+    assert "network" not in row
+    assert row.get("network") is None
+    assert list(row) == ["id", "name"]
+
+    row["network"] = ["n1"]
+    row["national_node"] = "NL"
+    del row["name"]
+
+    assert row == {"id": "1", "network": ["n1"], "national_node": "NL"}
+    assert row.pop("national_node") == "NL"
+    assert row.pop("unknown", None) is None
+    assert len(row) == 2
+    assert json.loads(json.dumps(row, default=dict)) == {"id": "1", "network": ["n1"]}
+
+
+def test_row_copies():
+    row = Row.of(RowSchema(), {"id": "1", "network": ["n1"]})
+
+    deep = copy.deepcopy(row)
+    deep["network"].append("n2")
+    unpickled = pickle.loads(pickle.dumps(row))
+
+    assert deep._schema is row._schema
+    assert row["network"] == ["n1"]
+    assert unpickled == row
+
+
+def test_table_uses_less_memory_than_dicts():
+    def rows():
+        for i in range(1000):
+            yield {"id": f"id{i}", **{f"attr{j}": j for j in range(40)}}
+
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        dicts = OrderedDict((row["id"], row) for row in rows())
+        dict_size = tracemalloc.get_traced_memory()[0] - start
+        del dicts
+
+        start = tracemalloc.get_traced_memory()[0]
+        table = Table.of(TableType.PERSONS, MagicMock(), rows())
+        table_size = tracemalloc.get_traced_memory()[0] - start
+    finally:
+        tracemalloc.stop()
+
+    assert len(table.rows) == 1000
+    assert table_size < dict_size / 2
+
+
 def test_node_staging_id():
     node = Node("NL", "NL")
 
@@ -8,7 +8,9 @@ from molgenis.bbmri_eric.pid_service import (
     DummyPidService,
     NoOpPidService,
     PidService,
+    RecordingPidService,
     Status,
+    SynchronizedPidService,
 )
 
 
@@ -101,3 +103,45 @@ def test_base_url(handle_client):
 
     assert service1.base_url == "test1.nl/"
     assert service2.base_url == "test2.nl/"
+
+
+def test_recording_service():
+    service = MagicMock()
+    service.base_url = "url/"
+    service.reverse_lookup.return_value = ["pid1"]
+    recorder = RecordingPidService(service)
+
+    assert recorder.base_url == "url/"
+    assert recorder.reverse_lookup("url/#/biobank/1") == ["pid1"]
+    assert recorder.register_pid("url/#/biobank/2", "name2") == "PLANNED:1"
+    assert recorder.register_pid("url/#/biobank/3", "name3") == "PLANNED:2"
+    recorder.set_name("pid1", "new name")
+    recorder.set_status("pid4", Status.TERMINATED)
+
+    assert recorder.registrations == [
+        {"pid": "PLANNED:1", "url": "url/#/biobank/2", "name": "name2"},
+        {"pid": "PLANNED:2", "url": "url/#/biobank/3", "name": "name3"},
+    ]
+    assert recorder.names == {"pid1": "new name"}
+    assert recorder.statuses == {"pid4": Status.TERMINATED}
+    service.register_pid.assert_not_called()
+    service.set_name.assert_not_called()
+    service.set_status.assert_not_called()
+
+
+def test_synchronized_service():
+    service = MagicMock()
+    service.base_url = "url/"
+    service.reverse_lookup.return_value = ["pid1"]
+    service.register_pid.return_value = "pid2"
+    synchronized = SynchronizedPidService(service)
+
+    assert synchronized.base_url == "url/"
+    assert synchronized.reverse_lookup("url/#/biobank/1") == ["pid1"]
+    assert synchronized.register_pid("url/#/biobank/2", "name2") == "pid2"
+    synchronized.set_name("pid1", "new name")
+    synchronized.set_status("pid2", Status.TERMINATED)
+
+    service.set_name.assert_called_once_with("pid1", "new name")
+    service.set_status.assert_called_once_with("pid2", Status.TERMINATED)
+    assert not synchronized._lock.locked()
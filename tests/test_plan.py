@@ -0,0 +1,73 @@
+import pytest
+
+from molgenis.bbmri_eric.errors import EricWarning
+from molgenis.bbmri_eric.model import ExternalServerNode, TableType
+from molgenis.bbmri_eric.plan import BATCH_SIZE, PidPlan, PublishPlan, TablePlan
+
+
+@pytest.fixture
+def plan() -> PublishPlan:
+    return PublishPlan(
+        node=ExternalServerNode("NL", "Netherlands", "url.nl"),
+        tables=[
+            TablePlan(
+                type=TableType.PERSONS,
+                add=[{"id": "p1"}],
+                update=[{"id": "p2"}],
+                delete=["p3"],
+            ),
+            TablePlan(
+                type=TableType.BIOBANKS,
+                self_references=[],
+                add=[{"id": "b1", "pid": "PLANNED:1"}],
+            ),
+        ],
+        pids=PidPlan(
+            register=[{"pid": "PLANNED:1", "url": "url/#/biobank/b1", "name": "b1"}],
+            rename={"pid2": "new name"},
+            terminate=["pid3"],
+        ),
+        warnings=[EricWarning("warning")],
+    )
+
+
+def test_request_count(plan):
+    assert plan.get_table(TableType.PERSONS).request_count == 3
+    assert plan.get_table(TableType.BIOBANKS).request_count == 1
+    assert plan.pids.request_count == 3
+    assert plan.request_count == 7
+
+
+def test_request_count_batches():
+    table = TablePlan(
+        type=TableType.PERSONS, add=[{"id": str(i)} for i in range(BATCH_SIZE + 1)]
+    )
+
+    assert table.request_count == 2
+
+
+def test_payload_bytes(plan):
+    assert plan.payload_bytes == len(
+        b'{"entities": [{"id": "p1"}]}'
+        b'{"entities": [{"id": "p2"}]}'
+        b'{"entityIds": ["p3"]}'
+        b'{"entities": [{"id": "b1", "pid": "PLANNED:1"}]}'
+    )
+
+
+def test_save_load(plan, tmp_path):
+    path = str(tmp_path / "plan.json")
+
+    plan.save(path)
+    loaded = PublishPlan.load(path)
+
+    assert loaded == plan
+    assert isinstance(loaded.node, ExternalServerNode)
+
+
+def test_from_dict_newer_version(plan):
+    data = plan.to_dict()
+    data["version"] += 1
+
+    with pytest.raises(ValueError):
+        PublishPlan.from_dict(data)
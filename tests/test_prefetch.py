@@ -0,0 +1,70 @@
+from unittest import mock
+from unittest.mock import MagicMock
+
+import pytest
+
+from molgenis.bbmri_eric.model import ExternalServerNode, Node
+from molgenis.bbmri_eric.prefetch import NodeDataPrefetcher
+from molgenis.client import MolgenisRequestError
+
+
+@pytest.fixture
+def nodes():
+    return [Node("A", "A"), ExternalServerNode("B", "B", "url"), Node("C", "C")]
+
+
+def test_prefetch_disabled(session, nodes):
+    with NodeDataPrefetcher(session, nodes, depth=0) as prefetcher:
+        prefetcher.advance(nodes[0])
+
+        assert prefetcher.staging_data(nodes[0]) is None
+        assert prefetcher.published_data(nodes[0]) is None
+
+    assert not session.get_staging_node_data.called
+    assert not session.get_published_node_data.called
+
+
+def test_prefetch_depth(session, nodes):
+    nodes = nodes[:2]
+    session.get_staging_node_data.side_effect = lambda node: f"staging {node.code}"
+    session.get_published_node_data.side_effect = lambda node: f"published {node.code}"
+
+    with NodeDataPrefetcher(session, nodes, depth=1) as prefetcher:
+        prefetcher.advance(nodes[0])
+        assert prefetcher.staging_data(nodes[0]) == "staging A"
+        assert prefetcher.published_data(nodes[0]) == "published A"
+
+        # node B has an external server, its staging data can't be prefetched
+        prefetcher.advance(nodes[1])
+        assert prefetcher.staging_data(nodes[1]) is None
+        assert prefetcher.published_data(nodes[1]) == "published B"
+
+    assert session.get_staging_node_data.mock_calls == [mock.call(nodes[0])]
+    assert session.get_published_node_data.mock_calls == [
+        mock.call(nodes[0]),
+        mock.call(nodes[1]),
+    ]
+
+
+def test_prefetch_error(session, nodes):
+    error = MolgenisRequestError("error")
+    session.get_staging_node_data.side_effect = error
+
+    with NodeDataPrefetcher(session, nodes, depth=2) as prefetcher:
+        prefetcher.advance(nodes[0])
+
+        with pytest.raises(MolgenisRequestError) as exception_info:
+            prefetcher.staging_data(nodes[0])
+
+    assert exception_info.value is error
+
+
+def test_release(session, nodes):
+    session.get_published_node_data.return_value = MagicMock()
+
+    with NodeDataPrefetcher(session, nodes, depth=1) as prefetcher:
+        prefetcher.advance(nodes[0])
+        prefetcher.release(nodes[0])
+
+        assert prefetcher.published_data(nodes[0]) is None
+        assert prefetcher.staging_data(nodes[0]) is None
@@ -1,8 +1,25 @@
+import io
+import json
 import textwrap
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+import pytest
 
 from molgenis.bbmri_eric.errors import EricError, EricWarning, ErrorReport
+from molgenis.bbmri_eric.instrumentation import node_scope
+from molgenis.bbmri_eric.metrics import Metrics
 from molgenis.bbmri_eric.model import Node
-from molgenis.bbmri_eric.printer import Printer
+from molgenis.bbmri_eric.printer import (
+    JsonLinesOutput,
+    Level,
+    Output,
+    Printer,
+    QuietOutput,
+    TextOutput,
+)
+from molgenis.bbmri_eric.profiling import HotFunction
 
 
 def test_indentation(capsys):
@@ -152,3 +169,250 @@ def test_with_indentation(capsys):
 
     captured = capsys.readouterr()
     assert captured.out == expected
+
+
+def test_buffer(capsys):
+    printer = Printer()
+
+    with printer.buffer() as lines:
+        printer.print("line1")
+        with printer.indentation():
+            printer.print("line2")
+
+    assert capsys.readouterr().out == ""
+    assert lines == ["line1", "    line2"]
+
+    printer.write_lines(lines)
+
+    assert capsys.readouterr().out == "line1\n    line2\n"
+
+
+def test_indentation_per_thread():
+    printer = Printer()
+    printer.indent()
+    lines = []
+
+    def print_in_thread():
+        with printer.buffer() as buffered:
+            printer.print("other thread")
+        lines.extend(buffered)
+
+    thread = threading.Thread(target=print_in_thread)
+    thread.start()
+    thread.join()
+
+    assert lines == ["other thread"]
+    assert printer.indents == 1
+
+
+def test_print_metrics():
+    printer = Printer()
+    metrics = Metrics()
+    with node_scope("NL"):
+        metrics.add_duration("validate", 2.0)
+        metrics.add_duration("fetch", 1.0)
+        metrics.count("rows_read", 10)
+
+    with printer.buffer() as lines:
+        printer.print_metrics(metrics)
+
+    assert lines == [
+        "",
+        "⏱️ Durations",
+        "    NL: fetch 1.0s, validate 2.0s (total 3.0s, 10 rows read, 0 written, "
+        "0 deleted)",
+    ]
+
+
+def test_print_hot_functions():
+    printer = Printer()
+    profiler = MagicMock(directory="profiles")
+    profiler.get_hot_functions.return_value = {
+        "upsert": [HotFunction("add_all", "client.py:10", 3, 2.0, 2.5)],
+        "fetch": [HotFunction("get", "client.py:20", 1, 1.0, 1.25)],
+    }
+
+    with printer.buffer() as lines:
+        printer.print_hot_functions(profiler)
+
+    assert lines == [
+        "",
+        "🔥 Hot functions (profiles are saved in profiles)",
+        "    fetch",
+        "        1.000s get (client.py:20), 1 call(s), 1.250s cumulative",
+        "    upsert",
+        "        2.000s add_all (client.py:10), 3 call(s), 2.500s cumulative",
+    ]
+
+
+def test_print_metrics_memory():
+    printer = Printer()
+    memory = MagicMock()
+    memory.to_dict.return_value = {
+        "NL": {
+            "phases": {
+                "fetch": {
+                    "peak": 3 * 1024 * 1024,
+                    "growth": 2 * 1024 * 1024,
+                    "rss": 10 * 1024 * 1024,
+                    "sites": {"sort_self_references": 1024 * 1024},
+                    "top": [{"location": "client.py:10", "size": 1024**2, "count": 5}],
+                }
+            },
+            "tables": {"staging": {"persons": 1024 * 1024}},
+        }
+    }
+    metrics = Metrics(memory=memory)
+
+    with printer.buffer() as lines:
+        printer.print_metrics(metrics)
+
+    assert lines == [
+        "",
+        "⏱️ Durations",
+        "",
+        "💾 Memory",
+        "    NL",
+        "        fetch: peak 3.0 MB (+2.0 MB), RSS 10.0 MB",
+        "            sort_self_references: peak +1.0 MB",
+        "            client.py:10: +1.0 MB in 5 block(s)",
+        "        staging tables: persons 1.0 MB",
+    ]
+
+
+def test_lines_are_structured():
+    printer = Printer()
+
+    with printer.buffer() as lines:
+        with node_scope("NL"):
+            printer.print("line1", indent=1)
+            printer.print_warning(EricWarning("warning"))
+        printer.print_error(EricError("error"))
+
+    assert lines == ["    line1", "⚠️ warning", "❌ error"]
+    assert [(line.text, line.indent) for line in lines][0] == ("line1", 1)
+    assert [line.level for line in lines] == [Level.INFO, Level.WARNING, Level.ERROR]
+    assert [line.node for line in lines] == ["NL", "NL", None]
+
+
+def test_print_buffered_line():
+    printer = Printer()
+    with printer.buffer() as lines:
+        with node_scope("NL"):
+            printer.print_warning(EricWarning("warning"), indent=1)
+
+    with printer.buffer() as reprinted:
+        with printer.indentation():
+            printer.print(lines[0])
+
+    assert reprinted == ["        ⚠️ warning"]
+    assert reprinted[0].level == Level.WARNING
+    assert reprinted[0].node == "NL"
+    assert reprinted[0].time == lines[0].time
+
+
+def test_json_lines_output():
+    stream = io.StringIO()
+    printer = Printer(JsonLinesOutput(stream))
+
+    printer.print_node_title(Node("NL", "Netherlands"))
+    with node_scope("NL"), printer.indentation():
+        printer.print_warning(EricWarning("warning"))
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [line["message"] for line in lines] == [
+        "========================",
+        "🌍 Node NL (Netherlands)",
+        "========================",
+        "⚠️ warning",
+    ]
+    assert lines[-1]["node"] == "NL"
+    assert lines[-1]["level"] == "warning"
+    assert lines[-1]["indent"] == 1
+    assert isinstance(lines[-1]["time"], float)
+
+
+def test_quiet_output(capsys):
+    output = QuietOutput()
+    printer = Printer(output)
+
+    with node_scope("NL"):
+        printer.print("line")
+        for _ in range(3):
+            printer.print_warning(EricWarning("warning"))
+    printer.print_error(EricError("error"))
+
+    assert capsys.readouterr().out == ""
+    assert output.to_dict() == {"NL": {"info": 1, "warning": 3}, None: {"error": 1}}
+
+
+def test_text_output_stream():
+    stream = io.StringIO()
+    printer = Printer(TextOutput(stream))
+
+    printer.print("line1")
+    printer.write_lines(["line2", "    line3"])
+
+    assert stream.getvalue() == "line1\nline2\n    line3\n"
+
+
+def test_concurrent_buffers_are_written_whole():
+    stream = io.StringIO()
+    printer = Printer(TextOutput(stream))
+
+    def print_node(code: str):
+        with printer.buffer() as lines, node_scope(code):
+            for i in range(100):
+                printer.print(f"{code} {i}")
+        printer.write_lines(lines)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(print_node, ["A", "B", "C", "D"]))
+
+    written = stream.getvalue().splitlines()
+    assert len(written) == 400
+    for start in range(0, 400, 100):
+        code = written[start].split()[0]
+        assert written[start : start + 100] == [f"{code} {i}" for i in range(100)]
+
+
+def test_output_is_abstract():
+    with pytest.raises(TypeError):
+        Output()
+
+
+def test_batch():
+    output = MagicMock()
+    printer = Printer(output)
+
+    with printer.batch():
+        printer.print("line1")
+        printer.print_warning(EricWarning("warning"))
+        output.write.assert_not_called()
+
+    output.write.assert_called_once_with(["line1", "⚠️ warning"])
+
+
+def test_batch_writes_when_failing():
+    output = MagicMock()
+    printer = Printer(output)
+
+    with pytest.raises(EricError):
+        with printer.batch():
+            printer.print("line1")
+            raise EricError("error")
+
+    output.write.assert_called_once_with(["line1"])
+
+
+def test_batch_in_buffer():
+    output = MagicMock()
+    printer = Printer(output)
+
+    with printer.buffer() as lines:
+        with printer.batch():
+            printer.print("line1")
+        printer.print("line2")
+
+    output.write.assert_not_called()
+    assert lines == ["line1", "line2"]
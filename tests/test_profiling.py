@@ -0,0 +1,102 @@
+import pstats
+from unittest.mock import MagicMock, patch
+
+from molgenis.bbmri_eric.instrumentation import node_scope
+from molgenis.bbmri_eric.model import Node
+from molgenis.bbmri_eric.profiling import NoOpProfiler, Profiler
+
+
+def _work():
+    return sum(range(1000))
+
+
+def _slow_work():
+    # a loop in pure Python, so its own time dominates any other function
+    total = 0
+    for i in range(200000):
+        total += i
+    return total
+
+
+def test_phase(tmp_path):
+    profiler = Profiler(str(tmp_path))
+
+    with node_scope("NL"):
+        with profiler.phase("validate"):
+            _work()
+    with node_scope("BE"):
+        with profiler.phase("validate"):
+            _work()
+            _work()
+
+    stats = profiler.get_stats()
+    assert list(stats) == ["validate"]
+    calls = [values[1] for (_, _, name), values in stats["validate"].stats.items()]
+    assert 3 in calls
+
+
+def test_phase_nested(tmp_path):
+    profiler = Profiler(str(tmp_path))
+
+    with node_scope("NL"), profiler.phase("upsert"):
+        with profiler.phase("pids"):
+            _work()
+
+    assert list(profiler.get_stats()) == ["upsert"]
+
+
+def test_get_hot_functions(tmp_path):
+    profiler = Profiler(str(tmp_path), top=2)
+
+    with node_scope("NL"), profiler.phase("enrich"):
+        _slow_work()
+
+    hot_functions = profiler.get_hot_functions()["enrich"]
+    assert len(hot_functions) == 2
+    assert hot_functions[0].own_time >= hot_functions[1].own_time
+    assert hot_functions[0].function == "_slow_work"
+
+
+def test_save(tmp_path):
+    profiler = Profiler(str(tmp_path))
+    with node_scope("NL"), profiler.phase("fetch"):
+        _work()
+    with profiler.phase("upsert"):
+        _work()
+
+    profiler.save()
+
+    assert (tmp_path / "fetch.pstats").exists()
+    assert (tmp_path / "upsert.pstats").exists()
+    assert (tmp_path / "NL" / "fetch.pstats").exists()
+    assert (tmp_path / "-" / "upsert.pstats").exists()
+    assert pstats.Stats(str(tmp_path / "NL" / "fetch.pstats")).total_calls > 0
+
+
+def test_no_op_profiler(tmp_path):
+    profiler = NoOpProfiler()
+
+    with profiler.phase("fetch"):
+        _work()
+    profiler.save()
+
+    assert not profiler.enabled
+    assert profiler.get_stats() == {}
+
+
+def test_publish_nodes_with_profiler(eric, session, tmp_path):
+    nl = Node("NL", "NL")
+    session.get_staging_node_data.return_value = MagicMock(import_order=[])
+    eric.profiler = Profiler(str(tmp_path))
+
+    with patch("molgenis.bbmri_eric.eric.Validator") as validator_init, patch(
+        "molgenis.bbmri_eric.eric.Publisher"
+    ) as publisher_init:
+        validator_init.return_value.validate.return_value = []
+        publisher_init.return_value.publish.return_value = []
+        eric.publish_nodes([nl])
+
+    assert publisher_init.return_value.profiler is eric.profiler
+    assert set(eric.profiler.get_stats()) == {"fetch", "validate"}
+    assert (tmp_path / "NL" / "validate.pstats").exists()
+    eric.printer.print_hot_functions.assert_called_once_with(eric.profiler)
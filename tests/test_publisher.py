@@ -1,9 +1,30 @@
 from unittest import mock
 from unittest.mock import MagicMock, patch
 
+import pkg_resources
 import pytest
 
-from molgenis.bbmri_eric.model import NodeData, QualityInfo, TableType
+from molgenis.bbmri_eric.context import PublishContext
+from molgenis.bbmri_eric.deleter import DeletionError, RowDeleter
+from molgenis.bbmri_eric.errors import EricError, EricWarning
+from molgenis.bbmri_eric.journal import CheckpointJournal, hash_batch
+from molgenis.bbmri_eric.model import (
+    Node,
+    NodeData,
+    QualityInfo,
+    Source,
+    Table,
+    TableType,
+)
+from molgenis.bbmri_eric.pid_manager import PidManager
+from molgenis.bbmri_eric.pid_service import (
+    DummyPidService,
+    RecordingPidService,
+    Status,
+)
+from molgenis.bbmri_eric.plan import PidPlan, PublishPlan, TablePlan
+from molgenis.bbmri_eric.publisher import Publisher
+from molgenis.client import MolgenisRequestError
 
 
 @pytest.fixture
@@ -56,20 +77,45 @@ def test_publish(
     )
 
     assert session.upsert_batched.mock_calls == [
-        mock.call(node_data.persons.type.base_id, node_data.persons.rows),
-        mock.call(node_data.networks.type.base_id, node_data.networks.rows),
-        mock.call(node_data.biobanks.type.base_id, node_data.biobanks.rows),
-        mock.call(node_data.collections.type.base_id, node_data.collections.rows),
+        mock.call(
+            node_data.persons.type.base_id, node_data.persons.rows, checkpoint=None
+        ),
+        mock.call(
+            node_data.networks.type.base_id, node_data.networks.rows, checkpoint=None
+        ),
+        mock.call(
+            node_data.biobanks.type.base_id, node_data.biobanks.rows, checkpoint=None
+        ),
+        mock.call(
+            node_data.collections.type.base_id,
+            node_data.collections.rows,
+            checkpoint=None,
+        ),
     ]
 
     assert publisher._delete_rows.mock_calls == [
-        mock.call(node_data.collections, collections),
-        mock.call(node_data.biobanks, biobanks),
-        mock.call(node_data.networks, networks),
-        mock.call(node_data.persons, persons),
+        mock.call(node_data.collections, collections, None),
+        mock.call(node_data.biobanks, biobanks, None),
+        mock.call(node_data.networks, networks, None),
+        mock.call(node_data.persons, persons, None),
     ]
 
 
+def test_publish_release(
+    publisher, transformer_init, pid_manager_factory, node_data: NodeData, session
+):
+    publisher._delete_rows = MagicMock()
+    existing_node_data = NodeData.load(
+        pkg_resources.resource_filename("tests.resources", "node_data.snapshot")
+    )
+
+    publisher.publish(node_data, existing_node_data, release=True)
+
+    assert len(session.upsert_batched.mock_calls) == 4
+    for table in node_data.import_order + existing_node_data.import_order:
+        assert not table.rows_by_id
+
+
 def test_delete_rows(publisher, pid_service, node_data: NodeData, session):
     publisher.quality_info = QualityInfo(
         biobanks={"undeletable_id": ["quality"]}, collections={}
@@ -96,3 +142,284 @@ def test_delete_rows(publisher, pid_service, node_data: NodeData, session):
         "Prevented the deletion of a row that is referenced from "
         "the quality info: biobanks undeletable_id."
     ]
+
+
+def test_plan(publisher, transformer_init, node_data: NodeData, session):
+    publisher.pid_service = RecordingPidService(DummyPidService())
+    publisher.pid_service.reverse_lookup = MagicMock(return_value=None)
+    publisher.pid_manager = PidManager(publisher.pid_service, publisher.printer)
+    publisher.quality_info = QualityInfo(biobanks={}, collections={})
+    existing_node_data = MagicMock()
+    existing_biobanks = Table.of(
+        TableType.BIOBANKS,
+        MagicMock(),
+        [{"id": "deleted_biobank", "name": "deleted", "pid": "pid1"}],
+    )
+    existing_node_data.table_by_type = {
+        table.type: Table.of(table.type, MagicMock(), [])
+        for table in node_data.import_order
+    }
+    existing_node_data.table_by_type[TableType.BIOBANKS] = existing_biobanks
+    existing_node_data.biobanks = existing_biobanks
+    for biobank in node_data.biobanks.rows:
+        biobank.pop("pid", None)
+    meta = MagicMock()
+    meta.self_references = []
+    session.split_upsert.side_effect = lambda id_, rows: (meta, list(rows), [])
+
+    plan = publisher.plan(node_data, existing_node_data)
+
+    session.upsert_batched.assert_not_called()
+    session.add_batched.assert_not_called()
+    session.delete_list.assert_not_called()
+    assert [table.type for table in plan.tables] == [
+        table.type for table in node_data.import_order
+    ]
+    biobanks = plan.get_table(TableType.BIOBANKS)
+    assert len(biobanks.add) == len(node_data.biobanks.rows)
+    assert biobanks.add[0]["pid"] == "PLANNED:1"
+    assert biobanks.delete == ["deleted_biobank"]
+    assert len(plan.pids.register) == len(node_data.biobanks.rows)
+    assert plan.pids.terminate == ["pid1"]
+
+
+def test_apply(publisher, pid_service, session):
+    pid_service.register_pid.return_value = "real-pid"
+    plan = PublishPlan(
+        node=Node("NO", "Norway"),
+        tables=[
+            TablePlan(type=TableType.PERSONS, add=[{"id": "p1"}], delete=["p2"]),
+            TablePlan(
+                type=TableType.BIOBANKS,
+                add=[{"id": "b1", "pid": "PLANNED:1"}],
+                update=[{"id": "b2", "pid": "pid2"}],
+                delete=["b3"],
+            ),
+        ],
+        pids=PidPlan(
+            register=[{"pid": "PLANNED:1", "url": "url/#/biobank/b1", "name": "b1"}],
+            rename={"pid2": "new name"},
+            terminate=["pid3"],
+        ),
+        warnings=[EricWarning("warning")],
+    )
+
+    warnings = publisher.apply(plan)
+
+    assert warnings == [EricWarning("warning")]
+    pid_service.register_pid.assert_called_once_with(url="url/#/biobank/b1", name="b1")
+    pid_service.set_name.assert_called_once_with("pid2", "new name")
+    pid_service.set_status.assert_called_once_with("pid3", Status.TERMINATED)
+    assert session.add_batched.mock_calls == [
+        mock.call("eu_bbmri_eric_persons", [], [{"id": "p1"}]),
+        mock.call("eu_bbmri_eric_biobanks", [], [{"id": "b1", "pid": "real-pid"}]),
+    ]
+    assert session.update_batched.mock_calls == [
+        mock.call("eu_bbmri_eric_persons", [], []),
+        mock.call("eu_bbmri_eric_biobanks", [], [{"id": "b2", "pid": "pid2"}]),
+    ]
+    assert session.delete_list.mock_calls == [
+        mock.call("eu_bbmri_eric_biobanks", ["b3"]),
+        mock.call("eu_bbmri_eric_persons", ["p2"]),
+    ]
+
+
+def test_delete_rows_with_checkpoint(publisher, node_data: NodeData, session):
+    publisher.quality_info = QualityInfo(biobanks={}, collections={})
+    existing_biobanks = Table.of(
+        TableType.BIOBANKS, MagicMock(), [{"id": "delete_this_row", "pid": "pid1"}]
+    )
+    checkpoint = MagicMock()
+    checkpoint.is_done.side_effect = [False, True]
+
+    publisher._delete_rows(node_data.biobanks, existing_biobanks, checkpoint)
+    publisher._delete_rows(node_data.biobanks, existing_biobanks, checkpoint)
+
+    session.delete_list.assert_called_once_with(
+        "eu_bbmri_eric_biobanks", ["delete_this_row"]
+    )
+    checkpoint.record.assert_called_once_with("delete", ["delete_this_row"])
+
+
+def test_init_is_lazy(session, printer, pid_service):
+    Publisher(session, printer, pid_service)
+
+    session.get_quality_info.assert_not_called()
+    session.get_staging_node_data.assert_not_called()
+
+
+def test_shared_context(session, printer, pid_service):
+    context = PublishContext(session)
+    first = Publisher(session, printer, pid_service, context=context)
+    second = Publisher(session, printer, pid_service, context=context)
+
+    assert first.quality_info is second.quality_info
+    session.get_quality_info.assert_called_once()
+
+
+def test_retrieve_quality_info(publisher, node_data: NodeData, session):
+    existing_node_data = MagicMock()
+    existing_node_data.biobanks.rows_by_id = {"published_biobank": {}}
+    existing_node_data.collections.rows_by_id = {}
+
+    publisher._retrieve_quality_info(node_data, existing_node_data)
+
+    session.get_quality_info.assert_called_once_with(
+        biobank_ids=set(node_data.biobanks.rows_by_id) | {"published_biobank"},
+        collection_ids=set(node_data.collections.rows_by_id),
+    )
+
+
+def test_delete_rows_terminates_pids(publisher, node_data: NodeData, session):
+    publisher.quality_info = QualityInfo(biobanks={}, collections={})
+    publisher.pid_manager = MagicMock()
+    existing_biobanks = Table.of(
+        TableType.BIOBANKS, MagicMock(), [{"id": "delete_this_row", "pid": "pid1"}]
+    )
+
+    publisher._delete_rows(node_data.biobanks, existing_biobanks)
+
+    publisher.pid_manager.terminate_biobanks.assert_called_once_with(["pid1"])
+    session.delete_list.assert_called_once_with(
+        "eu_bbmri_eric_biobanks", ["delete_this_row"]
+    )
+
+
+@patch("molgenis.bbmri_eric.publisher.ThreadPoolExecutor")
+def test_delete_rows_without_pids(executor_init, publisher, node_data, session):
+    publisher.quality_info = QualityInfo(biobanks={}, collections={})
+    existing_persons = Table.of(
+        TableType.PERSONS, MagicMock(), [{"id": "delete_this_row"}]
+    )
+
+    publisher._delete_rows(node_data.persons, existing_persons)
+
+    executor_init.assert_not_called()
+    session.delete_list.assert_called_once_with(
+        "eu_bbmri_eric_persons", ["delete_this_row"]
+    )
+
+
+def test_delete_rows_terminates_only_deleted_pids(publisher, node_data, session):
+    publisher.quality_info = QualityInfo(biobanks={}, collections={})
+    publisher.pid_manager = MagicMock()
+    publisher.pid_manager.terminate_biobanks.side_effect = EricError("handle error")
+    publisher.deleter = RowDeleter(session, batch_size=1, workers=1)
+    existing_biobanks = Table.of(
+        TableType.BIOBANKS,
+        MagicMock(),
+        [{"id": "b1", "pid": "pid1"}, {"id": "b2", "pid": "pid2"}],
+    )
+    error = MolgenisRequestError("error")
+    session.delete_list.side_effect = [None, error]
+
+    with pytest.raises(DeletionError) as deletion_error:
+        publisher._delete_rows(node_data.biobanks, existing_biobanks)
+
+    assert deletion_error.value.deleted_ids == ["b1"]
+    assert deletion_error.value.failed_ids == ["b2"]
+    publisher.pid_manager.terminate_biobanks.assert_called_once_with(["pid1"])
+    publisher.printer.print.assert_any_call("Deleted 1 row(s): b1")
+    publisher.printer.print.assert_any_call("Not deleted 1 row(s): b2")
+
+
+def test_delete_rows_nothing_to_delete(publisher, node_data: NodeData, session):
+    publisher.quality_info = QualityInfo(biobanks={}, collections={})
+    publisher.pid_manager = MagicMock()
+    existing_biobanks = Table.of(TableType.BIOBANKS, MagicMock(), [])
+
+    publisher._delete_rows(node_data.biobanks, existing_biobanks)
+
+    publisher.pid_manager.terminate_biobanks.assert_not_called()
+    session.delete_list.assert_not_called()
+
+
+def _node_data(node: Node, rows_by_type: dict) -> NodeData:
+    tables = {
+        table_type: Table.of(table_type, MagicMock(), rows_by_type.get(table_type, []))
+        for table_type in TableType.get_import_order()
+    }
+    return NodeData.from_dict(node, Source.STAGING, tables)
+
+
+def test_publish_combined(publisher, session):
+    publisher.quality_info = QualityInfo(biobanks={}, collections={})
+    a = Node("A", "succeeds")
+    b = Node("B", "fails upserting networks")
+    eu_person = {"id": "bbmri-eric:contactID:EU_1"}
+    a_data = _node_data(
+        a,
+        {
+            TableType.PERSONS: [{"id": "a1"}, eu_person],
+            TableType.NETWORKS: [{"id": "a2"}],
+            TableType.BIOBANKS: [{"id": "a3"}],
+        },
+    )
+    b_data = _node_data(
+        b, {TableType.PERSONS: [{"id": "b1"}, eu_person], TableType.NETWORKS: []}
+    )
+    a_published = _node_data(a, {TableType.PERSONS: [{"id": "a_deleted"}]})
+    b_published = _node_data(b, {TableType.PERSONS: [{"id": "b_deleted"}]})
+    error = MolgenisRequestError("error")
+    session.upsert_batched.side_effect = [None, error, None, error, None, None]
+
+    report = publisher.publish_combined([(a_data, a_published), (b_data, b_published)])
+
+    assert session.upsert_batched.mock_calls == [
+        mock.call("eu_bbmri_eric_persons", [{"id": "a1"}, eu_person, {"id": "b1"}]),
+        mock.call("eu_bbmri_eric_networks", [{"id": "a2"}]),
+        mock.call("eu_bbmri_eric_networks", a_data.networks.rows),
+        mock.call("eu_bbmri_eric_networks", b_data.networks.rows),
+        mock.call("eu_bbmri_eric_biobanks", [{"id": "a3"}]),
+        mock.call("eu_bbmri_eric_collections", []),
+    ]
+    session.delete_list.assert_called_once_with("eu_bbmri_eric_persons", ["a_deleted"])
+    assert a not in report.errors
+    assert report.errors[b].__cause__ == error
+
+
+def test_publish_combined_with_journal(session, printer, pid_service, tmp_path):
+    journal = CheckpointJournal(str(tmp_path / "journal"))
+    a = Node("A", "A")
+    b = Node("B", "B")
+    a_data = _node_data(
+        a,
+        {TableType.PERSONS: [{"id": "a1"}], TableType.NETWORKS: [{"id": "a2"}]},
+    )
+    b_data = _node_data(b, {TableType.PERSONS: [{"id": "b1"}]})
+    prepared = [(a_data, _node_data(a, {})), (b_data, _node_data(b, {}))]
+    session.get_quality_info.return_value = QualityInfo(biobanks={}, collections={})
+    session.upsert_batched.side_effect = [None, KeyboardInterrupt()]
+
+    with pytest.raises(KeyboardInterrupt):
+        Publisher(session, printer, pid_service, journal=journal).publish_combined(
+            prepared
+        )
+    session.upsert_batched.reset_mock(side_effect=True)
+    Publisher(session, printer, pid_service, journal=journal).publish_combined(prepared)
+
+    assert session.upsert_batched.mock_calls == [
+        mock.call("eu_bbmri_eric_networks", [{"id": "a2"}]),
+        mock.call("eu_bbmri_eric_biobanks", []),
+        mock.call("eu_bbmri_eric_collections", []),
+    ]
+
+
+def test_publish_combined_journals_only_written_nodes(
+    session, printer, pid_service, tmp_path
+):
+    journal = CheckpointJournal(str(tmp_path / "journal"))
+    a_data = _node_data(Node("A", "A"), {TableType.PERSONS: [{"id": "a1"}]})
+    b_data = _node_data(Node("B", "B"), {TableType.PERSONS: [{"id": "b1"}]})
+    error = MolgenisRequestError("error")
+    session.upsert_batched.side_effect = [error, None, error]
+
+    publisher = Publisher(session, printer, pid_service, journal=journal)
+    publisher._upsert_combined(TableType.PERSONS, [a_data, b_data], MagicMock())
+
+    assert journal.is_done(
+        "A", "eu_bbmri_eric_persons", "upsert", hash_batch(a_data.persons.rows)
+    )
+    assert not journal.is_done(
+        "B", "eu_bbmri_eric_persons", "upsert", hash_batch(b_data.persons.rows)
+    )
@@ -0,0 +1,55 @@
+from unittest.mock import MagicMock
+
+from molgenis.bbmri_eric.model import Node, NodeData
+from molgenis.bbmri_eric.scheduler import NodeScheduler
+from molgenis.client import MolgenisRequestError
+
+
+def test_order_largest_first(session):
+    nodes = [Node("A", "A"), Node("B", "B"), Node("C", "C"), Node("D", "D")]
+    sizes = {"A": 10, "B": 30, "C": 10, "D": 20}
+    session.get_staging_row_count.side_effect = lambda node: sizes[node.code]
+
+    ordered = NodeScheduler(session).order(nodes)
+
+    assert [node.code for node in ordered] == ["B", "D", "A", "C"]
+
+
+def test_order_uses_previous_sizes(session):
+    nodes = [Node("A", "A"), Node("B", "B")]
+    session.get_staging_row_count.return_value = 5
+
+    ordered = NodeScheduler(session, sizes={"A": 1}).order(nodes)
+
+    assert ordered == [nodes[1], nodes[0]]
+    session.get_staging_row_count.assert_called_once_with(nodes[1])
+
+
+def test_estimate_count_fails(session):
+    node = Node("A", "A")
+    session.get_staging_row_count.side_effect = MolgenisRequestError("error")
+    scheduler = NodeScheduler(session)
+
+    assert scheduler.estimate(node) == 0
+    assert "A" not in scheduler.sizes
+
+
+def test_record(session, node_data: NodeData):
+    scheduler = NodeScheduler(session)
+
+    scheduler.record(node_data)
+
+    assert scheduler.sizes == {
+        node_data.node.code: sum(
+            len(table.rows_by_id) for table in node_data.import_order
+        )
+    }
+
+
+def test_save_load(session, tmp_path):
+    path = str(tmp_path / "sizes.json")
+    NodeScheduler(session, sizes={"A": 1, "B": 2}).save(path)
+
+    scheduler = NodeScheduler.load(MagicMock(), path)
+
+    assert scheduler.sizes == {"A": 1, "B": 2}
@@ -0,0 +1,94 @@
+import struct
+
+import pytest
+
+from molgenis.bbmri_eric.model import (
+    ExternalServerNode,
+    NodeData,
+    Source,
+    Table,
+    TableMeta,
+    TableType,
+)
+from molgenis.bbmri_eric.snapshot import SnapshotReader, load_snapshot, save_snapshot
+
+
+def test_save_and_load(node_data: NodeData, tmp_path):
+    path = str(tmp_path / "NO.snapshot")
+
+    node_data.save(path)
+    loaded = NodeData.load(path)
+
+    assert loaded.node == node_data.node
+    assert loaded.source == node_data.source
+    for table, loaded_table in zip(node_data.import_order, loaded.import_order):
+        assert loaded_table.type == table.type
+        assert loaded_table.meta == table.meta
+        assert list(loaded_table.rows_by_id) == list(table.rows_by_id)
+        assert loaded_table.rows == table.rows
+    assert loaded.table_by_type[TableType.BIOBANKS] is loaded.biobanks
+
+
+def test_read_single_table(node_data: NodeData, tmp_path):
+    path = str(tmp_path / "NO.snapshot")
+    save_snapshot(node_data, path)
+
+    with SnapshotReader(path) as reader:
+        assert reader.table_types == TableType.get_import_order()
+        assert reader.row_count(TableType.BIOBANKS) == len(node_data.biobanks.rows)
+        biobanks = reader.read_table(TableType.BIOBANKS)
+
+    assert biobanks.rows == node_data.biobanks.rows
+
+
+def test_sparse_columns(tmp_path):
+    path = str(tmp_path / "NL.snapshot")
+    meta = TableMeta({"data": {"id": "eu_bbmri_eric_persons"}})
+    tables = {
+        type_: Table.of(type_, meta, [])
+        for type_ in TableType.get_import_order()
+        if type_ != TableType.PERSONS
+    }
+    tables[TableType.PERSONS] = Table.of(
+        TableType.PERSONS,
+        meta,
+        [
+            {"id": "p1", "email": "p1@nl", "country": "NL"},
+            {"id": "p2", "country": None},
+            {"id": "p3", "email": "p3@nl", "roles": ["a", "b"]},
+        ],
+    )
+    node = ExternalServerNode("NL", "Netherlands", "url.nl")
+    node_data = NodeData.from_dict(node, Source.EXTERNAL_SERVER, tables)
+
+    save_snapshot(node_data, path)
+    loaded = load_snapshot(path)
+
+    assert loaded.node == node
+    assert loaded.source == Source.EXTERNAL_SERVER
+    assert loaded.persons.rows == [
+        {"id": "p1", "email": "p1@nl", "country": "NL"},
+        {"id": "p2", "country": None},
+        {"id": "p3", "email": "p3@nl", "roles": ["a", "b"]},
+    ]
+    assert loaded.collections.rows == []
+
+
+def test_not_a_snapshot(tmp_path):
+    path = tmp_path / "data.pkl"
+    path.write_bytes(b"definitely not a snapshot file")
+
+    with pytest.raises(ValueError) as exception_info:
+        SnapshotReader(str(path))
+
+    assert "is not a snapshot file" in str(exception_info.value)
+
+
+def test_newer_version(tmp_path):
+    path = tmp_path / "future.snapshot"
+    path.write_bytes(struct.pack(">8sHI", b"ERICSNAP", 99, 0))
+
+    with pytest.raises(ValueError) as exception_info:
+        SnapshotReader(str(path))
+
+    assert "has snapshot version 99" in str(exception_info.value)
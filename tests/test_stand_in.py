@@ -0,0 +1,260 @@
+import time
+
+import pytest
+
+from molgenis.bbmri_eric.bbmri_client import EricSession
+from molgenis.bbmri_eric.errors import EricError
+from molgenis.bbmri_eric.model import ExternalServerNode, Node, Source, TableMeta
+from molgenis.bbmri_eric.pid_service import Status
+from molgenis.bbmri_eric.stand_in import (
+    Failure,
+    StandInError,
+    StandInPidService,
+    StandInServer,
+    parse_rsql,
+)
+from molgenis.bbmri_eric.synthetic import Generator, Spec
+from molgenis.client import MolgenisRequestError
+
+NL = Node("NL", "Netherlands")
+
+
+def nodes_meta() -> TableMeta:
+    return TableMeta(
+        meta={
+            "data": {
+                "id": "eu_bbmri_eric_national_nodes",
+                "attributes": {
+                    "items": [
+                        {"data": {"name": "id", "type": "string", "idAttribute": True}},
+                        {"data": {"name": "description", "type": "string"}},
+                        {"data": {"name": "dns", "type": "hyperlink"}},
+                    ]
+                },
+            }
+        }
+    )
+
+
+@pytest.fixture
+def server():
+    with StandInServer() as server:
+        server.add_table(
+            nodes_meta(),
+            [
+                {"id": "NL", "description": "Netherlands"},
+                {"id": "BE", "description": "Belgium"},
+                {"id": "DE", "description": "Germany", "dns": "https://de.org"},
+            ],
+        )
+        yield server
+
+
+@pytest.fixture
+def session(server) -> EricSession:
+    return EricSession(url=server.url)
+
+
+@pytest.fixture
+def node_data():
+    return Generator(Spec.of_rows(300)).node_data(NL)
+
+
+def test_get_nodes(session):
+    assert session.get_node("NL") == NL
+    assert session.get_nodes(["NL", "BE"]) == [Node("BE", "Belgium"), NL]
+    assert session.get_external_nodes() == [
+        ExternalServerNode("DE", "Germany", url="https://de.org")
+    ]
+    with pytest.raises(KeyError):
+        session.get_node("XX")
+
+
+def test_get_staging_node_data(server, session, node_data):
+    server.add_node_data(node_data)
+
+    retrieved = session.get_staging_node_data(NL)
+
+    assert retrieved.source == Source.STAGING
+    for expected, actual in zip(node_data.import_order, retrieved.import_order):
+        assert dict(actual.rows_by_id) == dict(expected.rows_by_id)
+
+
+def test_pagination(server, session, node_data):
+    server.page_size = 7
+    server.add_node_data(node_data)
+    persons = node_data.persons
+
+    rows = list(session.iter_uploadable_data(persons.meta, batch_size=100))
+
+    assert [row["id"] for row in rows] == sorted(persons.rows_by_id)
+    assert session.count(persons.full_name) == len(persons.rows)
+
+
+def test_upsert_and_delete(server, session, node_data):
+    collections = node_data.collections
+    server.add_node_data(node_data)
+    server.add_table(collections.meta)
+    rows = [dict(row, size=1) for row in collections.rows]
+
+    session.upsert_batched(collections.full_name, rows[:100])
+    session.upsert_batched(collections.full_name, rows)
+    session.delete_list(collections.full_name, [rows[0]["id"], "unknown"])
+
+    stored = server.rows(collections.full_name)
+    assert len(stored) == len(rows) - 1
+    assert all(row["size"] == 1 for row in stored)
+
+    session.delete(collections.full_name)
+    assert server.rows(collections.full_name) == []
+
+
+def test_add_refuses_invalid_batches(server, session, node_data):
+    collections = node_data.collections
+    server.add_node_data(node_data)
+    server.add_table(collections.meta)
+    server.max_batch_size = 10
+    rows = collections.rows
+    child = next(row for row in rows if row.get("parent_collection"))
+    parent = collections.rows_by_id[child["parent_collection"]]
+    strip = set(collections.meta.one_to_manys)
+
+    def add(*entities):
+        entities = [
+            {k: v for k, v in entity.items() if k not in strip} for entity in entities
+        ]
+        session.add_all(collections.full_name, entities)
+
+    with pytest.raises(MolgenisRequestError, match="more than 10"):
+        add(*rows[:11])
+    with pytest.raises(MolgenisRequestError, match="Unknown attribute"):
+        add(dict(parent, colour="red"))
+    with pytest.raises(MolgenisRequestError, match="can't be null"):
+        add(dict(parent, name=None))
+    with pytest.raises(MolgenisRequestError, match="Unknown xref value"):
+        add(child)
+    assert server.rows(collections.full_name) == []
+
+    add(child, parent)
+    with pytest.raises(MolgenisRequestError, match="Duplicate value"):
+        add(parent)
+    assert len(server.rows(collections.full_name)) == 2
+
+
+def test_queries_see_changes(server, session):
+    nodes = "eu_bbmri_eric_national_nodes"
+
+    def query(q, sort_column=None):
+        rows = session.get(nodes, q=q, sort_column=sort_column)
+        return [row["id"] for row in rows]
+
+    assert query("description=in=(Belgium,Germany)") == ["BE", "DE"]
+    assert query("id!=NL", sort_column="description") == ["BE", "DE"]
+
+    session.update(nodes, [{"id": "BE", "description": "Germany"}])
+    session.delete_list(nodes, ["DE"])
+    session.add_all(nodes, [{"id": "AT", "description": "Austria"}])
+
+    assert query("description=in=(Belgium,Germany)") == ["BE"]
+    assert query("description==Austria,id==NL") == ["AT", "NL"]
+    assert query("id!=NL", sort_column="description") == ["AT", "BE"]
+
+
+def test_login(node_data):
+    with StandInServer(credentials=("admin", "secret")) as server:
+        server.add_node_data(node_data)
+        session = EricSession(url=server.url)
+
+        with pytest.raises(MolgenisRequestError, match="401"):
+            session.get_meta(node_data.persons.full_name)
+        with pytest.raises(MolgenisRequestError, match="Login failed"):
+            session.login("admin", "wrong")
+
+        session.login("admin", "secret")
+        assert session.get_meta(node_data.persons.full_name).id_attribute == "id"
+
+
+def test_latency(server, session):
+    server.latency = 0.05
+
+    started = time.perf_counter()
+    session.count("eu_bbmri_eric_national_nodes")
+
+    assert time.perf_counter() - started >= 0.05
+
+
+def test_failures(server, session):
+    server.fail(Failure(method="GET", path="national_nodes", status=503, times=2))
+
+    for _ in range(2):
+        with pytest.raises(MolgenisRequestError, match="503"):
+            session.get_node("NL")
+    assert session.get_node("NL") == NL
+    assert server.failures == []
+    assert server.request_count == 4
+    assert server.request_bytes == 0
+    assert server.response_bytes > 0
+
+
+def test_probable_failures(server, session):
+    server.fail(Failure(times=None, probability=0.5))
+
+    failures = 0
+    for _ in range(40):
+        try:
+            session.count("eu_bbmri_eric_national_nodes")
+        except MolgenisRequestError:
+            failures += 1
+
+    assert 0 < failures < 40
+
+
+def test_pid_service():
+    pid_service = StandInPidService()
+    pid_service.add_handle("21.12110/1", "https://directory.example.org/#/a", "A")
+
+    pid = pid_service.register_pid("https://directory.example.org/#/b", "B")
+    pid_service.set_name(pid, "Bee")
+    pid_service.set_status("21.12110/1", Status.TERMINATED)
+
+    assert pid.startswith("21.12110/1.")
+    assert pid_service.reverse_lookup("https://directory.example.org/#/b") == [pid]
+    assert pid_service.reverse_lookup("https://directory.example.org/#/c") == []
+    assert pid_service.handles[pid]["NAME"] == "Bee"
+    assert pid_service.handles["21.12110/1"]["STATUS"] == "TERMINATED"
+    assert pid_service.operation_count == 5
+    with pytest.raises(EricError):
+        pid_service.set_name("21.12110/unknown", "C")
+
+
+@pytest.mark.parametrize(
+    "query,expected",
+    [
+        ("id==NL", ["NL"]),
+        ("id!=NL", ["BE", "DE"]),
+        ("id=in=(NL,DE)", ["NL", "DE"]),
+        ("id=out=(NL,DE)", ["BE"]),
+        ("dns!=''", ["DE"]),
+        ('description=="Netherlands",id==BE', ["NL", "BE"]),
+        ("(id==NL,id==DE);dns==''", ["NL"]),
+        ("tags==b", ["BE"]),
+    ],
+)
+def test_parse_rsql(query, expected):
+    rows = [
+        {"id": "NL", "description": "Netherlands", "tags": ["a"]},
+        {"id": "BE", "description": "Belgium", "tags": ["a", "b"]},
+        {"id": "DE", "description": "Germany", "dns": "https://de.org", "tags": []},
+    ]
+
+    predicate = parse_rsql(query)
+
+    assert [row["id"] for row in rows if predicate(row)] == expected
+
+
+@pytest.mark.parametrize("query", ["id==", "id=in=(a", "(id==a", "id==a;", "id<a"])
+def test_parse_rsql_invalid(query):
+    with pytest.raises(StandInError) as info:
+        parse_rsql(query)
+
+    assert info.value.status == 400
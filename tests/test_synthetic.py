@@ -0,0 +1,179 @@
+from molgenis.bbmri_eric.model import ExternalServerNode, Node, Source, TableType
+from molgenis.bbmri_eric.printer import Printer
+from molgenis.bbmri_eric.synthetic import Generator, Spec, directory_tables
+from molgenis.bbmri_eric.transformer import Transformer
+from molgenis.bbmri_eric.validation import Validator
+
+NL = Node("NL", "Netherlands")
+EU = Node("EU", "Europe")
+
+
+def test_of_rows():
+    spec = Spec.of_rows(1000, seed=3)
+
+    assert spec.rows == 1000
+    assert spec.collections > spec.persons > spec.biobanks > spec.networks
+    assert spec.seed == 3
+
+
+def test_node_data():
+    spec = Spec(persons=10, networks=4, biobanks=5, collections=20)
+
+    node_data = Generator(spec).node_data(NL)
+
+    assert [len(table.rows_by_id) for table in node_data.import_order] == [
+        10,
+        4,
+        5,
+        20,
+    ]
+    assert node_data.source == Source.STAGING
+    assert node_data.collections.full_name == "eu_bbmri_eric_NL_collections"
+    assert node_data.collections.meta.self_references == ["parent_collection"]
+    assert node_data.persons.meta.one_to_manys == [
+        "biobanks",
+        "collections",
+        "networks",
+    ]
+
+
+def test_node_data_deterministic():
+    spec = Spec.of_rows(200)
+
+    first = Generator(spec).node_data(NL)
+    second = Generator(spec).node_data(NL)
+    other_seed = Generator(Spec.of_rows(200, seed=1)).node_data(NL)
+
+    assert first.collections.rows == second.collections.rows
+    assert first.collections.rows != other_seed.collections.rows
+
+
+def test_node_data_references():
+    node_data = Generator(Spec.of_rows(500)).node_data(NL)
+    ids = {table.type: set(table.rows_by_id) for table in node_data.import_order}
+
+    for collection in node_data.collections.rows:
+        assert collection["biobank"] in ids[TableType.BIOBANKS]
+        assert collection["contact"] in ids[TableType.PERSONS]
+        assert set(collection["network"]) <= ids[TableType.NETWORKS]
+    for biobank in node_data.biobanks.rows:
+        for collection_id in biobank["collections"]:
+            assert node_data.collections.rows_by_id[collection_id]["biobank"] == (
+                biobank["id"]
+            )
+
+
+def test_node_data_collection_depth():
+    spec = Spec(biobanks=2, collections=20, collection_depth=4)
+    collections = Generator(spec).node_data(NL).collections.rows_by_id
+
+    def depth(collection: dict) -> int:
+        parent = collection.get("parent_collection")
+        return 1 + depth(collections[parent]) if parent else 1
+
+    assert max(depth(collection) for collection in collections.values()) == 4
+    for collection in collections.values():
+        for sub_collection in collection["sub_collections"]:
+            assert collections[sub_collection]["parent_collection"] == collection["id"]
+
+
+def test_node_data_valid():
+    generator = Generator(Spec.of_rows(500))
+    node_data = generator.node_data(NL)
+    printer = Printer()
+
+    with printer.buffer():
+        warnings = Validator(node_data, printer).validate()
+        warnings += Transformer(
+            node_data,
+            generator.quality_info(node_data),
+            printer,
+            generator.node_data(NL, Source.PUBLISHED).biobanks,
+            generator.node_data(EU),
+        ).enrich()
+
+    assert warnings == []
+    assert any("quality" in biobank for biobank in node_data.biobanks.rows)
+    assert all("pid" in biobank for biobank in node_data.biobanks.rows)
+
+
+def test_node_data_eu_rows():
+    generator = Generator(Spec.of_rows(500))
+
+    persons = generator.node_data(NL).persons.rows_by_id
+    eu_persons = generator.node_data(EU).persons.rows_by_id
+
+    eu_ids = [id_ for id_ in persons if id_.startswith("bbmri-eric:contactID:EU_")]
+    assert len(eu_ids) == 10
+    assert set(eu_ids) <= set(eu_persons)
+
+
+def test_node_data_invalid_ids():
+    node_data = Generator(Spec.of_rows(1000, invalid_fraction=0.05)).node_data(NL)
+    printer = Printer()
+
+    with printer.buffer():
+        warnings = Validator(node_data, printer).validate()
+
+    messages = [warning.message for warning in warnings]
+    assert any("does not start with" in message for message in messages)
+    assert any("invalid characters" in message for message in messages)
+    assert any("references invalid id" in message for message in messages)
+
+
+def test_node_data_published():
+    node_data = Generator(Spec.of_rows(100)).node_data(NL, Source.PUBLISHED)
+
+    assert node_data.source == Source.PUBLISHED
+    assert node_data.biobanks.full_name == "eu_bbmri_eric_biobanks"
+    assert node_data.biobanks.meta.schema.ref_entity_types["contact"] == (
+        "eu_bbmri_eric_persons"
+    )
+    assert all(row["national_node"] == "NL" for row in node_data.persons.rows)
+    assert "combined_network" in node_data.collections.meta.schema.attribute_names
+    assert node_data.persons.meta.schema.ref_entity_types["national_node"] == (
+        "eu_bbmri_eric_national_nodes"
+    )
+
+
+def test_node_data_external_server():
+    node_data = Generator(Spec.of_rows(100)).node_data(NL, Source.EXTERNAL_SERVER)
+
+    assert node_data.source == Source.EXTERNAL_SERVER
+    assert node_data.collections.full_name == "eu_bbmri_eric_collections"
+    assert "national_node" not in node_data.collections.meta.schema.attribute_names
+    assert "national_node" not in node_data.collections.rows[0]
+
+
+def test_quality_info():
+    spec = Spec.of_rows(1000, quality_fraction=0.5)
+    generator = Generator(spec)
+    node_data = generator.node_data(NL)
+
+    quality_info = generator.quality_info(node_data)
+
+    assert 0 < len(quality_info.collections) < spec.collections
+    assert set(quality_info.biobanks) <= set(node_data.biobanks.rows_by_id)
+    assert quality_info == generator.quality_info(node_data)
+
+
+def test_directory_tables():
+    generator = Generator(Spec.of_rows(200, quality_fraction=0.5))
+    quality_info = generator.quality_info(generator.node_data(NL))
+    be = ExternalServerNode("BE", "Belgium", url="https://be.example.org")
+
+    nodes, biobank_qualities, collection_qualities = directory_tables(
+        [NL, be], quality_info
+    )
+
+    assert nodes[0].id == "eu_bbmri_eric_national_nodes"
+    assert nodes[1] == [
+        {"id": "NL", "description": "Netherlands"},
+        {"id": "BE", "description": "Belgium", "dns": "https://be.example.org"},
+    ]
+    meta, rows = collection_qualities
+    assert meta.schema.ref_entity_types["collection"] == "eu_bbmri_eric_collections"
+    assert {row["collection"] for row in rows} == set(quality_info.collections)
+    assert len(biobank_qualities[1]) == sum(
+        len(ids) for ids in quality_info.biobanks.values()
+    )
@@ -1,3 +1,6 @@
+import json
+from urllib.parse import quote_plus
+
 import numpy as np
 import pytest
 
@@ -74,6 +77,39 @@ def test_to_upload_format(rows):
     ]
 
 
+def test_iter_upload_format(rows, meta):
+    pages = [rows[:1], rows[1:]]
+
+    assert list(utils.iter_upload_format(pages, meta.schema)) == [
+        {
+            "id": "collA",
+            "parent_collection": "collB",
+            "sub_collections": [],
+        },
+        {"id": "collB", "sub_collections": ["collA"]},
+    ]
+
+
+def test_upload_format_object_hook(rows, meta):
+    response = json.dumps({"href": "/api/v2/test_collection", "items": rows})
+
+    decoded = json.loads(
+        response, object_hook=utils.upload_format_converter(meta.schema)
+    )
+
+    assert decoded == {
+        "href": "/api/v2/test_collection",
+        "items": [
+            {
+                "id": "collA",
+                "parent_collection": "collB",
+                "sub_collections": [],
+            },
+            {"id": "collB", "sub_collections": ["collA"]},
+        ],
+    }
+
+
 def test_remove_one_to_manys(meta):
     rows = [
         {
@@ -131,3 +167,49 @@ def test_isnan():
     assert utils.isnan(x2) is False
     assert utils.isnan(x3) is False
     assert utils.isnan(x4) is True
+
+
+def test_rsql_in_queries():
+    assert list(utils.rsql_in_queries("biobank", [])) == []
+    assert list(utils.rsql_in_queries("biobank", ["a:1", 'b"2'])) == [
+        'biobank=in=("a:1","b\\"2")'
+    ]
+
+
+def test_rsql_in_queries_chunked():
+    ids = [f"bbmri-eric:ID:NL_{i}" for i in range(100)]
+
+    queries = list(utils.rsql_in_queries("biobank", ids, max_length=500))
+
+    assert len(queries) > 1
+    assert all(len(quote_plus(query)) <= 500 for query in queries)
+    assert [id_ for query in queries for id_ in json.loads(f"[{query[12:-1]}]")] == ids
+
+
+def test_upload_format_converter_matches_to_upload_format(node_data):
+    for table in node_data.import_order:
+        schema = table.meta.schema
+        response = json.dumps({"items": _to_response(table)})
+
+        expected = utils.to_upload_format(json.loads(response)["items"])
+        converted = json.loads(
+            response, object_hook=utils.upload_format_converter(schema)
+        )["items"]
+
+        assert converted == expected
+
+
+def _to_response(table) -> list:
+    """Returns the rows of a table as the REST API returns them."""
+    schema = table.meta.schema
+    rows = []
+    for row in table.rows:
+        response = {"_href": f"/api/v2/{table.full_name}/{row['id']}", "_meta": {}}
+        for name, value in row.items():
+            if name in schema.single_references:
+                value = {"_href": f"/api/v2/ref/{value}", "id": value}
+            elif name in schema.ref_entity_types:
+                value = [{"_href": f"/api/v2/ref/{id_}", "id": id_} for id_ in value]
+            response[name] = value
+        rows.append(response)
+    return rows